@@ -0,0 +1,155 @@
+# API FORMATS
+# 17.10.2026
+#
+# Response encodings for han-api.py:
+# - columns: {"timestamp": [...], "total_energy": [...]}, column names once
+# - csv: header line + one line per row
+# - msgpack: the columns layout in MessagePack (https://msgpack.org)
+# In columns, csv and msgpack the sensor_data JSON text is expanded to one
+# column per OBIS code.
+# Compression: gzip, or brotli when the brotli module is installed.
+import csv
+import gzip
+import io
+import json
+import struct
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FORMATS = ("json", "columns", "csv", "msgpack")
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def expand_sensor_data(rows):
+    """Replaces the sensor_data JSON text of each row with OBIS code columns."""
+    if not rows or "sensor_data" not in rows[0]:
+        return rows
+    expanded = []
+    for row in rows:
+        row = dict(row)
+        for item in json.loads(row.pop("sensor_data")):
+            row[item["key"]] = item["value"]
+        expanded.append(row)
+    return expanded
+
+
+def to_columns(rows):
+    """List of row dicts to a dict of column lists, missing values as None."""
+    names = {}
+    for row in rows:
+        for name in row:
+            names.setdefault(name, None)
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def to_csv(columns):
+    """Column dict to CSV text."""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(columns.keys())
+    writer.writerows(zip(*columns.values()))
+    return output.getvalue()
+
+
+def _msgpack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True or obj is False:
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out += struct.pack(">b", obj)
+        elif 0 <= obj <= 0xffffffff:
+            out += struct.pack(">BI", 0xce, obj)
+        elif -0x80000000 <= obj < 0:
+            out += struct.pack(">Bi", 0xd2, obj)
+        else:
+            out += struct.pack(">Bq", 0xd3, obj)
+    elif isinstance(obj, float):
+        out += struct.pack(">Bd", 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        if len(data) < 32:
+            out.append(0xa0 | len(data))
+        else:
+            out += struct.pack(">BI", 0xdb, len(data))
+        out += data
+    elif isinstance(obj, (list, tuple)):
+        if len(obj) < 16:
+            out.append(0x90 | len(obj))
+        else:
+            out += struct.pack(">BI", 0xdd, len(obj))
+        for item in obj:
+            _msgpack(item, out)
+    elif isinstance(obj, dict):
+        if len(obj) < 16:
+            out.append(0x80 | len(obj))
+        else:
+            out += struct.pack(">BI", 0xdf, len(obj))
+        for key, value in obj.items():
+            _msgpack(key, out)
+            _msgpack(value, out)
+    else:
+        raise TypeError(f"Cannot encode {type(obj).__name__} as MessagePack")
+
+
+def to_msgpack(obj):
+    """MessagePack encoding of None, bool, int, float, str, list and dict values."""
+    out = bytearray()
+    _msgpack(obj, out)
+    return bytes(out)
+
+
+def encode_rows(rows, response_format):
+    """
+    Encodes query rows in one of FORMATS except json.
+
+    Returns:
+        tuple: (body, mimetype)
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if response_format not in FORMATS or response_format == "json":
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}.")
+    columns = to_columns(expand_sensor_data(rows))
+    if response_format == "columns":
+        return json.dumps(columns, separators=(",", ":")), "application/json"
+    if response_format == "csv":
+        return to_csv(columns), "text/csv"
+    return to_msgpack(columns), "application/msgpack"
+
+
+def accepted_encoding(accept_encoding):
+    """Picks br or gzip from an Accept-Encoding header value, None for identity."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    """Compresses body with 'br' or 'gzip'."""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,322 @@
+# ARCHIVE STORE
+# 17.10.2026
+#
+# Long-term archive of the 15-min data. The hot tables of sensor_data_15min.db
+# keep HISTORY_15MIN_KEEP (31 days) of rows, every closed local day is also
+# packed into one partition of sensor_data_archive.db before it expires:
+#
+#   partitions (series, start_ts, end_ts, rows, data)
+#
+# start_ts..end_ts is the day (end exclusive), the primary key (series,
+# start_ts) is the time index. A range read selects the partitions that
+# overlap the range and decodes only those. Days that get rows afterwards
+# (telegram-import.py) are packed again with archive_range().
+#
+# Partition format (zlib compressed): version, row count and the columns
+# one after another. Each column has its name and kind in the header, the
+# values are varints:
+#   numbers  fixed decimals scaled to integers and divided by their common
+#            step (e.g. 100 for 1 decimal values stored with 3 decimals),
+#            delta to the previous value, zigzag; token 0 is NULL,
+#            (zigzag(delta) << 1) | 1 a value
+#   text     dictionary of the distinct strings, index + 1 per row (0 NULL)
+# Rows are sorted by the series' order, e.g. phases by code and time, so
+# the deltas stay small. A day takes about 0.4 kB of 15-min rows and 3 kB
+# of phase statistics, a year about 1.3 MB.
+import math
+import zlib
+
+from rollup_store import day_start
+
+ARCHIVE_DB_FILE = "sensor_data_archive.db"
+FORMAT_VERSION = 1
+# Column kind of text columns, numbers have their number of decimals
+TEXT = 255
+SECONDS_PER_DAY = 24 * 3600
+
+# series: (hot table in sensor_data_15min.db, (column, kind) pairs, storage order)
+SERIES = {
+    "15min": ("data", (("timestamp", 0), ("total_energy", 3), ("consumed_energy", 3)),
+              "timestamp"),
+    "phases": ("phases", (("timestamp", 0), ("obis", TEXT), ("avg", 3), ("min", 3), ("max", 3),
+                          ("samples", 0)),
+               "obis, timestamp"),
+}
+
+
+def put_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def get_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def put_text(out, text):
+    encoded = text.encode()
+    put_varint(out, len(encoded))
+    out += encoded
+
+
+def get_text(data, pos):
+    length, pos = get_varint(data, pos)
+    return data[pos:pos + length].decode(), pos + length
+
+
+def encode_partition(columns, rows):
+    """
+    Packs rows into a partition blob.
+
+    Args:
+        columns (tuple): (name, kind) pairs, kind is the number of decimals or TEXT.
+        rows (list): Tuples in column order.
+    """
+    out = bytearray([FORMAT_VERSION])
+    put_varint(out, len(rows))
+    put_varint(out, len(columns))
+    for index, (name, kind) in enumerate(columns):
+        put_text(out, name)
+        out.append(kind)
+        values = [row[index] for row in rows]
+        if kind == TEXT:
+            dictionary = sorted({value for value in values if value is not None})
+            ids = {value: i + 1 for i, value in enumerate(dictionary)}
+            put_varint(out, len(dictionary))
+            for value in dictionary:
+                put_text(out, value)
+            for value in values:
+                put_varint(out, ids.get(value, 0))
+            continue
+        scale = 10 ** kind
+        scaled_values = [None if value is None else round(value * scale) for value in values]
+        step = math.gcd(*(value for value in scaled_values if value is not None)) or 1
+        put_varint(out, step)
+        previous = 0
+        for scaled in scaled_values:
+            if scaled is None:
+                out.append(0)
+                continue
+            scaled //= step
+            delta = scaled - previous
+            previous = scaled
+            put_varint(out, ((delta << 1 if delta >= 0 else (-delta << 1) - 1) << 1) | 1)
+    return zlib.compress(bytes(out), 9)
+
+
+def decode_partition(blob):
+    """
+    Unpacks a partition blob.
+
+    Returns:
+        tuple: (column names, list of row tuples)
+    """
+    data = zlib.decompress(blob)
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f"Unknown archive partition format {data[0]}")
+    count, pos = get_varint(data, 1)
+    column_count, pos = get_varint(data, pos)
+    names = []
+    columns = []
+    for _ in range(column_count):
+        name, pos = get_text(data, pos)
+        kind = data[pos]
+        pos += 1
+        names.append(name)
+        values = []
+        if kind == TEXT:
+            size, pos = get_varint(data, pos)
+            dictionary = [None]
+            for _ in range(size):
+                value, pos = get_text(data, pos)
+                dictionary.append(value)
+            for _ in range(count):
+                token, pos = get_varint(data, pos)
+                values.append(dictionary[token])
+        else:
+            scale = 10 ** kind
+            step, pos = get_varint(data, pos)
+            previous = 0
+            for _ in range(count):
+                token, pos = get_varint(data, pos)
+                if token == 0:
+                    values.append(None)
+                    continue
+                token >>= 1
+                previous += (token >> 1) if not token & 1 else -((token + 1) >> 1)
+                values.append(previous * step / scale if kind else previous * step)
+        columns.append(values)
+    return names, list(zip(*columns)) if columns else []
+
+
+def create_schema(execute, schema="main"):
+    """Creates the partitions table, execute is e.g. SensorWriter.execute."""
+    execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.partitions (
+            series TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (series, start_ts)
+        ) WITHOUT ROWID
+    """)
+
+
+def read_rows(conn, series, since=None, until=None, key=("timestamp",), reverse=False):
+    """
+    Archived rows of a series as dicts, since and until inclusive.
+    Only the partitions overlapping the range are read and decoded.
+
+    Args:
+        conn: Connection to the archive database.
+        key (tuple): Columns the rows are sorted by.
+        reverse (bool): Newest first.
+    """
+    order = "DESC" if reverse else "ASC"
+    cursor = conn.execute(f"""
+        SELECT data FROM partitions
+        WHERE series = ? AND start_ts <= ? AND end_ts > ?
+        ORDER BY start_ts {order}
+    """, (series, until if until is not None else 2 ** 62, since if since is not None else -2 ** 62))
+    for (blob,) in cursor:
+        names, rows = decode_partition(blob)
+        rows = [dict(zip(names, row)) for row in rows]
+        if since is not None or until is not None:
+            rows = [row for row in rows
+                    if (since is None or row["timestamp"] >= since)
+                    and (until is None or row["timestamp"] <= until)]
+        rows.sort(key=lambda row: tuple(row[column] for column in key), reverse=reverse)
+        yield from rows
+
+
+def next_day(timestamp):
+    """Start of the local day after the one of timestamp (DST safe)."""
+    return day_start(day_start(timestamp) + SECONDS_PER_DAY + 3 * 3600)
+
+
+class Archiver:
+    """
+    Packs closed days of the hot 15-min tables into archive partitions, in
+    the writer's transaction. Checking is one comparison until a day closes.
+    """
+
+    def __init__(self, writer, series=SERIES):
+        """
+        Args:
+            writer (SensorWriter): Writer with the 15-min database attached
+                as 'h15' and the archive as 'archive'.
+            series (dict): Series to archive, as SERIES.
+        """
+        self.writer = writer
+        self.series = series
+        # Start of the current local day, the next check is due when it changes
+        self.today = None
+        # Metrics
+        self.partitions = 0
+        self.bytes = 0
+        self.rows = 0
+
+    def initialize_schema(self):
+        create_schema(self.writer.execute, "archive")
+        self.writer.commit()
+
+    def archive_closed(self, now):
+        """
+        Archives the days before the day of now that are not in the archive yet.
+
+        Returns:
+            int: Number of partitions written.
+        """
+        today = day_start(now)
+        if today == self.today:
+            return 0
+        written = 0
+        for series, (table, columns, order) in self.series.items():
+            row = self.writer.query_one(
+                "SELECT MAX(end_ts) FROM archive.partitions WHERE series = ?", (series,))
+            start = row[0]
+            if start is None:
+                row = self.writer.query_one(f"SELECT MIN(timestamp) FROM h15.{table}")
+                if row[0] is None:
+                    continue
+                start = day_start(row[0])
+            names = ", ".join(name for name, _ in columns)
+            while start < today:
+                end = next_day(start)
+                rows = self.writer.conn.execute(f"""
+                    SELECT {names} FROM h15.{table}
+                    WHERE timestamp >= ? AND timestamp < ? ORDER BY {order}
+                """, (start, end)).fetchall()
+                if rows:
+                    blob = encode_partition(columns, rows)
+                    self.writer.execute("""
+                        INSERT OR REPLACE INTO archive.partitions (series, start_ts, end_ts, rows, data)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (series, start, end, len(rows), blob))
+                    self.partitions += 1
+                    self.bytes += len(blob)
+                    self.rows += len(rows)
+                    written += 1
+                start = end
+        self.today = today
+        return written
+
+    def archive_range(self, since, now):
+        """
+        Packs the closed days from the day of since to the day before now
+        again with their hot rows merged in, e.g. after telegram-import.py
+        has added rows to days that are already archived. Where both have
+        a row with the same key the archived one is kept.
+
+        Returns:
+            int: Number of partitions written.
+        """
+        today = day_start(now)
+        written = 0
+        for series, (table, columns, order) in self.series.items():
+            names = [name for name, _ in columns]
+            key = [names.index(column.strip()) for column in order.split(",")]
+            start = day_start(since)
+            while start < today:
+                end = next_day(start)
+                rows = self.writer.conn.execute(f"""
+                    SELECT {", ".join(names)} FROM h15.{table}
+                    WHERE timestamp >= ? AND timestamp < ?
+                """, (start, end)).fetchall()
+                if rows:
+                    merged = {tuple(row[i] for i in key): row for row in rows}
+                    archived = self.writer.query_one(
+                        "SELECT data FROM archive.partitions WHERE series = ? AND start_ts = ?",
+                        (series, start))
+                    if archived is not None:
+                        archived_names, archived_rows = decode_partition(archived[0])
+                        positions = [archived_names.index(name) for name in names]
+                        for row in archived_rows:
+                            row = tuple(row[i] for i in positions)
+                            merged[tuple(row[i] for i in key)] = row
+                    rows = [merged[row_key] for row_key in sorted(merged)]
+                    blob = encode_partition(columns, rows)
+                    self.writer.execute("""
+                        INSERT OR REPLACE INTO archive.partitions (series, start_ts, end_ts, rows, data)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (series, start, end, len(rows), blob))
+                    self.partitions += 1
+                    self.bytes += len(blob)
+                    self.rows += len(rows)
+                    written += 1
+                start = end
+        return written
+
+    def metrics(self):
+        return {"partitions": self.partitions, "bytes": self.bytes, "rows": self.rows}
@@ -0,0 +1,96 @@
+# FAKE GPIO
+# 17.10.2026
+#
+# Stand-in for ASUS.GPIO / RPi.GPIO for running gpio-switch-reader.py
+# without the board: set GPIO_MODULE = "fake_gpio" there.
+# Only the functions the reader uses are implemented. Pin levels are
+# changed with set_input(), which calls the event detection callbacks
+# like the real library does from its own thread.
+import threading
+import time
+
+BOARD = 10
+BCM = 11
+IN = 1
+OUT = 0
+LOW = 0
+HIGH = 1
+RISING = 31
+FALLING = 32
+BOTH = 33
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+
+_lock = threading.Lock()
+_mode = None
+# channel: level
+_levels = {}
+# channel: (edge, callback)
+_events = {}
+
+
+def setmode(mode):
+    global _mode
+    _mode = mode
+
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=None):
+    if _mode is None:
+        raise RuntimeError("Please set pin numbering mode using GPIO.setmode()")
+    with _lock:
+        if initial is not None:
+            _levels[channel] = initial
+        else:
+            _levels.setdefault(channel, LOW if pull_up_down == PUD_DOWN else HIGH)
+
+
+def input(channel):
+    with _lock:
+        if channel not in _levels:
+            raise RuntimeError("You must setup() the GPIO channel first")
+        return _levels[channel]
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    with _lock:
+        if channel in _events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        _events[channel] = (edge, callback)
+
+
+def remove_event_detect(channel):
+    with _lock:
+        _events.pop(channel, None)
+
+
+def cleanup(channel=None):
+    global _mode
+    with _lock:
+        if channel is None:
+            _levels.clear()
+            _events.clear()
+            _mode = None
+        else:
+            _levels.pop(channel, None)
+            _events.pop(channel, None)
+
+
+def set_input(channel, level):
+    """Sets the level of an input, a matching edge calls the callback."""
+    with _lock:
+        previous = _levels.get(channel)
+        _levels[channel] = level
+        edge, callback = _events.get(channel, (None, None))
+    if previous == level or callback is None:
+        return
+    if edge == BOTH or edge == (RISING if level == HIGH else FALLING):
+        callback(channel)
+
+
+def bounce(channel, level, edges=5, spacing=0.002):
+    """Contact bounce: toggles the input edges times before it settles to level."""
+    for i in range(edges):
+        set_input(channel, level if i % 2 == 0 else 1 - level)
+        time.sleep(spacing)
+    set_input(channel, level)
@@ -6,121 +6,318 @@
 # When pin state is HIGH, the value stored is 0, 1 otherwise.
 # Stored value means closed switch.
 # Record count of both databases is limited to MAX_RECORDS, Oldest
-# records are deleted when necessary.
+# records are overwritten (ring_store.py).
 # Interval between GPIO reads is defined as READ_INTERVAL
 # Program is ment to be tun as a service process
 # 0.8 26.4.2025 Changes in screen output to include database name for clarify
+# 0.9 17.10.2026 GPIO setup moved from import time to setup_gpio(), read_once()
+#                split out of the loop, run_async() for supervisor.py
+#                Heartbeat to the watchdog after each stored reading
+# 0.10 17.10.2026 GPIO read and store time histograms (metrics.py),
+#                 snapshot in metrics/gpio-switch-reader.json
+# 0.11 17.10.2026 READ_MODE = "edge": pin changes from the GPIO library's event
+#                 detection, debounced, stored with sub-second timestamps in
+#                 gpio_changes (timestamp REAL, migrated at start). gpio_data gets
+#                 a row only every HEARTBEAT_INTERVAL. The GPIO module is loaded by
+#                 name (GPIO_MODULE), fake_gpio.py works without the board.
+# 0.12 17.10.2026 Both databases are MAX_RECORDS slot ring buffers (ring_store.py),
+#                 one UPSERT per write on a kept-open connection, no COUNT(*)/DELETE
+# 0.13 17.10.2026 RECORD_MODE = "runs": gpio_data readings stored as change-only runs
+#                 (run_store.py), the open run is written every FLUSH_INTERVAL
 
-import ASUS.GPIO as GPIO
-import sqlite3
+import asyncio
+import heartbeat
+import importlib
+import queue
 import time
+from metrics import Registry, PROFILER
+from ring_store import RingTable
+from run_store import RunRecorder
 
 DB_MAIN = "gpio_data.db"
 DB_CHANGES = "gpio_changes.db"
 PIN_NUMBER = 33
+# Rows kept in each database
 MAX_RECORDS = 30
+# gpio_changes timestamps have the edge time with fractions of a second
+MAIN_COLUMNS = [("timestamp", "INTEGER"), ("Switch2", "TEXT")]
+CHANGES_COLUMNS = [("timestamp", "REAL"), ("Switch2", "TEXT")]
+MAIN_TABLE = None
+CHANGES_TABLE = None
 READ_INTERVAL = 10
+# "edge": event detection, "poll": read every READ_INTERVAL seconds
+READ_MODE = "edge"
+# GPIO library, "fake_gpio" for testing without the board
+GPIO_MODULE = "ASUS.GPIO"
+GPIO = None
+# Edge mode: the pin must stay unchanged this long (s) before a change is stored
+DEBOUNCE = 0.05
+# Edge mode: a bouncing pin is read anyway after this many seconds
+MAX_SETTLE = 1.0
+# Edge mode: seconds between gpio_data rows (and watchdog heartbeats)
+HEARTBEAT_INTERVAL = 300
+# Edge mode: longest blocking wait, bounds the shutdown time under supervisor.py
+EDGE_WAIT = 1.0
+# "rows": a gpio_data row per reading, "runs": (start_ts, end_ts, value) runs
+RECORD_MODE = "rows"
+# Runs mode: seconds between writes of the open run
+FLUSH_INTERVAL = 300
+RUNS = None
+METRICS = Registry("gpio-switch-reader")
+METRICS.describe("gpio_read_seconds", "GPIO pin read time")
+METRICS.describe("gpio_store_seconds", "Time to store one reading")
+METRICS.describe("gpio_changes_total", "Readings with a changed pin state")
+METRICS.describe("gpio_edges_total", "Edges reported by the GPIO event detection")
+METRICS.describe("gpio_bounces_total", "Edge bursts that did not change the debounced state")
+METRICS.describe("gpio_change_latency_seconds", "Time from the first edge to the stored change")
 
-# GPIO setup
-
-GPIO.setmode(GPIO.BOARD)  # Use physical pin numbering
-GPIO.setup(PIN_NUMBER, GPIO.IN)  # Set pin 33 as an input
-
-def create_connection(db_file):
-    conn = sqlite3.connect(db_file)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
-def initialize_database(db_file):
-    """Creates the 'data' table if it doesn't exist."""
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data (
-            timestamp INTEGER PRIMARY KEY,
-            Switch2 TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def store_data(db_file, timestamp, switch_state):
-    """Stores timestamp and GPIO state in the specified database."""
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO data (timestamp, Switch2) VALUES (?, ?)", (timestamp, switch_state))
-    conn.commit()
-    conn.close()
-
-def remove_old_records(db_file, max_records=None):
-    """
-    Removes records from the specified database.
-    - If max_records is specified, ensures the table contains at most max_records entries.
-    """
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-
-    if max_records:
-        cursor.execute("SELECT COUNT(*) FROM data")
-        record_count = cursor.fetchone()[0]
-        if record_count > max_records:
-            print(f"Max records reached, deleting old records in {db_file}, record count = {record_count}")
-            cursor.execute("""
-                DELETE FROM data WHERE timestamp = (
-                    SELECT MIN(timestamp) FROM data
-                )
-            """)
-            conn.commit()
-    conn.close()
+def setup_gpio(module=None):
+    global GPIO
+    GPIO = importlib.import_module(module or GPIO_MODULE)
+    GPIO.setmode(GPIO.BOARD)  # Use physical pin numbering
+    GPIO.setup(PIN_NUMBER, GPIO.IN)  # Set pin 33 as an input
 
-def read_and_store_gpio():
-    """Reads GPIO pin 33 and stores the state in the main database."""
-    previous_pin_state = None  # Tracks the last pin state
+def initialize_databases():
+    """Opens the ring buffers, creates or converts the tables if needed."""
+    global MAIN_TABLE, CHANGES_TABLE, RUNS
+    if MAIN_TABLE is None:
+        MAIN_TABLE = RingTable(DB_MAIN, MAIN_COLUMNS, MAX_RECORDS)
+        CHANGES_TABLE = RingTable(DB_CHANGES, CHANGES_COLUMNS, MAX_RECORDS)
+    if RECORD_MODE == "runs" and RUNS is None:
+        # A run continues over at most two missed readings
+        interval = HEARTBEAT_INTERVAL if READ_MODE == "edge" else READ_INTERVAL
+        RUNS = RunRecorder(DB_MAIN, 3 * interval, FLUSH_INTERVAL)
+        METRICS.set_collector("gpio_runs_", RUNS.metrics, "counter")
 
-    while True:
-        # Read pin state
+def flush_runs():
+    """Writes the open run, e.g. before exit."""
+    if RUNS is not None:
+        RUNS.flush()
+
+def store_reading(timestamp, switch_state):
+    """gpio_data: a row over the oldest one, or in runs mode the run is extended."""
+    if RUNS is not None:
+        if RUNS.record(timestamp, switch_state):
+            print(f"Run started in {DB_MAIN} - Timestamp: {timestamp}, Switch2: {switch_state}")
+        return
+    store_data(MAIN_TABLE, timestamp, switch_state)
+    print(f"Data Stored in {DB_MAIN} - Timestamp: {timestamp}, Switch2: {switch_state}")
+
+def last_stored_state(table):
+    """Switch2 of the newest row, None if there are no rows."""
+    row = table.latest()
+    return None if row is None else row[1]
+
+def store_data(table, timestamp, switch_state):
+    """Stores timestamp and GPIO state over the oldest row of the table."""
+    table.append(timestamp, switch_state)
+
+def read_state():
+    """Reads pin 33, returns the 'Switch2' value."""
+    # Read pin state
+    with METRICS.time("gpio_read_seconds"):
         pin_state = GPIO.input(PIN_NUMBER)
 
-        # Map pin state to 'Switch2' field
-        switch_state = "0" if pin_state == GPIO.HIGH else "1"
+    # Map pin state to 'Switch2' field
+    return "0" if pin_state == GPIO.HIGH else "1"
 
-        # Get current time as Unix epoch time
-        timestamp = int(time.time())
+def read_once(previous_pin_state):
+    """Reads pin 33 once, stores the state and the change. Returns the state."""
+    switch_state = read_state()
 
-        # Store data in the main database
-        store_data(DB_MAIN, timestamp, switch_state)
-        print(f"Data Stored in {DB_MAIN} - Timestamp: {timestamp}, Switch2: {switch_state}")
+    # Get current time as Unix epoch time
+    timestamp = int(time.time())
 
-        # Remove old records from the main database
-        remove_old_records(DB_MAIN, max_records=MAX_RECORDS)
+    with PROFILER.sample(), METRICS.time("gpio_store_seconds"):
+        # Store data in the main database
+        store_reading(timestamp, switch_state)
 
         # If the pin state has changed, store data in the changes database
         if switch_state != previous_pin_state:
-            store_data(DB_CHANGES, timestamp, switch_state)
+            store_data(CHANGES_TABLE, timestamp, switch_state)
             print(f"Data Stored in {DB_CHANGES} - Timestamp: {timestamp}, Switch2: {switch_state}")
 
-            # Ensure changes database does not exceed MAX_RECORDS records
-            remove_old_records(DB_CHANGES, max_records=MAX_RECORDS)
+    if switch_state != previous_pin_state:
+        METRICS.inc("gpio_changes_total")
+    heartbeat.send("gpio", timestamp)
+    METRICS.maybe_write()
+    return switch_state
+
+def read_and_store_gpio():
+    """Reads GPIO pin 33 and stores the state in the main database."""
+    previous_pin_state = None  # Tracks the last pin state
 
+    while True:
         # Update previous state
-        previous_pin_state = switch_state
+        previous_pin_state = read_once(previous_pin_state)
 
         # Wait for READ_INTERVAL seconds
         time.sleep(READ_INTERVAL)
 
+class EdgeDetector:
+    """
+    Pin 33 changes from the GPIO library's event detection. The callback
+    only queues the edge time. The pin is read when no edge has come for
+    DEBOUNCE seconds, so contact bounce and pulses shorter than DEBOUNCE
+    are not reported.
+    """
+
+    def __init__(self, debounce=DEBOUNCE):
+        self.debounce = debounce
+        self.edges = queue.SimpleQueue()
+        # Last reported 'Switch2' value
+        self.state = None
+
+    def start(self):
+        """Reads the current state and enables the event detection."""
+        self.state = read_state()
+        GPIO.add_event_detect(PIN_NUMBER, GPIO.BOTH, callback=self.on_edge)
+        return self.state
+
+    def stop(self):
+        GPIO.remove_event_detect(PIN_NUMBER)
+
+    def on_edge(self, channel):
+        # Runs in the GPIO library's thread
+        self.edges.put(time.time())
+
+    def next_change(self, timeout):
+        """
+        Waits up to timeout seconds for a debounced change.
+
+        Returns:
+            tuple: (time of the first edge, 'Switch2' value), or None if
+            the state did not change.
+        """
+        try:
+            first_edge = self.edges.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        METRICS.inc("gpio_edges_total")
+        settle_deadline = time.monotonic() + MAX_SETTLE
+        while time.monotonic() < settle_deadline:
+            try:
+                self.edges.get(timeout=self.debounce)
+            except queue.Empty:
+                break
+            METRICS.inc("gpio_edges_total")
+        state = read_state()
+        if state == self.state:
+            METRICS.inc("gpio_bounces_total")
+            return None
+        self.state = state
+        return first_edge, state
+
+    def check(self):
+        """Reads the pin, returns a change the event detection missed like next_change."""
+        state = read_state()
+        if state == self.state:
+            return None
+        self.state = state
+        return time.time(), state
+
+def store_change(timestamp, switch_state):
+    """Stores one change with its sub-second edge time."""
+    with PROFILER.sample(), METRICS.time("gpio_store_seconds"):
+        store_data(CHANGES_TABLE, timestamp, switch_state)
+    METRICS.inc("gpio_changes_total")
+    METRICS.observe("gpio_change_latency_seconds", time.time() - timestamp)
+    print(f"Data Stored in {DB_CHANGES} - Timestamp: {timestamp:.3f}, Switch2: {switch_state}")
+    heartbeat.send("gpio", timestamp)
+
+def store_heartbeat(switch_state):
+    """Edge mode: the low-rate gpio_data row."""
+    timestamp = int(time.time())
+    with PROFILER.sample(), METRICS.time("gpio_store_seconds"):
+        store_reading(timestamp, switch_state)
+    heartbeat.send("gpio", timestamp)
+    METRICS.maybe_write()
+
+def start_edges():
+    """
+    Starts the edge mode. The current state is stored as a change if it
+    differs from the newest stored change, as the poll mode does at start.
+
+    Returns:
+        tuple: (EdgeDetector, monotonic time of the next heartbeat)
+    """
+    detector = EdgeDetector()
+    state = detector.start()
+    if state != last_stored_state(CHANGES_TABLE):
+        store_change(time.time(), state)
+    store_heartbeat(state)
+    return detector, time.monotonic() + HEARTBEAT_INTERVAL
+
+def edge_step(detector, next_heartbeat):
+    """
+    One wait of the edge mode loop, at most EDGE_WAIT seconds.
+
+    Returns:
+        float: Monotonic time of the next heartbeat.
+    """
+    change = detector.next_change(min(EDGE_WAIT, max(0.0, next_heartbeat - time.monotonic())))
+    if change is not None:
+        store_change(*change)
+    if time.monotonic() >= next_heartbeat:
+        # Also catches a change the event detection missed
+        change = detector.check()
+        if change is not None:
+            store_change(*change)
+        store_heartbeat(detector.state)
+        next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+    return next_heartbeat
+
+def read_edges():
+    """Edge mode loop."""
+    detector, next_heartbeat = start_edges()
+    try:
+        while True:
+            next_heartbeat = edge_step(detector, next_heartbeat)
+    finally:
+        detector.stop()
+
+async def run_async():
+    """GPIO reader task for supervisor.py."""
+    setup_gpio()
+    initialize_databases()
+    previous_pin_state = None
+    loop = asyncio.get_running_loop()
+    try:
+        if READ_MODE == "edge":
+            detector, next_heartbeat = start_edges()
+            try:
+                while True:
+                    # Waiting and storing in a worker thread
+                    next_heartbeat = await loop.run_in_executor(None, edge_step, detector, next_heartbeat)
+            finally:
+                detector.stop()
+        else:
+            while True:
+                previous_pin_state = read_once(previous_pin_state)
+                await asyncio.sleep(READ_INTERVAL)
+    finally:
+        flush_runs()
+        GPIO.cleanup()
+
 if __name__ == "__main__":
     # Display database name and GPIO port number at startup
     print(f"Main Database Name: {DB_MAIN}")
     print(f"Changes Database Name: {DB_CHANGES}")
-    print(f"GPIO Port Number: {PIN_NUMBER}")
+    print(f"GPIO Port Number: {PIN_NUMBER}, mode: {READ_MODE}")
+    PROFILER.install("gpio-switch-reader")
+
+    setup_gpio()
 
     # Initialize the databases
-    initialize_database(DB_MAIN)
-    initialize_database(DB_CHANGES)
+    initialize_databases()
 
     try:
-        read_and_store_gpio()
+        if READ_MODE == "edge":
+            read_edges()
+        else:
+            read_and_store_gpio()
     except KeyboardInterrupt:
         print("Program interrupted.")
     finally:
+        flush_runs()
         GPIO.cleanup()  # Clean up GPIO settings
@@ -0,0 +1,194 @@
+# GRAPH TILES
+# 17.10.2026
+#
+# PNG graphs from sensor_data_15min.db:
+#   24h    consumed energy per 15 min for the last 24 hours (bars)
+#   daily  consumed energy per day for the last DAILY_DAYS days (bars)
+#          read from the daily rollup table when sensor-reader has written it
+# A tile is rendered again only when a new 15-min row has been written,
+# until then it is served from memory or from GRAPH_DIR on disk.
+# matplotlib is imported on the first render, not when this module is
+# imported, and only the object API is used (no pyplot state).
+#
+# han-api.py serves the tiles at /api/graph/<name>.png. Run this file as
+# a service to render the tiles in advance:
+#   python3 graph_tiles.py
+import io
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+GRAPH_DB = "sensor_data_15min.db"
+GRAPH_DIR = "graphs"
+DAILY_DAYS = 31
+TILE_WIDTH = 800
+TILE_HEIGHT = 400
+TILE_DPI = 100
+BAR_COLOR = "#1f77b4"
+# Service mode: seconds between checks for a new 15-min row
+POLL_INTERVAL = 60
+
+
+def fetch_24h(conn, latest):
+    return conn.execute("""
+        SELECT timestamp, consumed_energy FROM data
+        WHERE timestamp > ? ORDER BY timestamp
+    """, (latest - 24 * 3600,)).fetchall()
+
+
+def fetch_daily(conn, latest):
+    # Daily rollup rows written by sensor-reader (rollup_store.py), one row per day
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'daily'").fetchone() is not None:
+        return conn.execute("""
+            SELECT date(timestamp, 'unixepoch', 'localtime') AS day, consumed_energy
+            FROM daily WHERE timestamp > ? ORDER BY timestamp
+        """, (latest - DAILY_DAYS * 24 * 3600,)).fetchall()
+    return conn.execute("""
+        SELECT date(timestamp, 'unixepoch', 'localtime') AS day, SUM(consumed_energy)
+        FROM data WHERE timestamp > ?
+        GROUP BY day ORDER BY day
+    """, (latest - DAILY_DAYS * 24 * 3600,)).fetchall()
+
+
+def new_figure():
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(TILE_WIDTH / TILE_DPI, TILE_HEIGHT / TILE_DPI), dpi=TILE_DPI)
+    return figure, figure.add_subplot()
+
+
+def to_png(figure):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    FigureCanvasAgg(figure)
+    figure.tight_layout()
+    output = io.BytesIO()
+    figure.savefig(output, format="png")
+    return output.getvalue()
+
+
+def render_24h(rows, latest):
+    import matplotlib.dates as mdates
+    figure, axes = new_figure()
+    # A row holds the consumption of the quarter ending at its timestamp
+    times = [datetime.fromtimestamp(timestamp - 900) for timestamp, _ in rows]
+    values = [value or 0.0 for _, value in rows]
+    axes.bar(times, values, width=timedelta(minutes=14), align="edge", color=BAR_COLOR)
+    axes.set_xlim(datetime.fromtimestamp(latest - 24 * 3600), datetime.fromtimestamp(latest))
+    axes.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    axes.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
+    axes.set_ylabel("kWh / 15 min")
+    axes.set_title("Kulutus 24 h")
+    axes.grid(axis="y", alpha=0.3)
+    return to_png(figure)
+
+
+def render_daily(rows, latest):
+    figure, axes = new_figure()
+    days = [day[5:] for day, _ in rows]
+    values = [value or 0.0 for _, value in rows]
+    axes.bar(days, values, color=BAR_COLOR)
+    axes.tick_params(axis="x", labelrotation=90, labelsize=7)
+    axes.set_ylabel("kWh / vrk")
+    axes.set_title(f"Kulutus {DAILY_DAYS} vrk")
+    axes.grid(axis="y", alpha=0.3)
+    return to_png(figure)
+
+
+# name: (query, render)
+TILES = {
+    "24h": (fetch_24h, render_24h),
+    "daily": (fetch_daily, render_daily),
+}
+
+
+class TileCache:
+    """
+    Rendered tiles by name. A tile is valid while the latest 15-min
+    timestamp is unchanged. Thread safe, one render at a time.
+    """
+
+    def __init__(self, db_file=GRAPH_DB, directory=GRAPH_DIR):
+        self.db_file = db_file
+        self.directory = directory
+        self.tiles = {}
+        self.lock = threading.Lock()
+        self.conn = None
+        # Metrics
+        self.renders = 0
+        self.render_time = 0.0
+
+    def connection(self):
+        if self.conn is None:
+            uri = f"file:{quote(os.path.abspath(self.db_file))}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self.conn
+
+    def latest(self):
+        """Timestamp of the newest 15-min row, None if there are no rows."""
+        return self.connection().execute("SELECT MAX(timestamp) FROM data").fetchone()[0]
+
+    def path(self, name, version):
+        return os.path.join(self.directory, f"{name}_{version}.png")
+
+    def get(self, name):
+        """
+        Returns (png, version) of a tile, rendering it only if a new row
+        has been written since the cached one.
+
+        Raises:
+            KeyError: Unknown tile name.
+            LookupError: No data to draw.
+        """
+        fetch, render = TILES[name]
+        with self.lock:
+            version = self.latest()
+            if version is None:
+                raise LookupError(f"No data in {self.db_file}")
+            cached = self.tiles.get(name)
+            if cached is not None and cached[1] == version:
+                return cached
+            path = self.path(name, version)
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    png = file.read()
+            else:
+                started = time.perf_counter()
+                png = render(fetch(self.connection(), version), version)
+                self.render_time += time.perf_counter() - started
+                self.renders += 1
+                self.store(name, version, png)
+            self.tiles[name] = (png, version)
+            return png, version
+
+    def store(self, name, version, png):
+        """Writes the tile atomically and removes the older versions."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name, version)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(png)
+        os.replace(temp_path, path)
+        for filename in os.listdir(self.directory):
+            if filename.startswith(f"{name}_") and filename.endswith(".png") \
+                    and filename != os.path.basename(path):
+                os.remove(os.path.join(self.directory, filename))
+
+
+if __name__ == "__main__":
+    cache = TileCache()
+    print(f"Rendering {', '.join(TILES)} from {GRAPH_DB} to {GRAPH_DIR}/")
+    try:
+        while True:
+            for name in TILES:
+                try:
+                    renders = cache.renders
+                    _, version = cache.get(name)
+                    if cache.renders != renders:
+                        print(f"Rendered {name} for {datetime.fromtimestamp(version)}")
+                except (LookupError, sqlite3.Error) as e:
+                    print(f"{name}: {e}")
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("Program interrupted.")
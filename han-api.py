@@ -3,11 +3,17 @@
 #
 # Publishes http apis:
 # sensor_data
+# sensor_values
 # mgmt_data
 # gpio_data
 # mgmt_changes
 # gpio_changes
+# mgmt_runs
+# gpio_runs
+# consumption
+# phase_stats
 # monitor
+# metrics
 #
 # 0.7 25.4.2025  sensor_data: Order by timestamp desc
 # 0.7 3.5.2025 changed MONITOR_FILE = "watchdog.txt"
@@ -15,11 +21,61 @@
 #                If parameter exists, return count number of records, otherwise return all
 # 0.9 15.1.2026  Changed fetch_all_data function name to fetch_db_data
 #                Added api functions get_sensor_15min_data(), get_sensor_hourly_data()
+# 1.0 17.10.2026 Added sensor_values: per-OBIS values from the normalized obis_value table
+# 1.1 17.10.2026 fetch_db_data uses pooled read-only connections (mode=ro, query_only),
+#                rows are converted from tuples instead of sqlite3.Row
+# 1.2 17.10.2026 Response cache invalidated by PRAGMA data_version, ETag/Last-Modified
+#                headers and 304 responses to If-None-Match/If-Modified-Since
+# 1.3 17.10.2026 since/until and cursor (keyset) pagination on all data endpoints.
+#                Every response is limited to count or MAX_RECORDS rows, the cursor of
+#                the next page is returned in the X-Next-Cursor and Link headers
+# 1.4 17.10.2026 Added aggregate: 15min/hour/day/month buckets of the history data
+#                or OBIS values, computed in SQL
+#                History rows are bucketed by the start of the interval they end.
+#                source=15min includes the archived rows older than the hot table
+# 1.5 17.10.2026 stream=ndjson|json on the data endpoints: all matching rows are
+#                streamed from the cursor in chunks, no MAX_RECORDS limit
+# 1.6 17.10.2026 Added events: Server-Sent Events for new telegrams and mgmt/gpio changes.
+#                One watcher thread checks PRAGMA data_version and fans out to all clients
+# 1.7 17.10.2026 format=columns|csv|msgpack on the data and aggregate endpoints (api_formats.py),
+#                gzip/br compression of cached responses by Accept-Encoding
+# 1.8 17.10.2026 Added graph/<name>.png: cached PNG tiles from the 15-min data (graph_tiles.py)
+# 1.9 17.10.2026 monitor: per-source health from the watchdog's HEALTH_FILE as JSON
+# 1.10 17.10.2026 Added metrics: Prometheus text of the readers' metrics snapshots and
+#                 this process' request, query and serialization time per endpoint
+# 1.11 17.10.2026 mgmt_data/gpio_data: readings recorded as runs (run_store.py) are
+#                 expanded back to rows. Added mgmt_runs/gpio_runs, at=t gives the run
+#                 (state) at time t
+#                 stream=ndjson|json works on expanded runs too
+# 1.12 17.10.2026 sensor_data.db is read from tmpfs while sensor-reader keeps it in RAM
+#                 (sensor_store.live_path). Pooled connections of a replaced database
+#                 file (e.g. a snapshot) are reopened
+# 1.13 17.10.2026 Added consumption: hourly/daily/monthly consumed energy from the rollup
+#                 tables of sensor_data_15min.db (rollup_store.py), one row per bucket
+# 1.14 17.10.2026 sensor_15min_data and the new phase_stats read rows older than the
+#                 31-day hot tables from the archive partitions (archive_store.py)
 #
-from flask import Flask, jsonify, request
+from flask import Flask, g, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
 # CORS was needed for security compatibility when nginx is not in use
+from api_formats import COMPRESS_MIN_SIZE, accepted_encoding, compress, encode_rows
+from graph_tiles import TILES, TileCache
+from metrics import PROFILER, Registry, read_snapshots, render_prometheus
+from sensor_store import live_path
+from rollup_store import day_start, month_start
+import archive_store
+from contextlib import contextmanager
+from collections import OrderedDict
+from urllib.parse import quote, urlencode
+import base64
+import functools
+import hashlib
+import itertools
+import json
+import queue
 import sqlite3
+import time
+import threading
 import os
 
 app = Flask(__name__)
@@ -30,17 +86,94 @@ CORS(app)  # Allow all origins for simplicity
 SENSOR_DB = "sensor_data.db"
 HISTORY_HOURLY_DB = "sensor_data_history.db"
 HISTORY_15MIN_DB = "sensor_data_15min.db"
+ARCHIVE_DB = archive_store.ARCHIVE_DB_FILE
 MGMT_DB = "mgmt_data.db"
 GPIO_DB = "gpio_data.db"
 MGMT_CHANGES_DB = "mgmt_changes.db"
 GPIO_CHANGES_DB = "gpio_changes.db"
 
 MONITOR_FILE = "watchdog.txt"
+# Per-source health written by watchdog.py
+HEALTH_FILE = "watchdog.json"
 
 # Define a maximum cap for records returned
 MAX_RECORDS = 1000
 
-def fetch_db_data(db_file, base_query, count=None):
+METRICS = Registry("han-api")
+METRICS.describe("api_requests_total", "Requests by endpoint and status")
+METRICS.describe("api_request_seconds", "Time to build a response, streamed bodies excluded")
+METRICS.describe("api_query_seconds", "SQL query and fetch time")
+METRICS.describe("api_serialize_seconds", "Rows to response body time")
+METRICS.describe("api_cache_total", "Response cache lookups by result")
+
+def current_endpoint():
+    """Endpoint label for the metrics, the thread name outside requests."""
+    if has_request_context():
+        return request.endpoint or "none"
+    return threading.current_thread().name
+
+# Read-only connection pool. The development server runs every request in a
+# new thread, so idle connections are shared and checked out per request.
+POOL_SIZE = 4
+CACHED_STATEMENTS = 64
+_pool = {}
+_pool_lock = threading.Lock()
+
+def sensor_db():
+    """sensor_data.db, its tmpfs copy while sensor-reader keeps it in RAM."""
+    return live_path(SENSOR_DB)
+
+def file_id(db_file):
+    """(device, inode) of a database file, changes when the file is replaced."""
+    try:
+        stat = os.stat(db_file)
+    except OSError:
+        # Opening reports the missing file
+        return None
+    return stat.st_dev, stat.st_ino
+
+def open_read_connection(db_file):
+    """Opens a read-only connection, the database file is never created."""
+    uri = f"file:{quote(os.path.abspath(db_file))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+@contextmanager
+def read_connection(db_file):
+    """
+    Borrows a pooled read-only connection for db_file.
+    A connection that raised an error is closed instead of reused.
+    """
+    current_id = file_id(db_file)
+    with _pool_lock:
+        idle = _pool.setdefault(db_file, [])
+        conn, conn_id = idle.pop() if idle else (None, None)
+    if conn is not None and conn_id != current_id:
+        # The file was replaced, the connection still reads the old one
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = open_read_connection(db_file)
+        conn_id = current_id
+    try:
+        yield conn
+    except BaseException:
+        conn.close()
+        raise
+    # End the read transaction so the next request sees new commits
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        idle = _pool[db_file]
+        if len(idle) < POOL_SIZE:
+            idle.append((conn, conn_id))
+            conn = None
+    if conn is not None:
+        conn.close()
+
+def fetch_db_data(db_file, base_query, count=None, params=()):
     """
     Fetch rows from the specified database using the provided query.
     Optionally limit the number of rows returned.
@@ -49,23 +182,152 @@ def fetch_db_data(db_file, base_query, count=None):
         db_file (str): Path to the SQLite database file.
         base_query (str): SQL query to execute (without LIMIT).
         count (int or None): Number of records to return, or None for all.
+        params (tuple): Parameters for the placeholders in base_query.
 
     Returns:
         list: List of rows fetched from the database.
     """
-    conn = sqlite3.connect(db_file)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    with read_connection(db_file) as conn, METRICS.time("api_query_seconds", endpoint=current_endpoint()):
+        if count is not None and isinstance(count, int) and 1 <= count <= MAX_RECORDS:
+            query = f"{base_query} LIMIT ?"
+            cursor = conn.execute(query, (*params, count))
+        else:
+            cursor = conn.execute(base_query, params)
 
-    if count is not None and isinstance(count, int) and 1 <= count <= MAX_RECORDS:
-        query = f"{base_query} LIMIT ?"
-        cursor.execute(query, (count,))
-    else:
-        cursor.execute(base_query)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+# Change detection: one connection per database file only for PRAGMA data_version.
+# data_version changes when another connection commits, values of different
+# connections can't be compared, so the connection is kept for the process lifetime.
+_versions = {}
+_versions_lock = threading.Lock()
+
+def db_generation(db_file):
+    """
+    Returns (generation, last_modified) of a database file. generation is
+    increased each time a commit by another process is noticed.
+    """
+    with _versions_lock:
+        state = _versions.get(db_file)
+        current_id = file_id(db_file)
+        if state is not None and state["file_id"] != current_id:
+            # Replaced file: new connection, and a new generation for the cached responses
+            state["conn"].close()
+            conn = open_read_connection(db_file)
+            state.update(conn=conn, file_id=current_id, modified=file_modified(db_file),
+                         data_version=conn.execute("PRAGMA data_version").fetchone()[0])
+            state["generation"] += 1
+        elif state is None:
+            conn = open_read_connection(db_file)
+            state = _versions[db_file] = {
+                "conn": conn,
+                "file_id": current_id,
+                "data_version": conn.execute("PRAGMA data_version").fetchone()[0],
+                "generation": 0,
+                "modified": file_modified(db_file),
+            }
+        else:
+            data_version = state["conn"].execute("PRAGMA data_version").fetchone()[0]
+            if data_version != state["data_version"]:
+                state["data_version"] = data_version
+                state["generation"] += 1
+                state["modified"] = time.time()
+        return state["generation"], state["modified"]
+
+def file_modified(path):
+    """Latest modification time of a file and its WAL file."""
+    times = [os.path.getmtime(p) for p in (path, path + "-wal") if os.path.exists(p)]
+    return max(times) if times else time.time()
+
+def file_generation(path):
+    """(generation, last_modified) of a plain file, from its modification time."""
+    modified = file_modified(path)
+    return modified, modified
 
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+# Cached responses by path and query string, least recently used dropped first
+RESPONSE_CACHE_SIZE = 128
+# Response headers stored with the cached body
+CACHED_HEADERS = ("X-Next-Cursor", "Link")
+_response_cache = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def cached_response(source, generation=db_generation):
+    """
+    Decorator for GET endpoints. The response body is reused until the
+    generation of source changes. Responses carry ETag and Last-Modified,
+    matching If-None-Match/If-Modified-Since requests get 304.
+    Bodies are compressed by Accept-Encoding, the compressed variants are
+    cached too and have their own ETag.
+
+    Args:
+        source (str or function): Database (or file) the endpoint reads, or a
+            function returning it for the current request.
+        generation (function): Returns (generation, last_modified) of source.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.args.get("stream"):
+                # Streamed responses are not buffered
+                return view(*args, **kwargs)
+            db_file = source() if callable(source) else source
+            try:
+                # The source file is part of the generation, it can change per request
+                current, modified = generation(db_file)
+                current = (db_file, current)
+            except (sqlite3.Error, OSError):
+                # Database missing, let the endpoint report the error
+                return view(*args, **kwargs)
+            key = (request.path, request.query_string)
+            with _response_cache_lock:
+                entry = _response_cache.get(key)
+                if entry is not None:
+                    _response_cache.move_to_end(key)
+            hit = entry is not None and entry["generation"] == current
+            METRICS.inc("api_cache_total", result="hit" if hit else "miss")
+            if not hit:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                entry = {
+                    "generation": current,
+                    "body": body,
+                    "mimetype": response.mimetype,
+                    "etag": hashlib.blake2b(body, digest_size=12).hexdigest(),
+                    "modified": modified,
+                    "headers": [(name, response.headers[name])
+                                for name in CACHED_HEADERS if name in response.headers],
+                    "encoded": {},
+                }
+                with _response_cache_lock:
+                    _response_cache[key] = entry
+                    while len(_response_cache) > RESPONSE_CACHE_SIZE:
+                        _response_cache.popitem(last=False)
+            body, etag = entry["body"], entry["etag"]
+            encoding = None
+            # Images are compressed already
+            if len(body) >= COMPRESS_MIN_SIZE and not entry["mimetype"].startswith("image/"):
+                encoding = accepted_encoding(request.headers.get("Accept-Encoding", ""))
+            if encoding is not None:
+                if encoding not in entry["encoded"]:
+                    entry["encoded"][encoding] = compress(body, encoding)
+                body = entry["encoded"][encoding]
+                etag = f"{etag}-{encoding}"
+            response = app.response_class(body, mimetype=entry["mimetype"],
+                                          headers=entry["headers"])
+            if encoding is not None:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            response.set_etag(etag)
+            response.last_modified = entry["modified"]
+            # Browsers and nginx must revalidate, they get 304 while nothing changed
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
 
 def get_count_param():
     """Helper to parse ?count= from query string."""
@@ -75,59 +337,808 @@ def get_count_param():
     except ValueError:
         return None
 
+def get_time_param(name):
+    """Helper to parse unix timestamp parameters like ?since= and ?until=."""
+    value = request.args.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def encode_cursor(values):
+    """Opaque cursor from the sort key values of the last returned row."""
+    text = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, length):
+    """
+    Sort key values from a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError("Invalid cursor.")
+    return values
+
+def keyset_condition(expressions):
+    """
+    WHERE condition selecting the rows after a cursor in descending order,
+    e.g. "(a < ? OR (a = ? AND b < ?))". Returns the condition and the
+    cursor value index of each placeholder.
+    """
+    alternatives = []
+    indexes = []
+    for i, expression in enumerate(expressions):
+        terms = [f"{e} = ?" for e in expressions[:i]] + [f"{expression} < ?"]
+        alternatives.append(" AND ".join(terms))
+        indexes.extend(range(i + 1))
+    condition = " OR ".join(f"({a})" for a in alternatives)
+    return f"({condition})", indexes
+
+def page_query(select, conditions=(), params=(), keys=(("timestamp", "timestamp"),)):
+    """
+    Adds the request's since, until and cursor parameters to select.
+
+    Args:
+        select (str): Query without WHERE, ORDER BY and LIMIT.
+        conditions (list): Extra WHERE conditions.
+        params (tuple): Parameters of the extra conditions.
+        keys (tuple): (SQL expression, result column) pairs of the unique
+            sort key, timestamp first.
+
+    Returns:
+        tuple: (query, params), query ordered newest first, without LIMIT.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    conditions = list(conditions)
+    params = list(params)
+    expressions = [expression for expression, _ in keys]
+    since = get_time_param("since")
+    until = get_time_param("until")
+    if since is not None:
+        conditions.append(f"{expressions[0]} >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append(f"{expressions[0]} <= ?")
+        params.append(until)
+    cursor = request.args.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, len(keys))
+        condition, indexes = keyset_condition(expressions)
+        conditions.append(condition)
+        params.extend(values[i] for i in indexes)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = ", ".join(f"{expression} DESC" for expression in expressions)
+    return f"{select}{where} ORDER BY {order}", params
+
+def fetch_page(db_file, select, conditions=(), params=(), keys=(("timestamp", "timestamp"),)):
+    """
+    Runs select with the request's since, until, count and cursor parameters.
+    Rows are returned newest first, at most count (or MAX_RECORDS) rows.
+    Arguments as in page_query().
+
+    Returns:
+        tuple: (rows, next_cursor), next_cursor is None on the last page.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    query, params = page_query(select, conditions, params, keys)
+    count = get_count_param()
+    limit = count if count is not None and 1 <= count <= MAX_RECORDS else MAX_RECORDS
+    # One extra row tells if there is a next page
+    rows = fetch_db_data(db_file, f"{query} LIMIT ?", params=(*params, limit + 1))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][column] for _, column in keys])
+    return rows, next_cursor
+
+# Rows fetched from the cursor per streamed chunk
+STREAM_CHUNK = 500
+STREAM_FORMATS = {
+    # format: (mimetype, start, row separator, end)
+    "ndjson": ("application/x-ndjson", "", "\n", "\n"),
+    "json": ("application/json", "[", ",", "]\n"),
+}
+
+def stream_rows(db_file, query, params, stream_format, tail=None, count=None):
+    """
+    Streams the query result as NDJSON lines or as one JSON array.
+    The cursor is read STREAM_CHUNK rows at a time, memory use does not
+    depend on the result size. tail (iterable of row dicts) is streamed
+    after the query rows, count limits the rows of both together.
+    With query None only the tail is streamed.
+    """
+    mimetype, start, separator, end = STREAM_FORMATS[stream_format]
+    encode = json.JSONEncoder(separators=(",", ":"), sort_keys=True).encode
+
+    def generate():
+        first = True
+        sent = 0
+        if query is None:
+            yield start
+        else:
+            with read_connection(db_file) as conn:
+                cursor = conn.execute(query, params)
+                columns = [column[0] for column in cursor.description]
+                yield start
+                while True:
+                    rows = cursor.fetchmany(STREAM_CHUNK)
+                    if not rows:
+                        break
+                    chunk = separator.join(encode(dict(zip(columns, row))) for row in rows)
+                    yield chunk if first else separator + chunk
+                    first = False
+                    sent += len(rows)
+        if tail is not None:
+            rows = iter(tail) if count is None else itertools.islice(tail, max(0, count - sent))
+            while True:
+                chunk = list(itertools.islice(rows, STREAM_CHUNK))
+                if not chunk:
+                    break
+                chunk = separator.join(encode(row) for row in chunk)
+                yield chunk if first else separator + chunk
+                first = False
+        yield end
+
+    chunks = generate()
+    # Runs the query now, so SQL errors are still reported with an error status
+    head = next(chunks)
+    return app.response_class(itertools.chain([head], chunks), mimetype=mimetype)
+
+def render_rows(rows):
+    """
+    Rows as a response in the requested ?format=, default a JSON list.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    response_format = request.args.get("format", "json")
+    with METRICS.time("api_serialize_seconds", endpoint=request.endpoint):
+        if response_format == "json":
+            return jsonify(rows)
+        body, mimetype = encode_rows(rows, response_format)
+        return app.response_class(body, mimetype=mimetype)
+
+def page_response(db_file, select, conditions=(), params=(), keys=(("timestamp", "timestamp"),)):
+    """
+    fetch_page() as a response in the requested format with the next page
+    headers, or with ?stream=ndjson|json all matching rows streamed (count
+    still applies).
+    """
+    stream_format = request.args.get("stream")
+    try:
+        if stream_format:
+            if stream_format not in STREAM_FORMATS:
+                raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}.")
+            query, query_params = page_query(select, conditions, params, keys)
+            count = get_count_param()
+            if count is not None and count >= 1:
+                query = f"{query} LIMIT ?"
+                query_params.append(count)
+            return stream_rows(db_file, query, query_params, stream_format)
+        rows, next_cursor = fetch_page(db_file, select, conditions, params, keys)
+        response = render_rows(rows)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except sqlite3.OperationalError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return add_next_page(response, next_cursor)
+
+def archived_rows(series, hot_start, keys=(("timestamp", "timestamp"),), match=None):
+    """
+    Archive rows (archive_store.py) older than hot_start, the oldest row of
+    the hot table, that match the request's since, until and cursor. Newest
+    first, only the partitions in the range are decoded.
+
+    Args:
+        match (dict): column: allowed values, e.g. {"obis": codes}.
+
+    Raises:
+        ValueError: If the cursor is not valid.
+    """
+    since = get_time_param("since")
+    until = get_time_param("until")
+    if hot_start is not None:
+        until = hot_start - 1 if until is None else min(until, hot_start - 1)
+    cursor = request.args.get("cursor")
+    after = decode_cursor(cursor, len(keys)) if cursor else None
+    columns = [column for _, column in keys]
+
+    def generate():
+        if not os.path.exists(ARCHIVE_DB):
+            return
+        with read_connection(ARCHIVE_DB) as conn:
+            for row in archive_store.read_rows(conn, series, since, until, columns, reverse=True):
+                if match and any(row[column] not in values for column, values in match.items()):
+                    continue
+                # Keyset: rows sorted before the cursor row in descending order
+                if after is not None and [row[column] for column in columns] >= after:
+                    continue
+                yield row
+    return generate()
+
+def tiered_response(db_file, table, series, keys=(("timestamp", "timestamp"),), match=None):
+    """
+    page_response() over a hot table of db_file and its archive series:
+    the pages continue from the oldest hot row to the archived rows, the
+    next page cursor works across both.
+    """
+    conditions = []
+    params = []
+    for column, values in (match or {}).items():
+        conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+        params.extend(values)
+    select = f"SELECT * FROM {table}"
+    stream_format = request.args.get("stream")
+    try:
+        hot_start = fetch_db_data(db_file, f"SELECT MIN(timestamp) AS timestamp FROM {table}")[0]["timestamp"]
+        older = archived_rows(series, hot_start, keys, match)
+        if stream_format:
+            if stream_format not in STREAM_FORMATS:
+                raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}.")
+            query, query_params = page_query(select, conditions, params, keys)
+            count = get_count_param()
+            if count is not None and count >= 1:
+                query = f"{query} LIMIT ?"
+                query_params.append(count)
+            else:
+                count = None
+            return stream_rows(db_file, query, query_params, stream_format, older, count)
+        rows, next_cursor = fetch_page(db_file, select, conditions, params, keys)
+        if next_cursor is None:
+            count = get_count_param()
+            limit = count if count is not None and 1 <= count <= MAX_RECORDS else MAX_RECORDS
+            # One extra row tells if there is a next page
+            rows.extend(itertools.islice(older, limit - len(rows) + 1))
+            older.close()
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor([rows[-1][column] for _, column in keys])
+        response = render_rows(rows)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except sqlite3.OperationalError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return add_next_page(response, next_cursor)
+
+def add_next_page(response, next_cursor):
+    """Sets the X-Next-Cursor and Link headers, unless this is the last page."""
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args["cursor"] = next_cursor
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+def runs_recorded(conn):
+    """True if the readings are recorded as runs, i.e. the runs are newer than the rows."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'runs'").fetchone() is None:
+        return False
+    runs_end, rows_end = conn.execute(
+        "SELECT (SELECT MAX(end_ts) FROM runs), (SELECT MAX(timestamp) FROM data)").fetchone()
+    return runs_end is not None and (rows_end is None or runs_end > rows_end)
+
+def expand_runs(conn, column, since=None, until=None, before=None):
+    """
+    Rows {"timestamp", column} of the runs newest first. A run stores only
+    start_ts, end_ts and the sample count, so the sample timestamps are
+    synthesized: spaced evenly from start_ts to end_ts. since and until are
+    inclusive, before (a cursor) exclusive.
+    """
+    upper = min(t for t in (until, before, float("inf")) if t is not None)
+    cursor = conn.execute("""
+        SELECT start_ts, end_ts, value, samples FROM runs
+        WHERE start_ts <= ? AND end_ts >= ? ORDER BY start_ts DESC
+    """, (upper, since or 0))
+    for start_ts, end_ts, value, samples in cursor:
+        step = (end_ts - start_ts) / (samples - 1) if samples > 1 else 0
+        for i in range(samples - 1, -1, -1):
+            timestamp = start_ts + round(i * step)
+            if timestamp > upper or (before is not None and timestamp >= before):
+                continue
+            if since is not None and timestamp < since:
+                break
+            yield {"timestamp": timestamp, column: value}
+
+def data_response(db_file, column):
+    """
+    page_response() of the data rows, or when the readings are recorded as
+    runs the same rows expanded from the runs (since, until, count, cursor,
+    format and stream work as usual). The timestamps of the expanded rows
+    are synthesized, see expand_runs().
+    """
+    stream_format = request.args.get("stream")
+    try:
+        with read_connection(db_file) as conn:
+            recorded_as_runs = runs_recorded(conn)
+            if recorded_as_runs and stream_format:
+                if stream_format not in STREAM_FORMATS:
+                    raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}.")
+                count = get_count_param()
+                cursor = request.args.get("cursor")
+                before = decode_cursor(cursor, 1)[0] if cursor else None
+                since = get_time_param("since")
+                until = get_time_param("until")
+
+                def expanded():
+                    # Own connection, the rows are read while the response is sent
+                    with read_connection(db_file) as stream_conn:
+                        yield from expand_runs(stream_conn, column, since, until, before)
+                return stream_rows(db_file, None, (), stream_format, expanded(),
+                                   count if count is not None and count >= 1 else None)
+            if recorded_as_runs:
+                count = get_count_param()
+                limit = count if count is not None and 1 <= count <= MAX_RECORDS else MAX_RECORDS
+                cursor = request.args.get("cursor")
+                before = decode_cursor(cursor, 1)[0] if cursor else None
+                with METRICS.time("api_query_seconds", endpoint=request.endpoint):
+                    rows = list(itertools.islice(
+                        expand_runs(conn, column, get_time_param("since"), get_time_param("until"), before),
+                        limit + 1))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except sqlite3.OperationalError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    if not recorded_as_runs:
+        return page_response(db_file, "SELECT * FROM data")
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]["timestamp"]])
+    return add_next_page(render_rows(rows), next_cursor)
+
+def runs_response(db_file):
+    """
+    The runs (start_ts, end_ts, value, samples), newest first. since/until
+    apply to start_ts. at=t returns only the run covering time t.
+    """
+    at = get_time_param("at")
+    if at is None:
+        return page_response(db_file, "SELECT * FROM runs", keys=(("start_ts", "start_ts"),))
+    # Runs don't overlap, the primary key finds the one starting last before t
+    return page_response(db_file, "SELECT * FROM runs", ["start_ts <= ?", "end_ts >= ?"], (at, at),
+                         keys=(("start_ts", "start_ts"),))
+
 @app.route('/api/sensor_data', methods=['GET'])
+@cached_response(sensor_db)
 def get_sensor_data():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(SENSOR_DB, query, count)
-    return jsonify(data)
+    return page_response(sensor_db(), "SELECT * FROM data")
+
+def obis_values_stored(db_file):
+    """True if sensor-reader.py stores the per-OBIS values (STORE_OBIS), they are optional."""
+    try:
+        return bool(fetch_db_data(db_file, "SELECT 1 FROM sqlite_master WHERE name = 'obis_value'"))
+    except sqlite3.OperationalError:
+        # Let the query report the error
+        return True
+
+def obis_not_stored():
+    return jsonify({"status": "error", "message":
+                    "Per-OBIS values are not stored (STORE_OBIS in sensor-reader.py)."}), 404
+
+@app.route('/api/sensor_values', methods=['GET'])
+@cached_response(sensor_db)
+def get_sensor_values():
+    """
+    Values of selected OBIS codes from the normalized obis_value table.
+    Parameters: obis=1-0:31.7.0,1-0:51.7.0 (required), since, until, count, cursor.
+    """
+    codes = [code for code in request.args.get("obis", "").split(",") if code]
+    if not codes:
+        return jsonify({"status": "error", "message": "Parameter 'obis' is required."}), 400
+    if not obis_values_stored(sensor_db()):
+        return obis_not_stored()
+
+    # Look up the code ids first, the value query is then a plain range scan
+    # over the (obis_id, timestamp) primary key
+    conditions = [f"v.obis_id IN (SELECT id FROM obis WHERE code IN ({','.join('?' * len(codes))}))"]
+    select = """
+        SELECT v.timestamp, o.code AS obis, v.value, o.unit
+        FROM obis_value v JOIN obis o ON o.id = v.obis_id
+    """
+    return page_response(sensor_db(), select, conditions, codes,
+                         keys=(("v.timestamp", "timestamp"), ("o.code", "obis")))
 
 @app.route('/api/sensor_15min_data', methods=['GET'])
+@cached_response(HISTORY_15MIN_DB)
 def get_sensor_15min_data():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(HISTORY_15MIN_DB, query, count)
-    return jsonify(data)
+    return tiered_response(HISTORY_15MIN_DB, "data", "15min")
+
+@app.route('/api/phase_stats', methods=['GET'])
+@cached_response(HISTORY_15MIN_DB)
+def get_phase_stats():
+    """
+    Average, min and max of the per-phase power, current and voltage per quarter
+    (rollup_store.PHASE_CODES), archived rows included.
+    Parameters: obis=1-0:31.7.0,1-0:51.7.0 (default all), since, until, count, cursor.
+    """
+    codes = [code for code in request.args.get("obis", "").split(",") if code]
+    return tiered_response(HISTORY_15MIN_DB, "phases", "phases",
+                           keys=(("timestamp", "timestamp"), ("obis", "obis")),
+                           match={"obis": codes} if codes else None)
 
 @app.route('/api/sensor_hourly_data', methods=['GET'])
+@cached_response(HISTORY_HOURLY_DB)
 def get_sensor_hourly_data():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(HISTORY_HOURLY_DB, query, count)
-    return jsonify(data)
+    return page_response(HISTORY_HOURLY_DB, "SELECT * FROM data")
+
+# Rollup tables of the 15-min database by bucket
+CONSUMPTION_TABLES = {"hour": "hourly", "day": "daily", "month": "monthly"}
+
+@app.route('/api/consumption', methods=['GET'])
+@cached_response(HISTORY_15MIN_DB)
+def get_consumption():
+    """
+    Consumed energy per hour/day/month, kept up to date by sensor-reader.
+    Parameters: bucket=hour|day|month (default day), since, until, count, cursor.
+    """
+    table = CONSUMPTION_TABLES.get(request.args.get("bucket", "day"))
+    if table is None:
+        return jsonify({"status": "error", "message":
+                        f"bucket must be one of {', '.join(CONSUMPTION_TABLES)}."}), 400
+    return page_response(HISTORY_15MIN_DB, f"SELECT * FROM {table}")
 
 @app.route('/api/mgmt_data', methods=['GET'])
+@cached_response(MGMT_DB)
 def get_mgmt_data():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(MGMT_DB, query, count)
-    return jsonify(data)
+    return data_response(MGMT_DB, "data")
 
 @app.route('/api/gpio_data', methods=['GET'])
+@cached_response(GPIO_DB)
 def get_gpio_data():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(GPIO_DB, query, count)
-    return jsonify(data)
+    return data_response(GPIO_DB, "Switch2")
+
+@app.route('/api/mgmt_runs', methods=['GET'])
+@cached_response(MGMT_DB)
+def get_mgmt_runs():
+    return runs_response(MGMT_DB)
+
+@app.route('/api/gpio_runs', methods=['GET'])
+@cached_response(GPIO_DB)
+def get_gpio_runs():
+    return runs_response(GPIO_DB)
 
 @app.route('/api/mgmt_changes', methods=['GET'])
+@cached_response(MGMT_CHANGES_DB)
 def get_mgmt_changes():
-    count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(MGMT_CHANGES_DB, query, count)
-    return jsonify(data)
+    return page_response(MGMT_CHANGES_DB, "SELECT * FROM data")
 
 @app.route('/api/gpio_changes', methods=['GET'])
+@cached_response(GPIO_CHANGES_DB)
 def get_gpio_changes():
+    return page_response(GPIO_CHANGES_DB, "SELECT * FROM data")
+
+# Bucket start of a unix timestamp column. Days and months are in local time.
+BUCKETS = {
+    "15min": "({column} - {column} % 900)",
+    "hour": "({column} - {column} % 3600)",
+    "day": "CAST(strftime('%s', {column}, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)",
+    "month": "CAST(strftime('%s', {column}, 'unixepoch', 'localtime', 'start of month', 'utc') AS INTEGER)",
+}
+# BUCKETS for the archived rows, decoded in Python
+BUCKET_FUNCTIONS = {
+    "15min": lambda timestamp: timestamp - timestamp % 900,
+    "hour": lambda timestamp: timestamp - timestamp % 3600,
+    "day": day_start,
+    "month": month_start,
+}
+# 'last' uses SQLite's bare column rule: value comes from the row of MAX(timestamp)
+AGGREGATES = {
+    "sum": "SUM({value})",
+    "min": "MIN({value})",
+    "max": "MAX({value})",
+    "avg": "AVG({value})",
+    "last": "{value}",
+}
+# History databases, their aggregatable columns and interval length. A row is
+# stored at the end of its interval (rollup_store.py), the 13:00 row covers 12:45-13:00
+AGGREGATE_SOURCES = {
+    "15min": (HISTORY_15MIN_DB, ("consumed_energy", "total_energy"), 900),
+    "hourly": (HISTORY_HOURLY_DB, ("total_energy",), 3600),
+}
+# Sources whose rows older than the hot table are in the archive: series of archive_store.SERIES
+ARCHIVED_SOURCES = {"15min": "15min"}
+
+def aggregate_archived(series, field, interval, bucket, agg, since, until):
+    """
+    Buckets of the archived rows of series in the form of the get_aggregate()
+    query rows, newest first. since and until (inclusive) apply to the
+    stored timestamps, only the partitions in the range are decoded.
+    """
+    if not os.path.exists(ARCHIVE_DB):
+        return []
+    bucket_of = BUCKET_FUNCTIONS[bucket]
+    buckets = {}
+    with read_connection(ARCHIVE_DB) as conn:
+        for row in archive_store.read_rows(conn, series, since, until):
+            buckets.setdefault(bucket_of(row["timestamp"] - interval), []).append(
+                (row["timestamp"], row[field]))
+    result = []
+    for start in sorted(buckets, reverse=True):
+        rows = buckets[start]
+        values = [value for _, value in rows if value is not None]
+        if agg == "last":
+            value = max(rows)[1]
+        elif not values:
+            value = None
+        elif agg == "sum":
+            value = sum(values)
+        elif agg == "avg":
+            value = sum(values) / len(values)
+        else:
+            value = (min if agg == "min" else max)(values)
+        result.append({"bucket": start, "value": value, "samples": len(values)})
+    return result
+
+def merge_bucket(agg, hot, archived):
+    """One bucket from its hot and archived parts, the hot rows are the newer ones."""
+    merged = dict(hot, samples=hot["samples"] + archived["samples"])
+    values = [part["value"] for part in (hot, archived) if part["value"] is not None]
+    if agg == "last" or not values:
+        return merged
+    if agg == "sum":
+        merged["value"] = sum(values)
+    elif agg == "avg":
+        merged["value"] = sum(part["value"] * part["samples"] for part in (hot, archived)
+                              if part["value"] is not None) / merged["samples"]
+    else:
+        merged["value"] = (min if agg == "min" else max)(values)
+    return merged
+
+def aggregate_db():
+    """Database read by /api/aggregate for the current request."""
+    source = AGGREGATE_SOURCES.get(request.args.get("source"))
+    return source[0] if source else sensor_db()
+
+@app.route('/api/aggregate', methods=['GET'])
+@cached_response(aggregate_db)
+def get_aggregate():
+    """
+    Aggregated values per time bucket, newest bucket first.
+    Parameters:
+        bucket=15min|hour|day|month, agg=sum|min|max|avg|last, since, until, count
+        source=15min|hourly and field=consumed_energy|total_energy for the history data, or
+        obis=1-0:1.7.0,1-0:21.7.0 for the per-OBIS values
+    History rows belong to the bucket their interval starts in, since and
+    until select them by the interval start too, as /api/consumption does.
+    With source=15min the rows older than the hot table come from the archive.
+    """
+    bucket = request.args.get("bucket", "hour")
+    agg = request.args.get("agg", "sum")
+    if bucket not in BUCKETS or agg not in AGGREGATES:
+        return jsonify({"status": "error", "message":
+                        f"bucket must be one of {', '.join(BUCKETS)}, agg one of {', '.join(AGGREGATES)}."}), 400
+
+    codes = [code for code in request.args.get("obis", "").split(",") if code]
+    source = request.args.get("source")
+    conditions = []
+    params = []
+    # Seconds from the interval start to the stored timestamp
+    interval = 0
+    if source is not None:
+        if source not in AGGREGATE_SOURCES:
+            return jsonify({"status": "error", "message": f"Unknown source '{source}'."}), 400
+        db_file, fields, interval = AGGREGATE_SOURCES[source]
+        field = request.args.get("field", fields[0])
+        if field not in fields:
+            return jsonify({"status": "error", "message": f"field must be one of {', '.join(fields)}."}), 400
+        column, value, table, group = "timestamp", field, "data", ""
+    elif codes:
+        db_file = sensor_db()
+        if not obis_values_stored(db_file):
+            return obis_not_stored()
+        column, value, table = "v.timestamp", "v.value", "obis_value v JOIN obis o ON o.id = v.obis_id"
+        group = "o.code"
+        conditions.append(f"o.code IN ({','.join('?' * len(codes))})")
+        params.extend(codes)
+    else:
+        return jsonify({"status": "error", "message": "Parameter 'source' or 'obis' is required."}), 400
+
+    since = get_time_param("since")
+    until = get_time_param("until")
+    if since is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(since + interval)
+    if until is not None:
+        conditions.append(f"{column} <= ?")
+        params.append(until + interval)
     count = get_count_param()
-    query = "SELECT * FROM data ORDER BY timestamp DESC"
-    data = fetch_db_data(GPIO_CHANGES_DB, query, count)
-    return jsonify(data)
+    limit = count if count is not None and 1 <= count <= MAX_RECORDS else MAX_RECORDS
+
+    bucket_expr = BUCKETS[bucket].format(column=f"({column} - {interval})" if interval else column)
+    group_by = f"{group}, bucket" if group else "bucket"
+    query = f"""
+        SELECT {bucket_expr} AS bucket, {group + ' AS obis, ' if group else ''}
+               {AGGREGATES[agg].format(value=value)} AS value,
+               COUNT({value}) AS samples, MAX({column}) AS last_timestamp
+        FROM {table}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        GROUP BY {group_by}
+        ORDER BY bucket DESC
+    """
+    try:
+        data = fetch_db_data(db_file, query, limit, tuple(params))
+        if source in ARCHIVED_SOURCES:
+            hot_start = fetch_db_data(db_file, "SELECT MIN(timestamp) AS timestamp FROM data")[0]["timestamp"]
+            archive_until = until + interval if until is not None else None
+            if hot_start is not None:
+                archive_until = hot_start - 1 if archive_until is None else min(archive_until, hot_start - 1)
+            archive_since = since + interval if since is not None else None
+            if len(data) >= limit:
+                # Only the oldest bucket returned can continue in the archive
+                oldest = data[-1]["bucket"] + interval
+                archive_since = oldest if archive_since is None else max(archive_since, oldest)
+            older = []
+            if archive_since is None or archive_until is None or archive_since <= archive_until:
+                older = aggregate_archived(ARCHIVED_SOURCES[source], value, interval, bucket, agg,
+                                           archive_since, archive_until)
+            if data and older and data[-1]["bucket"] == older[0]["bucket"]:
+                data[-1] = merge_bucket(agg, data[-1], older.pop(0))
+            data.extend(older[:limit - len(data)])
+    except sqlite3.OperationalError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    for row in data:
+        row.pop("last_timestamp", None)
+    data = [{"timestamp": row.pop("bucket"), **row} for row in data]
+    try:
+        return render_rows(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+# Live feed: (event name, database) pairs watched for new rows
+EVENT_SOURCES = [
+    ("sensor", sensor_db),
+    ("mgmt_change", MGMT_CHANGES_DB),
+    ("gpio_change", GPIO_CHANGES_DB),
+]
+WATCH_INTERVAL = 0.2
+SSE_KEEPALIVE = 15
+# Events buffered per client, a client that falls further behind is disconnected
+SUBSCRIBER_QUEUE = 100
+
+class EventHub:
+    """
+    Watches the event databases in one thread and fans new rows out to
+    the subscribed clients. The databases are queried only after their
+    data_version has changed, never per client.
+    """
+
+    def __init__(self, sources, interval):
+        self.sources = sources
+        self.interval = interval
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.generations = {}
+        self.last_timestamps = {}
+
+    def subscribe(self):
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.watch, name="event-hub", daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        message = f"event: {event}\nid: {data.get('timestamp', '')}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Too slow, the client is told to reconnect
+                self.unsubscribe(subscriber)
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(None)
+
+    def watch(self):
+        while True:
+            for event, source in self.sources:
+                db_file = source() if callable(source) else source
+                try:
+                    self.poll(event, db_file)
+                except (sqlite3.Error, OSError) as e:
+                    # Database not created yet or busy, try again on the next round
+                    self.generations.pop(event, None)
+                    print(f"Event watcher: {db_file}: {e}")
+            time.sleep(self.interval)
+
+    def poll(self, event, db_file):
+        # State per event, the file of a source can change (sensor_db)
+        generation, _ = db_generation(db_file)
+        generation = (db_file, generation)
+        if self.generations.get(event) == generation:
+            return
+        first = event not in self.generations
+        self.generations[event] = generation
+        if first and event not in self.last_timestamps:
+            row = fetch_db_data(db_file, "SELECT MAX(timestamp) AS timestamp FROM data")
+            self.last_timestamps[event] = row[0]["timestamp"] or 0
+            return
+        rows = fetch_db_data(db_file, "SELECT * FROM data WHERE timestamp > ? ORDER BY timestamp",
+                             MAX_RECORDS, (self.last_timestamps[event],))
+        for row in rows:
+            if "sensor_data" in row:
+                # Values as JSON, not as a JSON string inside JSON
+                row["values"] = json.loads(row.pop("sensor_data"))
+            self.publish(event, row)
+        if rows:
+            self.last_timestamps[event] = rows[-1]["timestamp"]
+
+EVENT_HUB = EventHub(EVENT_SOURCES, WATCH_INTERVAL)
+
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    """
+    Server-Sent Events: 'sensor' for each new telegram, 'mgmt_change' and
+    'gpio_change' for each switch state change. data is the new row as JSON.
+    """
+    subscriber = EVENT_HUB.subscribe()
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=SSE_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            EVENT_HUB.unsubscribe(subscriber)
+
+    response = app.response_class(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # nginx must not buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# Rendered graph tiles, matplotlib is imported on the first render
+GRAPH_TILES = TileCache(HISTORY_15MIN_DB)
+
+@app.route('/api/graph/<name>.png', methods=['GET'])
+@cached_response(HISTORY_15MIN_DB)
+def get_graph(name):
+    """PNG graph tile, see graph_tiles.TILES for the names."""
+    if name not in TILES:
+        return jsonify({"status": "error", "message": f"Graphs: {', '.join(TILES)}."}), 404
+    try:
+        png, _ = GRAPH_TILES.get(name)
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except sqlite3.Error as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return app.response_class(png, mimetype="image/png")
 
 @app.route('/api/monitor', methods=['GET'])
+@cached_response(MONITOR_FILE, generation=file_generation)
 def get_monitor_file():
     """
     API endpoint to export the contents of monitor.txt as JSON.
+    In the watchdog's heartbeat mode also 'health': per-source status, age,
+    lag, interval and gap count as of health.report_time.
 
     Returns:
         JSON: A dictionary containing the file's contents or an error message if the file is missing.
@@ -137,13 +1148,54 @@ def get_monitor_file():
             # Read the contents of the file                                          
             with open(MONITOR_FILE, "r") as file:
                 file_contents = file.read().strip()
+            result = {"status": "success", "contents": file_contents}
+            if os.path.exists(HEALTH_FILE):
+                with open(HEALTH_FILE, "r") as file:
+                    result["health"] = json.load(file)
             # Return the file contents as JSON                                              
-            return jsonify({"status": "success", "contents": file_contents})
+            return jsonify(result)
         except Exception as e:
             return jsonify({"status": "error", "message": str(e)})
     else:
         return jsonify({"status": "error", "message": f"File '{MONITOR_FILE}' not found."})
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus text format: this process' metrics and the snapshots the
+    readers write to metrics.METRICS_DIR, labelled with process.
+    """
+    snapshots = [snapshot for snapshot in read_snapshots() if snapshot.get("process") != METRICS.process]
+    snapshots.append(METRICS.snapshot())
+    return app.response_class(render_prometheus(snapshots), mimetype="text/plain; version=0.0.4")
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.endpoint or "none"
+        METRICS.observe("api_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+        METRICS.inc("api_requests_total", endpoint=endpoint, status=response.status_code)
+    return response
+
+METRICS.set_collector("graph_", lambda: {"renders": GRAPH_TILES.renders,
+                                         "render_seconds": GRAPH_TILES.render_time}, "counter")
+METRICS.set_collector("events_", lambda: {"subscribers": len(EVENT_HUB.subscribers)})
+
+# Every request can be sampled by the SIGUSR1 profiler (metrics.PROFILER)
+_wsgi_app = app.wsgi_app
+
+def profiled_wsgi_app(environ, start_response):
+    with PROFILER.sample():
+        return _wsgi_app(environ, start_response)
+
+app.wsgi_app = profiled_wsgi_app
+
 if __name__ == '__main__':
+    PROFILER.install("han-api")
     app.run(debug=True, host='0.0.0.0', port=5002, use_reloader=False)                                                                      
 #    app.run(host='0.0.0.0', port=5002, use_reloader=False)
@@ -0,0 +1,160 @@
+# HEARTBEAT
+# 17.10.2026
+#
+# Readers send a small UDP datagram to the watchdog after each stored
+# reading. The watchdog learns about new data immediately, without
+# opening the databases. Sending never blocks or raises, a reader works
+# the same whether the watchdog is running or not.
+#
+# HealthTracker keeps per source: time since the last heartbeat (age),
+# data lag (receive time - data timestamp), average inter-arrival time
+# and gap count. A source is 'late' when no heartbeat has arrived within
+# max(min_alert, GAP_FACTOR * average interval) seconds, min_alert is
+# MIN_ALERT unless the source sets its own (e.g. a low-rate heartbeat).
+import json
+import socket
+import time
+
+HEARTBEAT_ADDRESS = ("127.0.0.1", 5003)
+# Weight of the newest interval in the running average
+INTERVAL_SMOOTHING = 0.2
+GAP_FACTOR = 3
+MIN_ALERT = 30
+
+_socket = None
+
+
+def send(source, timestamp=None):
+    """Sends a heartbeat for source, timestamp is the stored data's timestamp."""
+    global _socket
+    message = json.dumps({"source": source, "timestamp": timestamp, "sent": time.time()})
+    try:
+        if _socket is None:
+            _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            _socket.setblocking(False)
+        _socket.sendto(message.encode(), HEARTBEAT_ADDRESS)
+    except OSError:
+        pass
+
+
+class SourceHealth:
+    """Incremental health statistics of one source."""
+
+    def __init__(self, source, name, min_alert=MIN_ALERT):
+        self.source = source
+        self.name = name
+        self.min_alert = min_alert
+        self.last_seen = None
+        self.last_timestamp = None
+        self.lag = None
+        self.interval = None
+        self.heartbeats = 0
+        self.gaps = 0
+        self.late = False
+        # True after the heartbeat that ended a late period
+        self.recovered = False
+
+    def seed(self, timestamp):
+        """Starts from the latest stored timestamp, e.g. after a restart."""
+        self.last_seen = timestamp
+        self.last_timestamp = timestamp
+
+    def alert_after(self):
+        if self.interval is None:
+            return self.min_alert
+        return max(self.min_alert, GAP_FACTOR * self.interval)
+
+    def deadline(self):
+        """Time when the source turns late without a new heartbeat."""
+        return None if self.last_seen is None else self.last_seen + self.alert_after()
+
+    def heartbeat(self, received, timestamp=None):
+        if self.last_seen is not None:
+            interval = received - self.last_seen
+            if interval > self.alert_after():
+                # Already counted if evaluate() marked the source late
+                if not self.late:
+                    self.gaps += 1
+            elif self.interval is None:
+                self.interval = interval
+            else:
+                self.interval += INTERVAL_SMOOTHING * (interval - self.interval)
+        self.last_seen = received
+        self.heartbeats += 1
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+            self.lag = received - timestamp
+        self.recovered = self.late
+        self.late = False
+
+    def as_dict(self, now):
+        return {
+            "source": self.source,
+            "name": self.name,
+            "status": "late" if self.late else ("ok" if self.last_seen is not None else "no data"),
+            "age": None if self.last_seen is None else round(now - self.last_seen, 3),
+            "last_timestamp": self.last_timestamp,
+            "lag": None if self.lag is None else round(self.lag, 3),
+            "interval": None if self.interval is None else round(self.interval, 3),
+            "alert_after": round(self.alert_after(), 3),
+            "heartbeats": self.heartbeats,
+            "gaps": self.gaps,
+        }
+
+
+class HealthTracker:
+    """Health of all watched sources, updated from heartbeats."""
+
+    def __init__(self, sources):
+        """
+        Args:
+            sources (list): (source, name) or (source, name, min_alert) tuples.
+        """
+        self.sources = {source[0]: SourceHealth(*source) for source in sources}
+
+    def receive(self, message, received=None):
+        """
+        Handles one heartbeat datagram.
+
+        Returns:
+            SourceHealth: Updated source, None for unknown or invalid messages.
+        """
+        received = time.time() if received is None else received
+        try:
+            data = json.loads(message)
+            health = self.sources.get(data["source"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if health is not None:
+            health.heartbeat(received, data.get("timestamp"))
+        return health
+
+    def evaluate(self, now=None):
+        """
+        Marks the sources that have passed their deadline as late.
+
+        Returns:
+            list: Sources that turned late in this call.
+        """
+        now = time.time() if now is None else now
+        turned_late = []
+        for health in self.sources.values():
+            deadline = health.deadline()
+            if not health.late and deadline is not None and now >= deadline:
+                health.late = True
+                health.gaps += 1
+                turned_late.append(health)
+        return turned_late
+
+    def next_deadline(self):
+        """Earliest deadline of the sources that are not late yet, or None."""
+        deadlines = [h.deadline() for h in self.sources.values()
+                     if not h.late and h.deadline() is not None]
+        return min(deadlines) if deadlines else None
+
+    def as_dict(self, now=None):
+        now = time.time() if now is None else now
+        return {
+            "report_time": now,
+            "sources": [health.as_dict(now) for health in self.sources.values()],
+        }
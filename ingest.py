@@ -0,0 +1,129 @@
+# INGEST
+# 17.10.2026
+#
+# Pipelined ingest for sensor-reader.py:
+#   SerialReader thread -> FrameQueue -> writer stage (sensor-reader.writeBatch)
+# The reader thread only reads the serial port and assembles frames, so a
+# slow commit, WAL checkpoint or a reader holding a lock does not stall the
+# UART. The queue is bounded, OVERFLOW_POLICIES decides what happens when
+# the writer falls behind for longer than the queue can hold.
+import collections
+import threading
+import time
+
+from sensor_store import LatencyStats
+from telegram_parser import FrameAssembler
+
+# drop_oldest: newest frames are kept, block: reader waits (UART may overflow),
+# drop_newest: new frames are thrown away while the queue is full
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class FrameQueue:
+    """Bounded FIFO of (frame, received) tuples between the stages."""
+
+    def __init__(self, maxsize, overflow="drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.items = collections.deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        # Metrics
+        self.put_count = 0
+        self.overflow_count = 0
+        self.max_depth = 0
+        self.wait = LatencyStats("queue_wait")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def put(self, item):
+        """
+        Adds one item.
+
+        Returns:
+            bool: False if an item was dropped because the queue was full.
+        """
+        with self.lock:
+            accepted = True
+            if len(self.items) >= self.maxsize:
+                if self.overflow == "block":
+                    while len(self.items) >= self.maxsize:
+                        self.not_full.wait()
+                else:
+                    self.overflow_count += 1
+                    accepted = False
+                    if self.overflow == "drop_newest":
+                        return False
+                    self.items.popleft()
+            self.items.append((time.monotonic(), item))
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.not_empty.notify()
+            return accepted
+
+    def get_batch(self, max_items, timeout=None):
+        """
+        Waits for at least one item and returns up to max_items items.
+
+        Returns:
+            list: Items, empty if timeout passed.
+        """
+        with self.lock:
+            if not self.items and not self.not_empty.wait_for(lambda: self.items, timeout):
+                return []
+            now = time.monotonic()
+            batch = []
+            while self.items and len(batch) < max_items:
+                queued, item = self.items.popleft()
+                self.wait.add(now - queued)
+                batch.append(item)
+            self.not_full.notify_all()
+            return batch
+
+    def metrics(self):
+        """Returns the queue counters as a dict."""
+        with self.lock:
+            depth = len(self.items)
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "overflow_policy": self.overflow,
+            "put": self.put_count,
+            "overflow": self.overflow_count,
+            "wait": self.wait.metrics(),
+        }
+
+
+class SerialReader(threading.Thread):
+    """Reads the serial port and puts assembled frames to a FrameQueue."""
+
+    def __init__(self, connection, frame_queue, assembler=None):
+        super().__init__(name="serial-reader", daemon=True)
+        self.connection = connection
+        self.frame_queue = frame_queue
+        self.assembler = assembler or FrameAssembler()
+        self.running = True
+        self.error = None
+
+    def run(self):
+        self.connection.reset_input_buffer()
+        while self.running:
+            try:
+                data = self.connection.read(self.connection.in_waiting or 1)
+            except Exception as e:
+                # Serial port gone, the main thread decides what to do
+                self.error = e
+                break
+            for frame in self.assembler.feed(data):
+                if not self.frame_queue.put(frame):
+                    print(f"Frame queue full, {self.frame_queue.overflow}: "
+                          f"{self.frame_queue.overflow_count} frames lost")
+
+    def stop(self):
+        self.running = False
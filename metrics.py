@@ -0,0 +1,247 @@
+# METRICS
+# 17.10.2026
+#
+# Counters, gauges and latency histograms for the readers and han-api.
+# Every process keeps its own Registry and writes a snapshot to
+# METRICS_DIR/<process>.json at most every SNAPSHOT_INTERVAL seconds.
+# han-api.py /api/metrics combines the snapshots with its own registry
+# into the Prometheus text format.
+#
+# Profiling: after PROFILER.install(process) in the main program SIGUSR1
+# toggles cProfile. While it is on every SAMPLE_EVERY:th block run in
+# PROFILER.sample() is recorded, on the next SIGUSR1 the statistics are
+# written to METRICS_DIR/<process>.prof (pstats format). The signal handler
+# only sets a flag, the toggle is done at the start of the next block.
+import bisect
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = "metrics"
+SNAPSHOT_INTERVAL = 10
+SAMPLE_EVERY = 10
+PREFIX = "han_"
+# Seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class Registry:
+    """Metrics of one process."""
+
+    def __init__(self, process):
+        self.process = process
+        self.lock = threading.Lock()
+        # (name, labels tuple) -> value or Histogram
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        # prefix -> (function returning {name: value}, metric type),
+        # read at snapshot time
+        self.collectors = {}
+        self.last_write = 0.0
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observes the duration of the with block in histogram name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def set_collector(self, prefix, collector, metric_type="gauge"):
+        """
+        Adds the numeric values of an existing metrics() dict, e.g.
+        FrameAssembler.metrics, as prefix + key. Replaces an earlier
+        collector with the same prefix.
+        """
+        self.collectors[prefix] = (collector, metric_type)
+
+    def snapshot(self):
+        """Metrics as a JSON compatible dict."""
+        metrics = []
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                metrics.append({"name": name, "type": "counter", "labels": dict(labels), "value": value})
+            for (name, labels), histogram in self.histograms.items():
+                metrics.append({"name": name, "type": "histogram", "labels": dict(labels),
+                                **histogram.snapshot()})
+        for prefix, (collector, metric_type) in list(self.collectors.items()):
+            for name, value in collector().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metrics.append({"name": prefix + name, "type": metric_type, "labels": {},
+                                    "value": value})
+        return {"process": self.process, "time": time.time(), "help": dict(self.help),
+                "metrics": metrics}
+
+    def maybe_write(self, directory=METRICS_DIR):
+        """Writes the snapshot file if SNAPSHOT_INTERVAL has passed."""
+        now = time.monotonic()
+        if now - self.last_write < SNAPSHOT_INTERVAL:
+            return
+        self.last_write = now
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{self.process}.json")
+            with open(path + ".tmp", "w") as file:
+                json.dump(self.snapshot(), file)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"Metrics snapshot not written: {e}")
+
+
+def read_snapshots(directory=METRICS_DIR):
+    """Reads all snapshot files written by Registry.maybe_write."""
+    snapshots = []
+    if not os.path.isdir(directory):
+        return snapshots
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            try:
+                with open(os.path.join(directory, filename)) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    text = ",".join(f'{k}="{str(v)}"'.replace("\\", "\\\\").replace("\n", "\\n") for k, v in labels.items())
+    return "{" + text + "}"
+
+
+def render_prometheus(snapshots):
+    """Prometheus text exposition format of the snapshots, process as a label."""
+    families = {}
+    help_texts = {}
+    for snapshot in snapshots:
+        help_texts.update(snapshot.get("help", {}))
+        for metric in snapshot["metrics"]:
+            metric = dict(metric, labels={"process": snapshot["process"], **metric["labels"]})
+            families.setdefault(metric["name"], []).append(metric)
+    lines = []
+    for name, metrics in families.items():
+        full_name = PREFIX + name
+        metric_type = metrics[0]["type"]
+        if name in help_texts:
+            lines.append(f"# HELP {full_name} {help_texts[name]}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for metric in metrics:
+            labels = metric["labels"]
+            if metric_type == "histogram":
+                for bound, count in metric["buckets"]:
+                    lines.append(f"{full_name}_bucket{_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{full_name}_sum{_labels(labels)} {metric['sum']}")
+                lines.append(f"{full_name}_count{_labels(labels)} {metric['count']}")
+            else:
+                lines.append(f"{full_name}{_labels(labels)} {metric['value']}")
+    return "\n".join(lines) + "\n"
+
+
+class Profiler:
+    """cProfile toggled by SIGUSR1, records every SAMPLE_EVERY:th block."""
+
+    def __init__(self, process="python", directory=METRICS_DIR):
+        self.process = process
+        self.directory = directory
+        self.profile = None
+        self.blocks = 0
+        self.toggle_requested = False
+        self.lock = threading.Lock()
+
+    def install(self, process):
+        """Installs the SIGUSR1 handler, main thread only."""
+        self.process = process
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.request_toggle())
+
+    def request_toggle(self):
+        """
+        SIGUSR1 handler. It may run inside a sampled block of the main
+        thread, so it takes no lock, sample() does the toggle.
+        """
+        self.toggle_requested = True
+
+    def toggle(self):
+        """Starts or stops profiling, called with the lock held."""
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            print(f"Profiling {self.process} on, every {SAMPLE_EVERY}. block")
+            return
+        profile, self.profile = self.profile, None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.process}.prof")
+        profile.dump_stats(path)
+        print(f"Profiling {self.process} off, statistics in {path}")
+
+    @contextmanager
+    def sample(self):
+        """Profiles the with block when profiling is on and it is sampled."""
+        # No sampled block runs while the lock is held, nested blocks retry later
+        if self.toggle_requested and self.lock.acquire(blocking=False):
+            try:
+                self.toggle_requested = False
+                self.toggle()
+            finally:
+                self.lock.release()
+        profile = self.profile
+        self.blocks += 1
+        if profile is None or self.blocks % SAMPLE_EVERY or not self.lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+        finally:
+            self.lock.release()
+
+
+# One profiler per process, shared by the modules run in it
+PROFILER = Profiler()
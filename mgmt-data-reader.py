@@ -5,67 +5,78 @@
 # to mgmt_data database
 # Reports the changes in switch state into mgmt_changes database
 # 0.4 25.4.2025 Changes in screen output to include database name for clarify
+# 0.5 17.10.2026 store_reading() split out of main, run_async() for supervisor.py
+# 0.6 17.10.2026 Heartbeat to the watchdog after each stored reading
+# 0.7 17.10.2026 Serial read and store time histograms (metrics.py),
+#                snapshot in metrics/mgmt-data-reader.json
+# 0.8 17.10.2026 Both databases are MAX_RECORDS slot ring buffers (ring_store.py),
+#                one UPSERT per write on a kept-open connection, no COUNT(*)/DELETE
+# 0.9 17.10.2026 RECORD_MODE = "runs": mgmt_data readings stored as change-only runs
+#                (run_store.py), the open run is written every FLUSH_INTERVAL
+# 0.10 17.10.2026 run_async: serial read timeout and stop event, the pending read
+#                 ends before the port is closed (supervisor stop/restart)
 #
+import asyncio
+import heartbeat
+from metrics import Registry, PROFILER
+from ring_store import RingTable
+from run_store import RunRecorder
 import serial
-import sqlite3
+import threading
 import time
 
 DB_MAIN = "mgmt_data.db"
 DB_CHANGES = "mgmt_changes.db"
+# Rows kept in each database
 MAX_RECORDS = 30
+COLUMNS = [("timestamp", "INTEGER"), ("data", "TEXT")]
+MAIN_TABLE = None
+CHANGES_TABLE = None
 READ_INTERVAL = 10
-
-def create_connection(db_file):
-    conn = sqlite3.connect(db_file)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
+# "rows": a mgmt_data row per reading, "runs": (start_ts, end_ts, value) runs
+RECORD_MODE = "rows"
+# Runs mode: seconds between writes of the open run
+FLUSH_INTERVAL = 300
+# Runs mode: a longer pause between readings starts a new run
+RUN_MAX_GAP = 60
+RUNS = None
+SERIAL_PORT = "/dev/ttyS4"
+SERIAL_BAUDRATE = 300
+# run_async: seconds a serial read may block, the stop event is checked in between
+SERIAL_TIMEOUT = 1.0
+METRICS = Registry("mgmt-data-reader")
+METRICS.describe("mgmt_read_seconds", "Time to read one S/T reading from the serial port")
+METRICS.describe("mgmt_store_seconds", "Time to store one reading")
+METRICS.describe("mgmt_changes_total", "Readings with a changed S value")
 
 def initialize_database(db_file):
-    """Creates the 'data' table if it doesn't exist."""
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data (
-            timestamp INTEGER PRIMARY KEY,
-            data TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-def store_data(db_file, timestamp, data):
-    """Stores timestamp and serial data in the specified database."""
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO data (timestamp, data) VALUES (?, ?)", (timestamp, data))
-    conn.commit()
-    conn.close()
-
-def remove_old_records(db_file, max_records=None):
+    """Opens the ring buffer of db_file, creates or converts the table if needed."""
+    return RingTable(db_file, COLUMNS, MAX_RECORDS)
+
+def initialize_databases():
+    global MAIN_TABLE, CHANGES_TABLE, RUNS
+    if MAIN_TABLE is None:
+        MAIN_TABLE = initialize_database(DB_MAIN)
+        CHANGES_TABLE = initialize_database(DB_CHANGES)
+    if RECORD_MODE == "runs" and RUNS is None:
+        RUNS = RunRecorder(DB_MAIN, RUN_MAX_GAP, FLUSH_INTERVAL)
+        METRICS.set_collector("mgmt_runs_", RUNS.metrics, "counter")
+
+def flush_runs():
+    """Writes the open run, e.g. before exit."""
+    if RUNS is not None:
+        RUNS.flush()
+
+def store_data(table, timestamp, data):
+    """Stores timestamp and serial data over the oldest row of the table."""
+    table.append(timestamp, data)
+
+def readManagement(mgmtConnection, previous_s_value=None, stop=None):
     """
-    Removes records from the specified database.
-    - If max_records is specified, ensures the table contains at most max_records entries.
+    Reads serial data from the management connection and processes it.
+    With a port timeout, returns None when the stop event is set.
     """
-    conn = create_connection(db_file)
-    cursor = conn.cursor()
-
-    if max_records:
-        cursor.execute("SELECT COUNT(*) FROM data")
-        record_count = cursor.fetchone()[0]
-        print(f"Record count {record_count}")
-        if record_count > max_records:
-            # print("Max records reached, deleting old records")
-            print(f"Deleting old records in {db_file}  ({record_count})")
-            cursor.execute("""
-                DELETE FROM data WHERE timestamp = (
-                    SELECT MIN(timestamp) FROM data
-                )
-            """)
-            conn.commit()
-    conn.close()
-
-def readManagement(mgmtConnection, previous_s_value=None):
-    """Reads serial data from the management connection and processes it."""
+    started = time.perf_counter()
     # Clear the input buffer
     mgmtConnection.reset_input_buffer()
 
@@ -73,6 +84,8 @@ def readManagement(mgmtConnection, previous_s_value=None):
 
     # Wait for line beginning with "S" character
     while not stringData.startswith("S"):
+        if stop is not None and stop.is_set():
+            return None
         try:
             line = mgmtConnection.readline()
             stringData = line.decode('utf-8').strip()
@@ -83,21 +96,53 @@ def readManagement(mgmtConnection, previous_s_value=None):
 
     # Read next line, should be one starting with "T" character
     line = mgmtConnection.readline()
+    # Empty after a port timeout
+    while not line:
+        if stop is not None and stop.is_set():
+            return None
+        line = mgmtConnection.readline()
     stringData = line.decode('utf-8').strip()
     t_value = stringData  # Value starting with "T"
 
+    METRICS.observe("mgmt_read_seconds", time.perf_counter() - started)
+
     # Compare 'S' value with previous and return data
     if s_value != previous_s_value:
         return [s_value, t_value, True]  # Change detected
     return [s_value, t_value, False]  # No change detected
 
+def store_reading(serial_data, t_value, change_detected):
+    """Stores one S/T reading, and into the changes database if S changed."""
+    with PROFILER.sample(), METRICS.time("mgmt_store_seconds"):
+        # Prepare the data for storage
+        timestamp = int(time.time())
+        formatted_data = f"{serial_data}, {t_value}"
+
+        if RUNS is not None:
+            # Written only when the value changes or the open run is flushed
+            if RUNS.record(timestamp, formatted_data):
+                print(f"Run started in {DB_MAIN} - Timestamp: {timestamp}, Data: {formatted_data}")
+        else:
+            # Store data in the main database, the oldest row is overwritten
+            store_data(MAIN_TABLE, timestamp, formatted_data)
+            print(f"Data Stored in {DB_MAIN} - Timestamp: {timestamp}, Data: {formatted_data}")
+
+        # If "S" value has changed, store in the changes database
+        if change_detected:
+            store_data(CHANGES_TABLE, timestamp, formatted_data)
+            print(f"Data Stored in {DB_CHANGES} - Timestamp: {timestamp}, Data: {formatted_data}")
+
+    if change_detected:
+        METRICS.inc("mgmt_changes_total")
+    heartbeat.send("mgmt", timestamp)
+    METRICS.maybe_write()
+
 def main():
-    serMgmt = serial.Serial(port="/dev/ttyS4", baudrate=300)
+    serMgmt = serial.Serial(port=SERIAL_PORT, baudrate=SERIAL_BAUDRATE)
     print("connected to management: " + serMgmt.portstr)
 
     # Initialize the databases
-    initialize_database(DB_MAIN)
-    initialize_database(DB_CHANGES)
+    initialize_databases()
 
     previous_s_value = None  # Track last "S" value
 
@@ -109,31 +154,50 @@ def main():
             # Update "S" value tracker
             previous_s_value = serial_data
 
-            # Prepare the data for storage
-            timestamp = int(time.time())
-            formatted_data = f"{serial_data}, {t_value}"
-
-            # Store data in the main database
-            store_data(DB_MAIN, timestamp, formatted_data)
-            print(f"Data Stored in {DB_MAIN} - Timestamp: {timestamp}, Data: {formatted_data}")
-
-            # Remove old records from the main database
-            remove_old_records(DB_MAIN, max_records=MAX_RECORDS)
-
-            # If "S" value has changed, store in the changes database
-            if change_detected:
-                store_data(DB_CHANGES, timestamp, formatted_data)
-                print(f"Data Stored in {DB_CHANGES} - Timestamp: {timestamp}, Data: {formatted_data}")
-
-                # Ensure changes database does not exceed 30 records
-                remove_old_records(DB_CHANGES, max_records=MAX_RECORDS)
+            store_reading(serial_data, t_value, change_detected)
 
             # Wait for 10 seconds
             time.sleep(READ_INTERVAL)
     except KeyboardInterrupt:
         print("Program interrupted.")
     finally:
+        flush_runs()
+        serMgmt.close()
+
+async def run_async():
+    """
+    Management reader task for supervisor.py. The blocking serial read
+    runs in a worker thread.
+    """
+    # timeout: the worker thread sees the stop event, a cancelled task does
+    # not leave a read blocked forever (executor shutdown, restart)
+    serMgmt = serial.Serial(port=SERIAL_PORT, baudrate=SERIAL_BAUDRATE, timeout=SERIAL_TIMEOUT)
+    print("connected to management: " + serMgmt.portstr)
+    initialize_databases()
+
+    loop = asyncio.get_running_loop()
+    stop = threading.Event()
+    pending = None
+    previous_s_value = None
+    try:
+        while True:
+            pending = loop.run_in_executor(None, readManagement, serMgmt, previous_s_value, stop)
+            # shield: cancelling the task leaves the future to be waited for below
+            reading = await asyncio.shield(pending)
+            if reading is None:
+                break
+            serial_data, t_value, change_detected = reading
+            previous_s_value = serial_data
+            store_reading(serial_data, t_value, change_detected)
+            await asyncio.sleep(READ_INTERVAL)
+    finally:
+        stop.set()
+        # The read returns within SERIAL_TIMEOUT, then the port can be closed
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending], timeout=SERIAL_TIMEOUT * 2)
+        flush_runs()
         serMgmt.close()
 
 if __name__ == "__main__":
+    PROFILER.install("mgmt-data-reader")
     main()
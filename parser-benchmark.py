@@ -0,0 +1,124 @@
+# PARSER BENCHMARK
+# 17.10.2026
+#
+# Measures telegram parsing speed and allocations.
+# Runs the original line based parser of sensor-reader.py (parseData) and
+# telegram_parser.parse_frame over the same frames and checks that both
+# give the same result.
+#
+# Usage:
+#   python3 parser-benchmark.py                 synthetic 3-phase frames
+#   python3 parser-benchmark.py capture.log     frames from a captured serial dump
+#
+# Reported per parser: frames/s (best of ROUNDS), allocated blocks and bytes
+# per frame (tracemalloc).
+import importlib.util
+import sys
+import time
+import tracemalloc
+
+import telegram_parser
+
+ROUNDS = 5
+SYNTHETIC_FRAMES = 2000
+
+# OBIS codes and units of the 3-phase meter example (AIDON HAN interface description 3.4.2)
+OBIS_UNITS = [
+    ("1-0:1.8.0", "kWh", "{:012.3f}"), ("1-0:2.8.0", "kWh", "{:012.3f}"),
+    ("1-0:3.8.0", "kVArh", "{:012.3f}"), ("1-0:4.8.0", "kVArh", "{:012.3f}"),
+    ("1-0:1.7.0", "kW", "{:08.3f}"), ("1-0:2.7.0", "kW", "{:08.3f}"),
+    ("1-0:3.7.0", "kVAr", "{:08.3f}"), ("1-0:4.7.0", "kVAr", "{:08.3f}"),
+    ("1-0:21.7.0", "kW", "{:08.3f}"), ("1-0:22.7.0", "kW", "{:08.3f}"),
+    ("1-0:41.7.0", "kW", "{:08.3f}"), ("1-0:42.7.0", "kW", "{:08.3f}"),
+    ("1-0:61.7.0", "kW", "{:08.3f}"), ("1-0:62.7.0", "kW", "{:08.3f}"),
+    ("1-0:23.7.0", "kVAr", "{:08.3f}"), ("1-0:24.7.0", "kVAr", "{:08.3f}"),
+    ("1-0:43.7.0", "kVAr", "{:08.3f}"), ("1-0:44.7.0", "kVAr", "{:08.3f}"),
+    ("1-0:63.7.0", "kVAr", "{:08.3f}"), ("1-0:64.7.0", "kVAr", "{:08.3f}"),
+    ("1-0:32.7.0", "V", "{:05.1f}"), ("1-0:52.7.0", "V", "{:05.1f}"),
+    ("1-0:72.7.0", "V", "{:05.1f}"), ("1-0:31.7.0", "A", "{:05.1f}"),
+    ("1-0:51.7.0", "A", "{:05.1f}"), ("1-0:71.7.0", "A", "{:05.1f}"),
+]
+
+
+def synthetic_frame(n, start=(25, 12, 1, 0, 0, 0)):
+    """Builds telegram n of a 10 s sequence."""
+    yy, mm, dd, hh, mi, ss = start
+    seconds = hh * 3600 + mi * 60 + ss + n * 10
+    days, seconds = divmod(seconds, 86400)
+    dd += days  # sequence is kept within one month by the caller
+    stamp = f"{yy:02d}{mm:02d}{dd:02d}{seconds // 3600:02d}{seconds // 60 % 60:02d}{seconds % 60:02d}"
+    lines = ["/ADN9 6534", "", f"0-0:1.0.0({stamp}W)"]
+    for i, (code, unit, fmt) in enumerate(OBIS_UNITS):
+        value = 12345.678 + n * 0.01 if unit.endswith("h") else 100.0 + (n * 7 + i * 13) % 200 / 10
+        lines.append(f"{code}({fmt.format(value)}*{unit})")
+    lines.append("!")
+    frame = "\r\n".join(lines).encode("ascii")
+    return frame + b"%04X\r\n" % telegram_parser.crc16(frame)
+
+
+def read_capture(path):
+    """Splits a captured serial dump to frames at the '/ADN9' headers."""
+    with open(path, "rb") as file:
+        data = file.read()
+    return [telegram_parser.HEADER + part for part in data.split(telegram_parser.HEADER)[1:]]
+
+
+def load_legacy_parser():
+    """Returns sensor-reader.parseData, or None if its imports are not available."""
+    spec = importlib.util.spec_from_file_location("sensor_reader", "sensor-reader.py")
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        print(f"Original parser not available ({e}), benchmarking telegram_parser only")
+        return None
+
+    def parse(frame):
+        lines = [line.decode("utf-8").strip() for line in frame.splitlines()]
+        return module.parseData(lines)
+    return parse
+
+
+def measure(name, parse, frames):
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for frame in frames:
+            parse(frame)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [parse(frame) for frame in frames]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+
+    print(f"{name:<28} {len(frames) / best:>10.0f} frames/s  "
+          f"{blocks / len(frames):>7.1f} blocks/frame  {size / len(frames):>8.0f} bytes/frame")
+    return results
+
+
+def main():
+    if len(sys.argv) > 1:
+        frames = read_capture(sys.argv[1])
+        print(f"{sys.argv[1]}: {len(frames)} frames")
+    else:
+        frames = [synthetic_frame(n) for n in range(SYNTHETIC_FRAMES)]
+        print(f"Synthetic: {len(frames)} frames, {len(OBIS_UNITS)} values each")
+
+    telegrams = measure("telegram_parser", telegram_parser.parse_frame, frames)
+    measure("telegram_parser + as_dict", lambda f: telegram_parser.parse_frame(f).as_dict(), frames)
+
+    legacy = load_legacy_parser()
+    if legacy is not None:
+        expected = measure("sensor-reader parseData", legacy, frames)
+        mismatches = sum(1 for t, e in zip(telegrams, expected) if t.as_dict() != e)
+        print(f"Results differing from parseData: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,619 @@
+# REPLAY HARNESS
+# 17.10.2026
+#
+# End-to-end test and benchmark without the serial ports. Pseudo-terminals
+# stand in for /dev/ttyS0 (HAN) and /dev/ttyS4 (management): the reader
+# scripts are run unchanged as child processes in a work directory, their
+# serial.Serial() of the real port is redirected to the pty.
+#
+# The harness writes synthetic or recorded '/ADN9' telegrams (and S/T
+# management lines) to the ptys at real time or faster, optionally with
+# flipped bytes (CRC errors) and cut off frames. The writes don't block:
+# what the pty can't take is lost like in a UART overrun (with --speed 0
+# the harness waits for the reader instead). Meanwhile it
+# watches the databases (PRAGMA data_version) and polls han-api with
+# concurrent clients. Reported:
+#   sensor  frames/s, wire to commit latency percentiles (last byte written
+#           to the row visible to a reader), missing and rejected frames
+#   mgmt    readings stored, latency from the T line to the stored reading
+#           (the reader takes one every READ_INTERVAL, also when accelerated)
+#   api     requests, errors and latency percentiles per endpoint
+#
+# Usage:
+#   python3 replay-harness.py                                300 telegrams at 10 x real time
+#   python3 replay-harness.py --frames 5000 --speed 0        as fast as the reader takes them
+#   python3 replay-harness.py --capture dump.log --speed 1   recorded telegrams, real time
+#   python3 replay-harness.py --noise 0.05 --truncate 0.02 --mgmt --clients 4
+# Settings of the readers (PIPELINE, COMMIT_FRAMES, ...) are the ones in
+# their scripts, as when deployed.
+import argparse
+import importlib.util
+import os
+import random
+import re
+import runpy
+import select
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import telegram_parser
+from metrics import read_snapshots
+from sensor_store import live_path
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SENSOR_SCRIPT = "sensor-reader.py"
+SENSOR_PORT = "/dev/ttyS0"
+SENSOR_DB = "sensor_data.db"
+MGMT_SCRIPT = "mgmt-data-reader.py"
+MGMT_PORT = "/dev/ttyS4"
+MGMT_DB = "mgmt_data.db"
+# Telegram period of the meter, seconds
+TELEGRAM_INTERVAL = 10
+# Management line period of the device, seconds
+MGMT_INTERVAL = 2
+API_PORT = 5092
+API_ENDPOINTS = [
+    "/api/sensor_data?count=1",
+    "/api/sensor_values?obis=1-0:1.7.0&count=60",
+    "/api/sensor_15min_data?count=96",
+    "/api/consumption?bucket=day",
+]
+# Seconds between database polls of the latency watchers
+WATCH_POLL = 0.002
+# Seconds to wait for the last frames to be committed
+DRAIN_TIME = 5
+STARTUP_TIMEOUT = 30
+
+
+def load_benchmark():
+    """parser-benchmark.py for its OBIS_UNITS and read_capture."""
+    spec = importlib.util.spec_from_file_location("parser_benchmark", os.path.join(HERE, "parser-benchmark.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def telegram_stamp(timestamp):
+    """'yymmddhhmmss' of a unix timestamp in the meter's local time."""
+    local = datetime.fromtimestamp(timestamp + telegram_parser.UTC_OFFSET, timezone.utc)
+    return local.strftime("%y%m%d%H%M%S")
+
+
+def with_crc(body):
+    """Frame from '/' to '!' inclusive, CRC16 line appended."""
+    return body + b"%04X\r\n" % telegram_parser.crc16(body)
+
+
+def synthetic_telegram(units, n, timestamp):
+    """Telegram n of a 10 s sequence, values as in parser-benchmark.py."""
+    lines = ["/ADN9 6534", "", f"0-0:1.0.0({telegram_stamp(timestamp)}W)"]
+    for i, (code, unit, fmt) in enumerate(units):
+        value = 12345.678 + n * 0.01 if unit.endswith("h") else 100.0 + (n * 7 + i * 13) % 200 / 10
+        lines.append(f"{code}({fmt.format(value)}*{unit})")
+    lines.append("!")
+    return with_crc("\r\n".join(lines).encode("ascii"))
+
+
+def retime(frame, timestamp):
+    """A recorded telegram with a new timestamp and CRC."""
+    end = frame.rfind(b"!")
+    body = re.sub(rb"0-0:1\.0\.0\(\d{12}", b"0-0:1.0.0(" + telegram_stamp(timestamp).encode(),
+                  frame[:end + 1], count=1)
+    return with_crc(body)
+
+
+def add_noise(frame, rng):
+    """Replaces one digit after the header with another one, the CRC no longer matches."""
+    digits = [i for i in range(len(telegram_parser.HEADER), frame.rfind(b"!")) if 48 <= frame[i] <= 57]
+    position = rng.choice(digits)
+    replacement = (frame[position] - 48 + rng.randint(1, 9)) % 10 + 48
+    return frame[:position] + bytes([replacement]) + frame[position + 1:]
+
+
+def truncate(frame, rng):
+    """Frame cut off before its '!' line."""
+    return frame[:rng.randint(len(telegram_parser.HEADER), frame.rfind(b"!") - 1)]
+
+
+def percentiles(values):
+    """'p50 / p90 / p99 / max' in milliseconds."""
+    if not values:
+        return "no samples"
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(p * len(values)))] * 1000
+    return (f"p50 {pick(0.50):.1f}  p90 {pick(0.90):.1f}  p99 {pick(0.99):.1f}  "
+            f"max {values[-1] * 1000:.1f} ms")
+
+
+def open_pty():
+    """
+    Returns (master fd, slave fd, slave path). The slave is kept open by
+    the harness too, so writes never fail while the reader reopens it.
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)
+    return master, slave, os.ttyname(slave)
+
+
+class PtyWriter:
+    """Non-blocking writes to a pty master, what does not fit is lost (overrun)."""
+
+    def __init__(self, master, baud=0, wait=False):
+        """
+        Args:
+            baud (int): Pacing, 10 bits per byte on the wire, 0 none.
+            wait (bool): Wait until the reader has taken the bytes
+                instead of dropping them (for throughput runs).
+        """
+        self.master = master
+        self.byte_time = 10 / baud if baud else 0
+        self.wait = wait
+        self.bytes_written = 0
+        self.bytes_lost = 0
+
+    def write(self, data):
+        """
+        Returns:
+            bool: True if all bytes were written.
+        """
+        if self.byte_time:
+            # Paced in chunks like a UART of the given speed
+            complete = True
+            for i in range(0, len(data), 64):
+                chunk = data[i:i + 64]
+                complete = self.write_now(chunk) and complete
+                time.sleep(len(chunk) * self.byte_time)
+            return complete
+        return self.write_now(data)
+
+    def write_now(self, data):
+        written = 0
+        while written < len(data):
+            try:
+                written += os.write(self.master, data[written:])
+            except BlockingIOError:
+                if not self.wait:
+                    break
+                select.select([], [self.master], [], 1)
+        self.bytes_written += written
+        self.bytes_lost += len(data) - written
+        return written == len(data)
+
+
+class Watcher(threading.Thread):
+    """
+    Polls PRAGMA data_version of a database and calls on_change(conn, seen)
+    with a read-only connection after each change.
+    """
+
+    def __init__(self, db_file, on_change, poll=WATCH_POLL):
+        super().__init__(daemon=True)
+        self.db_file = db_file
+        self.on_change = on_change
+        self.poll = poll
+        self.stopped = threading.Event()
+
+    def connect(self):
+        while not self.stopped.is_set():
+            path = live_path(self.db_file)
+            if os.path.exists(path):
+                try:
+                    conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+                    conn.execute("SELECT 1 FROM data LIMIT 1")
+                    return conn
+                except sqlite3.Error:
+                    pass
+            time.sleep(0.05)
+        return None
+
+    def run(self):
+        conn = self.connect()
+        if conn is None:
+            return
+        version = None
+        while not self.stopped.is_set():
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current != version:
+                    version = current
+                    self.on_change(conn, time.monotonic())
+            except sqlite3.Error:
+                pass
+            time.sleep(self.poll)
+        conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class SensorReplay:
+    """Telegrams to the HAN pty, their commit times from sensor_data.db."""
+
+    def __init__(self, args, workdir, rng):
+        self.args = args
+        self.rng = rng
+        self.master, self.slave, self.path = open_pty()
+        self.writer = PtyWriter(self.master, args.baud, wait=not args.speed)
+        self.sent = {}
+        self.committed = {}
+        self.noisy = 0
+        self.truncated = 0
+        self.overrun = 0
+        self.last_seen = 0
+        self.watcher = Watcher(os.path.join(workdir, SENSOR_DB), self.check_commits)
+
+    def frames(self):
+        """
+        (timestamp, frame) pairs from now on at 10 s spacing, ahead of the
+        clock when accelerated: back dated telegrams would be removed by the
+        reader's raw store retention before they are seen.
+        """
+        benchmark = load_benchmark()
+        if self.args.capture:
+            recorded = benchmark.read_capture(self.args.capture)
+            count = self.args.frames or len(recorded)
+            start = int(time.time())
+            for n in range(count):
+                timestamp = start + n * TELEGRAM_INTERVAL
+                yield timestamp, retime(recorded[n % len(recorded)], timestamp)
+        else:
+            count = self.args.frames
+            start = int(time.time())
+            for n in range(count):
+                timestamp = start + n * TELEGRAM_INTERVAL
+                yield timestamp, synthetic_telegram(benchmark.OBIS_UNITS, n, timestamp)
+
+    def check_commits(self, conn, seen):
+        rows = conn.execute("SELECT timestamp FROM data WHERE timestamp > ? ORDER BY timestamp",
+                            (self.last_seen,)).fetchall()
+        for (timestamp,) in rows:
+            self.committed.setdefault(timestamp, seen)
+        if rows:
+            self.last_seen = rows[-1][0]
+
+    def run(self, stop):
+        """Writes the frames at the requested speed."""
+        interval = TELEGRAM_INTERVAL / self.args.speed if self.args.speed else 0
+        self.started = time.monotonic()
+        next_time = self.started
+        for timestamp, frame in self.frames():
+            if stop.is_set():
+                break
+            if self.rng.random() < self.args.noise:
+                frame = add_noise(frame, self.rng)
+                self.noisy += 1
+                intact = False
+            elif self.rng.random() < self.args.truncate:
+                frame = truncate(frame, self.rng)
+                self.truncated += 1
+                intact = False
+            else:
+                intact = True
+            complete = self.writer.write(frame)
+            if intact and complete:
+                self.sent[timestamp] = time.monotonic()
+            elif intact:
+                self.overrun += 1
+            if interval:
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.monotonic()))
+        self.finished = time.monotonic()
+
+    def report(self):
+        latencies = [self.committed[t] - sent for t, sent in self.sent.items() if t in self.committed]
+        missing = len(self.sent) - len(latencies)
+        print(f"Sensor: {len(self.sent) + self.noisy + self.truncated + self.overrun} frames written "
+              f"in {self.finished - self.started:.1f} s, {self.noisy} with noise, "
+              f"{self.truncated} truncated, {self.overrun} lost in pty overrun")
+        if latencies:
+            last_commit = max(self.committed[t] for t in self.sent if t in self.committed)
+            print(f"  stored {len(latencies)}, missing {missing}, "
+                  f"sustained {len(latencies) / (last_commit - self.started):.1f} frames/s")
+        print(f"  wire to commit  {percentiles(latencies)}")
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class MgmtReplay:
+    """S/T lines to the management pty, stored readings from mgmt_data.db."""
+
+    def __init__(self, args, workdir, rng):
+        self.args = args
+        self.rng = rng
+        self.master, self.slave, self.path = open_pty()
+        self.writer = PtyWriter(self.master)
+        # (monotonic time, line number) of the written T lines
+        self.t_lines = []
+        self.stored = []
+        self.last_seq = None
+        self.watcher = Watcher(os.path.join(workdir, MGMT_DB), self.check_readings)
+
+    def check_readings(self, conn, seen):
+        try:
+            seq = conn.execute("SELECT MAX(seq) FROM ring").fetchone()[0]
+        except sqlite3.Error:
+            return
+        if seq is None or seq == self.last_seq:
+            return
+        # Latency from the newest T line written before the reading was seen
+        written = [t for t, _ in self.t_lines if t <= seen]
+        if written:
+            self.stored.append(seen - written[-1])
+        self.last_seq = seq
+
+    def run(self, stop):
+        interval = MGMT_INTERVAL / self.args.speed if self.args.speed else 0.01
+        state = 0
+        n = 0
+        while not stop.is_set():
+            if self.rng.random() < 0.1:
+                state ^= 1
+            self.writer.write(f"S{state}{state ^ 1}\r\n".encode())
+            self.writer.write(f"T{20 + n % 5}.{n % 10}\r\n".encode())
+            self.t_lines.append((time.monotonic(), n))
+            n += 1
+            stop.wait(interval)
+
+    def report(self):
+        print(f"Mgmt: {len(self.t_lines)} S/T pairs written, {len(self.stored)} readings stored")
+        print(f"  T line to stored  {percentiles(self.stored)}")
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class ApiLoad:
+    """Clients polling han-api endpoints in parallel."""
+
+    def __init__(self, port, clients, interval, endpoints=API_ENDPOINTS):
+        self.base = f"http://127.0.0.1:{port}"
+        self.clients = clients
+        self.interval = interval
+        self.endpoints = endpoints
+        self.lock = threading.Lock()
+        # endpoint: [latencies, errors]
+        self.results = {endpoint: [[], 0] for endpoint in endpoints}
+
+    def wait_ready(self, timeout=STARTUP_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(self.base + "/api/metrics", timeout=1).read()
+                return True
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        return False
+
+    def client(self, index, stop):
+        n = index
+        while not stop.is_set():
+            endpoint = self.endpoints[n % len(self.endpoints)]
+            n += 1
+            started = time.perf_counter()
+            try:
+                urllib.request.urlopen(self.base + endpoint, timeout=10).read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if ok:
+                    self.results[endpoint][0].append(elapsed)
+                else:
+                    self.results[endpoint][1] += 1
+            stop.wait(self.interval)
+
+    def start(self, stop):
+        self.threads = [threading.Thread(target=self.client, args=(i, stop), daemon=True)
+                        for i in range(self.clients)]
+        for thread in self.threads:
+            thread.start()
+
+    def report(self):
+        print(f"API: {self.clients} clients, {self.interval} s between requests")
+        for endpoint, (latencies, errors) in self.results.items():
+            print(f"  {endpoint:<45} {len(latencies):>5} ok {errors:>3} errors  {percentiles(latencies)}")
+
+
+def start_child(workdir, name, *arguments):
+    """Runs this script in child mode in workdir, output to name.log."""
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    # Unbuffered, wait_for_log() sees the lines when they are printed
+    environment = dict(os.environ, PYTHONUNBUFFERED="1")
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *arguments],
+                               cwd=workdir, stdout=log, stderr=subprocess.STDOUT, env=environment)
+    process.log_path = log.name
+    log.close()
+    return process
+
+
+def wait_for_log(process, text, timeout=STARTUP_TIMEOUT):
+    """Waits until the child has printed text, e.g. that its port is open."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with open(process.log_path, errors="replace") as file:
+            if text in file.read():
+                return True
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    return False
+
+
+def stop_child(process, timeout=10):
+    """SIGINT (KeyboardInterrupt) lets the reader commit and close its databases."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def reader_metrics(workdir, process_name):
+    """Values of the reader's last metrics snapshot by name, histograms as (count, sum)."""
+    values = {}
+    for snapshot in read_snapshots(os.path.join(workdir, "metrics")):
+        if snapshot["process"] != process_name:
+            continue
+        for metric in snapshot["metrics"]:
+            if metric["type"] == "histogram":
+                values[metric["name"]] = (metric["count"], metric["sum"])
+            else:
+                values[metric["name"]] = metric["value"]
+    return values
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="han-replay-")
+    os.makedirs(workdir, exist_ok=True)
+    rng = random.Random(args.seed)
+    print(f"Work directory {workdir}")
+    stop = threading.Event()
+    children = []
+    sensor = SensorReplay(args, workdir, rng)
+    mgmt = MgmtReplay(args, workdir, rng) if args.mgmt else None
+    try:
+        reader = start_child(workdir, "sensor-reader", "--child", SENSOR_SCRIPT, f"{SENSOR_PORT}={sensor.path}")
+        children.append(reader)
+        if not wait_for_log(reader, "Connected to serial port"):
+            sys.exit(f"sensor-reader did not start, see {reader.log_path}")
+        sensor.watcher.start()
+        if mgmt is not None:
+            mgmt_reader = start_child(workdir, "mgmt-data-reader", "--child", MGMT_SCRIPT, f"{MGMT_PORT}={mgmt.path}")
+            children.append(mgmt_reader)
+            if not wait_for_log(mgmt_reader, "connected to management"):
+                sys.exit(f"mgmt-data-reader did not start, see {mgmt_reader.log_path}")
+            mgmt.watcher.start()
+            threading.Thread(target=mgmt.run, args=(stop,), daemon=True).start()
+        api = None
+        if args.clients:
+            children.append(start_child(workdir, "han-api", "--child-api", str(args.api_port)))
+            api = ApiLoad(args.api_port, args.clients, args.poll)
+            if not api.wait_ready():
+                sys.exit(f"han-api did not start, see {children[-1].log_path}")
+            api.start(stop)
+        # The reader clears its input buffer after opening the port
+        time.sleep(0.5)
+
+        try:
+            sensor.run(stop)
+            # Until the last intact frame is committed or DRAIN_TIME has passed
+            deadline = time.monotonic() + DRAIN_TIME
+            while time.monotonic() < deadline and not set(sensor.sent) <= set(sensor.committed):
+                time.sleep(0.05)
+        except KeyboardInterrupt:
+            print("Interrupted, reporting the frames written so far")
+            sensor.finished = time.monotonic()
+        stop.set()
+        for child in children:
+            stop_child(child)
+        sensor.watcher.stop()
+        if mgmt is not None:
+            mgmt.watcher.stop()
+
+        sensor.report()
+        metrics = reader_metrics(workdir, "sensor-reader")
+        if metrics:
+            print(f"  reader: frames {metrics.get('sensor_assembler_frames', 0)}, "
+                  f"corrupt {metrics.get('sensor_assembler_corrupt', 0)}, "
+                  f"dropped {metrics.get('sensor_assembler_dropped', 0)}, errors "
+                  f"{metrics.get('sensor_frame_errors_total', 0)}")
+            count, total = metrics.get("sensor_commit_latency_seconds", (0, 0))
+            if count:
+                print(f"  reader: receive to commit avg {total / count * 1000:.1f} ms over {count} frames")
+        if sensor.writer.bytes_lost:
+            print(f"  pty overrun: {sensor.writer.bytes_lost} bytes lost")
+        if mgmt is not None:
+            mgmt.report()
+        if api is not None:
+            api.report()
+    finally:
+        stop.set()
+        for child in children:
+            stop_child(child)
+        sensor.close()
+        if mgmt is not None:
+            mgmt.close()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_child(script, redirects):
+    """
+    Child mode: runs a reader script as __main__ with serial.Serial of the
+    real ports opened on the ptys. The final metrics snapshot is written
+    after the script has returned from KeyboardInterrupt.
+    """
+    import serial
+    ports = dict(redirect.split("=", 1) for redirect in redirects)
+
+    class RedirectedSerial(serial.Serial):
+        def __init__(self, port=None, *args, **kwargs):
+            super().__init__(ports.get(port, port), *args, **kwargs)
+
+    serial.Serial = RedirectedSerial
+    path = os.path.join(HERE, script)
+    sys.argv = [path]
+    script_globals = runpy.run_path(path, run_name="__main__")
+    registry = script_globals.get("METRICS")
+    if registry is not None:
+        registry.last_write = float("-inf")
+        registry.maybe_write()
+
+
+def run_child_api(port):
+    """Child mode: han-api on 127.0.0.1:port, without the debugger."""
+    spec = importlib.util.spec_from_file_location("han_api", os.path.join(HERE, "han-api.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    try:
+        module.app.run(host="127.0.0.1", port=port, threaded=True, use_reloader=False)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3:])
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == "--child-api":
+        run_child_api(int(sys.argv[2]))
+        return
+    parser = argparse.ArgumentParser(description="Replays telegrams to the readers through ptys")
+    parser.add_argument("--frames", type=int, default=300, help="telegrams to send (default 300)")
+    parser.add_argument("--capture", help="captured serial dump, split at '/ADN9' and retimed")
+    parser.add_argument("--speed", type=float, default=10,
+                        help="times real time (1 = a telegram per 10 s), 0 = no waiting")
+    parser.add_argument("--baud", type=int, default=0, help="pace the bytes like a UART of this speed")
+    parser.add_argument("--noise", type=float, default=0.0, help="share of frames with a wrong digit")
+    parser.add_argument("--truncate", type=float, default=0.0, help="share of frames cut off")
+    parser.add_argument("--mgmt", action="store_true", help="also run mgmt-data-reader with S/T lines")
+    parser.add_argument("--clients", type=int, default=0, help="concurrent han-api clients")
+    parser.add_argument("--poll", type=float, default=0.1, help="seconds between a client's requests")
+    parser.add_argument("--api-port", type=int, default=API_PORT)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="directory for the databases (default a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
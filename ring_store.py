@@ -0,0 +1,125 @@
+# RING STORE
+# 17.10.2026
+#
+# Bounded history tables for mgmt-data-reader.py and gpio-switch-reader.py.
+# Rows are kept in `capacity` fixed slots of the table 'ring', a write is
+# one UPSERT into slot seq % capacity, so the newest row overwrites the
+# oldest one. No COUNT(*) or DELETE per write, the table never grows.
+#
+# The view 'data' shows the stored rows with the original columns, so
+# han-api.py and watchdog.py read the database as before.
+#
+# An old style 'data' table is converted at open (newest capacity rows kept),
+# and the slots are renumbered if the capacity has been changed.
+#
+# The timestamp column is unique like the primary key of the old table, the
+# keyset cursors of han-api.py page on it alone. A row with the timestamp of
+# a stored row (the clock stepped back) replaces that row.
+import sqlite3
+
+DEFAULT_CAPACITY = 30
+
+
+class RingTable:
+    """Fixed-capacity history table in one database file."""
+
+    def __init__(self, db_file, columns, capacity=DEFAULT_CAPACITY):
+        """
+        Args:
+            db_file (str): Database file, created if missing.
+            columns (list): (name, type) pairs, the first one is the
+                timestamp column, e.g. [("timestamp", "INTEGER"), ("data", "TEXT")].
+            capacity (int): Number of slots (rows kept).
+        """
+        self.db_file = db_file
+        self.columns = [name for name, _ in columns]
+        self.capacity = max(1, int(capacity))
+        # isolation_level=None: each UPSERT is committed on its own.
+        # Used by one task at a time, but from executor threads under supervisor.py
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.create(columns)
+        self.next_seq = self.conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM ring").fetchone()[0]
+        names = ", ".join(self.columns)
+        values = ", ".join("?" for _ in self.columns)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in ["seq", *self.columns])
+        self.upsert = (f"INSERT INTO ring (slot, seq, {names}) VALUES (?, ?, {values}) "
+                       f"ON CONFLICT(slot) DO UPDATE SET {updates}")
+
+    def create(self, columns):
+        """Creates the ring table and the data view, converts an old data table."""
+        timestamp = self.columns[0]
+        definitions = ", ".join(f"{name} {column_type}" for name, column_type in columns)
+        names = ", ".join(self.columns)
+        old_table = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'data'").fetchone()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS ring (
+                    slot INTEGER PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    {definitions}
+                )
+            """)
+            if old_table:
+                # seq in timestamp order, only the newest capacity rows are kept
+                self.conn.execute(f"""
+                    INSERT INTO ring (slot, seq, {names})
+                    SELECT -1 - seq, seq, {names} FROM (
+                        SELECT ROW_NUMBER() OVER (ORDER BY {timestamp}) - 1 AS seq, {names}
+                        FROM data
+                    ) ORDER BY seq DESC LIMIT ?
+                """, (self.capacity,))
+                self.conn.execute("DROP TABLE data")
+                print(f"{self.db_file}: data table converted to {self.capacity} ring slots")
+            # Rings created with a non-unique index: the newest row of a timestamp is kept
+            self.conn.execute(f"""
+                DELETE FROM ring WHERE seq NOT IN (SELECT MAX(seq) FROM ring GROUP BY {timestamp})
+            """)
+            self.conn.execute(f"DROP INDEX IF EXISTS ring_{timestamp}")
+            self.conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS ring_{timestamp}_key ON ring ({timestamp})")
+            self.conn.execute(f"CREATE VIEW IF NOT EXISTS data AS SELECT {names} FROM ring")
+            self.resize()
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def resize(self):
+        """Moves the rows to slot seq % capacity, drops the oldest over capacity."""
+        misplaced = self.conn.execute(
+            "SELECT 1 FROM ring WHERE slot != seq % ? LIMIT 1", (self.capacity,)).fetchone()
+        if misplaced is None:
+            return
+        self.conn.execute("""
+            DELETE FROM ring WHERE seq <= (SELECT MAX(seq) FROM ring) - ?
+        """, (self.capacity,))
+        # Through negative slots, two rows never share a slot in between
+        self.conn.execute("UPDATE ring SET slot = -1 - seq % ?", (self.capacity,))
+        self.conn.execute("UPDATE ring SET slot = -1 - slot")
+
+    def append(self, *values):
+        """Stores one row (values in column order) over the oldest slot."""
+        seq = self.next_seq
+        try:
+            self.conn.execute(self.upsert, (seq % self.capacity, seq, *values))
+        except sqlite3.IntegrityError:
+            # The timestamp is stored in another slot, the new row replaces it
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(f"DELETE FROM ring WHERE {self.columns[0]} = ?", (values[0],))
+                self.conn.execute(self.upsert, (seq % self.capacity, seq, *values))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        self.next_seq = seq + 1
+
+    def latest(self):
+        """Newest row as a tuple of the columns, None if empty."""
+        return self.conn.execute(
+            f"SELECT {', '.join(self.columns)} FROM ring ORDER BY seq DESC LIMIT 1").fetchone()
+
+    def close(self):
+        self.conn.close()
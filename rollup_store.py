@@ -0,0 +1,371 @@
+# ROLLUP STORE
+# 17.10.2026
+#
+# Incremental energy rollups for sensor-reader.py. Every telegram's total
+# energy (1-0:1.8.0) is compared to the next quarter boundary (:00, :15,
+# :30, :45). When a telegram crosses one, the total at the exact boundary
+# is interpolated between the telegrams on both sides and written to the
+# 15-min and history databases, and the quarter's consumption is added to
+# the hourly, daily and monthly tables. A telegram that crosses no boundary
+# costs two comparisons, a quarter five single row writes.
+#
+# Missed boundaries are filled in the same way: after a break the first
+# telegram interpolates every quarter since the last written one (the meter
+# total is cumulative, so the sum over the gap is exact, only its division
+# into quarters is estimated). At start the telegrams still in the raw
+# store (sensor_data.db) are replayed from the last written quarter.
+#
+# The in-memory state follows the writer's frames: begin_frame() saves it,
+# abort_frame() restores it when the frame's SQL is rolled back, so a
+# failed telegram can be written again.
+#
+# Tables 'hourly', 'daily' and 'monthly' in sensor_data_15min.db:
+# timestamp = start of the hour/day/month (local time for days and months),
+# consumed_energy = sum of its quarters, total_energy = meter total at the
+# end of its newest quarter, quarters = number of quarters summed.
+# A 15-min row holds the quarter ending at its timestamp.
+#
+# PhaseStats: average, minimum and maximum of the per-phase power, current
+# and voltage values (PHASE_CODES) per quarter, table 'phases' in the same
+# database, one row per code and quarter. The open quarter is kept in memory
+# and written when the first telegram of the next one arrives.
+import json
+from datetime import datetime
+
+QUARTER = 900
+TOTAL_ENERGY_KEY = "1-0:1.8.0"
+# Quarters with a longer break between the telegrams around them are counted as backfilled
+BACKFILL_GAP = QUARTER
+ROLLUP_TABLES = ("hourly", "daily", "monthly")
+# Active power import, current and voltage of L1, L2 and L3
+PHASE_CODES = (
+    "1-0:21.7.0", "1-0:41.7.0", "1-0:61.7.0",
+    "1-0:31.7.0", "1-0:51.7.0", "1-0:71.7.0",
+    "1-0:32.7.0", "1-0:52.7.0", "1-0:72.7.0",
+)
+
+
+def total_energy(values):
+    """Total energy (kWh) of parsed telegram values, None if missing."""
+    return next((item["value"] for item in values if item["key"] == TOTAL_ENERGY_KEY), None)
+
+
+def hour_start(timestamp):
+    return timestamp - timestamp % 3600
+
+
+def day_start(timestamp):
+    local = datetime.fromtimestamp(timestamp)
+    return int(datetime(local.year, local.month, local.day).timestamp())
+
+
+def month_start(timestamp):
+    local = datetime.fromtimestamp(timestamp)
+    return int(datetime(local.year, local.month, 1).timestamp())
+
+
+class EnergyRollup:
+    """15-min rows and hourly/daily/monthly rollups, kept up to date per telegram."""
+
+    def __init__(self, writer, keep=None):
+        """
+        Args:
+            writer (SensorWriter): Writer whose transaction is used, with the
+                15-min database attached as 'h15' and the history one as 'history'.
+            keep (int): 15-min and history rows older than this many seconds
+                (e.g. from a long break) are only added to the rollups.
+        """
+        self.writer = writer
+        self.keep = keep
+        # (timestamp, total) of the newest written quarter and of the newest telegram
+        self.boundary = None
+        self.last_point = None
+        # Oldest quarter backfilled since pop_backfill_start()
+        self.backfill_start = None
+        # State at begin_frame()
+        self.saved = None
+        # Metrics
+        self.telegrams = 0
+        self.quarters = 0
+        self.backfilled = 0
+        self.resets = 0
+
+    def begin_frame(self):
+        """Saves the state, called with SensorWriter.begin_frame()."""
+        self.saved = (self.boundary, self.last_point, self.backfill_start,
+                      self.telegrams, self.quarters, self.backfilled, self.resets)
+
+    def abort_frame(self):
+        """Restores the state saved by begin_frame(), the frame's rows were rolled back."""
+        if self.saved is not None:
+            (self.boundary, self.last_point, self.backfill_start,
+             self.telegrams, self.quarters, self.backfilled, self.resets) = self.saved
+            self.saved = None
+
+    def initialize_schema(self):
+        """Creates the rollup tables, fills them from the 15-min rows when new."""
+        for table in ROLLUP_TABLES:
+            self.writer.execute(f"""
+                CREATE TABLE IF NOT EXISTS h15.{table} (
+                    timestamp INTEGER PRIMARY KEY,
+                    consumed_energy REAL,
+                    total_energy REAL,
+                    quarters INTEGER NOT NULL
+                )
+            """)
+        empty = all(self.writer.query_one(f"SELECT 1 FROM h15.{table} LIMIT 1") is None
+                    for table in ROLLUP_TABLES)
+        if empty:
+            self.rebuild()
+        self.writer.commit()
+
+    def rebuild(self):
+        """Rollups of the existing 15-min rows, one scan, run when the tables are created."""
+        # Rows written before the rollups may be a few seconds past the boundary
+        quarter = f"(timestamp - timestamp % {QUARTER} - {QUARTER})"
+        buckets = {
+            "hourly": f"({quarter} - {quarter} % 3600)",
+            "daily": f"CAST(strftime('%s', {quarter}, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)",
+            "monthly": f"CAST(strftime('%s', {quarter}, 'unixepoch', 'localtime', 'start of month', 'utc') AS INTEGER)",
+        }
+        for table, bucket in buckets.items():
+            # total_energy: bare column, from the row of MAX(timestamp)
+            self.writer.execute(f"""
+                INSERT INTO h15.{table} (timestamp, consumed_energy, total_energy, quarters)
+                SELECT bucket, consumed_energy, total_energy, quarters FROM (
+                    SELECT {bucket} AS bucket, ROUND(SUM(consumed_energy), 3) AS consumed_energy,
+                           total_energy, COUNT(*) AS quarters, MAX(timestamp)
+                    FROM h15.data WHERE consumed_energy IS NOT NULL
+                    GROUP BY bucket
+                )
+            """)
+
+    def load(self):
+        """Continues from the newest committed 15-min row, e.g. after a restart or rollback."""
+        row = self.writer.query_one(
+            "SELECT timestamp, total_energy FROM h15.data ORDER BY timestamp DESC LIMIT 1")
+        self.boundary = tuple(row) if row is not None and row[1] is not None else None
+        self.last_point = None
+
+    def replay(self):
+        """
+        Feeds the raw store telegrams newer than the last written quarter
+        through add(), so quarters missed before a restart are written.
+
+        Returns:
+            int: Number of quarters written.
+        """
+        since = self.boundary[0] if self.boundary is not None else -1
+        rows = self.writer.conn.execute(
+            "SELECT timestamp, sensor_data FROM main.data WHERE timestamp > ? ORDER BY timestamp",
+            (since,)).fetchall()
+        written = 0
+        for timestamp, sensor_data in rows:
+            total = total_energy(json.loads(sensor_data))
+            if total is not None:
+                written += self.add(timestamp, total)
+        return written
+
+    def add(self, timestamp, total):
+        """
+        Handles the total energy of one telegram. If the frame is rolled
+        back, abort_frame() undoes the state change.
+
+        Returns:
+            int: Number of quarters written.
+        """
+        self.telegrams += 1
+        previous = self.last_point or self.boundary
+        if previous is None:
+            self.last_point = (timestamp, total)
+            return 0
+        previous_ts, previous_total = previous
+        if timestamp <= previous_ts:
+            return 0
+        if total < previous_total:
+            # Meter reset or replaced, start over from this telegram
+            self.resets += 1
+            self.boundary = self.last_point = (timestamp, total)
+            return 0
+        boundary = self.boundary
+        written = 0
+        quarter = previous_ts - previous_ts % QUARTER + QUARTER
+        span = timestamp - previous_ts
+        while quarter <= timestamp:
+            quarter_total = round(previous_total + (total - previous_total) * (quarter - previous_ts) / span, 3)
+            consumed = None
+            if boundary is not None:
+                consumed = round(quarter_total - boundary[1], 3)
+                if consumed < 0:
+                    consumed = None
+            self.write_quarter(quarter, quarter_total, consumed, timestamp)
+            boundary = (quarter, quarter_total)
+            written += 1
+            quarter += QUARTER
+        self.boundary = boundary
+        self.last_point = (timestamp, total)
+        self.quarters += written
+        if span > BACKFILL_GAP and written:
+            self.backfilled += written
+            first = previous_ts - previous_ts % QUARTER + QUARTER
+            if self.backfill_start is None or first < self.backfill_start:
+                self.backfill_start = first
+        return written
+
+    def pop_backfill_start(self):
+        """
+        Oldest quarter backfilled after a break since the previous call, None
+        if none. Its day may have been archived already (archive_store.py).
+        """
+        start, self.backfill_start = self.backfill_start, None
+        return start
+
+    def write_quarter(self, quarter, quarter_total, consumed, now):
+        """15-min and history rows of one quarter, its consumption to the rollups."""
+        if self.keep is None or quarter >= now - self.keep:
+            self.writer.insert_history(quarter, quarter_total)
+            if not self.writer.insert_15min(quarter, quarter_total, consumed):
+                # Written before (e.g. replayed twice), already in the rollups
+                return
+        if consumed is None:
+            return
+        # The quarter ending at 'quarter' belongs to the hour/day/month it started in
+        started = quarter - QUARTER
+        for table, bucket in (("hourly", hour_start(started)), ("daily", day_start(started)),
+                              ("monthly", month_start(started))):
+            self.writer.execute(f"""
+                INSERT INTO h15.{table} (timestamp, consumed_energy, total_energy, quarters)
+                VALUES (?, ?, ?, 1)
+                ON CONFLICT(timestamp) DO UPDATE SET
+                    consumed_energy = ROUND(consumed_energy + excluded.consumed_energy, 3),
+                    total_energy = excluded.total_energy,
+                    quarters = quarters + 1
+            """, (bucket, consumed, quarter_total))
+
+    def metrics(self):
+        return {
+            "telegrams": self.telegrams,
+            "quarters": self.quarters,
+            "backfilled": self.backfilled,
+            "resets": self.resets,
+        }
+
+
+def quarter_end(timestamp):
+    """End of the quarter a telegram belongs to, quarters are (end - QUARTER, end]."""
+    return -(-timestamp // QUARTER) * QUARTER
+
+
+class PhaseStats:
+    """Per quarter statistics of the per-phase values."""
+
+    def __init__(self, writer, codes=PHASE_CODES):
+        """
+        Args:
+            writer (SensorWriter): Writer whose transaction is used, with the
+                15-min database attached as 'h15'.
+            codes (tuple): OBIS codes to collect.
+        """
+        self.writer = writer
+        self.codes = frozenset(codes)
+        # Quarter end and {code: [sum, min, max, samples]} of the open quarter
+        self.quarter = None
+        self.stats = {}
+        self.last_written = None
+        # State at begin_frame()
+        self.saved = None
+        # Metrics
+        self.telegrams = 0
+        self.rows = 0
+
+    def begin_frame(self):
+        """Saves the state, called with SensorWriter.begin_frame()."""
+        stats = {code: list(values) for code, values in self.stats.items()}
+        self.saved = (self.quarter, stats, self.last_written, self.telegrams, self.rows)
+
+    def abort_frame(self):
+        """Restores the state saved by begin_frame(), the frame's rows were rolled back."""
+        if self.saved is not None:
+            self.quarter, self.stats, self.last_written, self.telegrams, self.rows = self.saved
+            self.saved = None
+
+    def initialize_schema(self):
+        # (obis, timestamp) key: one code over a time range is a range scan
+        self.writer.execute("""
+            CREATE TABLE IF NOT EXISTS h15.phases (
+                timestamp INTEGER NOT NULL,
+                obis TEXT NOT NULL,
+                avg REAL,
+                min REAL,
+                max REAL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (obis, timestamp)
+            ) WITHOUT ROWID
+        """)
+        # Needed by retention
+        self.writer.execute("CREATE INDEX IF NOT EXISTS h15.phases_timestamp ON phases (timestamp)")
+        self.writer.commit()
+
+    def load(self):
+        """Continues after the newest committed quarter, the open one is dropped."""
+        row = self.writer.query_one("SELECT MAX(timestamp) FROM h15.phases")
+        self.last_written = row[0]
+        self.quarter = None
+        self.stats = {}
+
+    def replay(self):
+        """
+        Feeds the raw store telegrams after the newest written quarter through
+        add(), the open quarter is then complete up to the newest telegram.
+
+        Returns:
+            int: Number of quarters written.
+        """
+        since = self.last_written if self.last_written is not None else -1
+        rows = self.writer.conn.execute(
+            "SELECT timestamp, sensor_data FROM main.data WHERE timestamp > ? ORDER BY timestamp",
+            (since,)).fetchall()
+        return sum(self.add(timestamp, json.loads(sensor_data)) for timestamp, sensor_data in rows)
+
+    def add(self, timestamp, values):
+        """
+        Adds the per-phase values of one telegram.
+
+        Returns:
+            bool: True if the previous quarter was written.
+        """
+        self.telegrams += 1
+        quarter = quarter_end(timestamp)
+        if self.last_written is not None and quarter <= self.last_written:
+            return False
+        written = False
+        if quarter != self.quarter:
+            if self.stats:
+                self.write()
+                written = True
+            self.quarter = quarter
+            self.stats = {}
+        for item in values:
+            if item["key"] in self.codes:
+                value = item["value"]
+                stats = self.stats.get(item["key"])
+                if stats is None:
+                    self.stats[item["key"]] = [value, value, value, 1]
+                else:
+                    stats[0] += value
+                    if value < stats[1]:
+                        stats[1] = value
+                    if value > stats[2]:
+                        stats[2] = value
+                    stats[3] += 1
+        return written
+
+    def write(self):
+        rows = [(self.quarter, code, round(total / samples, 3), low, high, samples)
+                for code, (total, low, high, samples) in self.stats.items()]
+        self.writer.insert_phase_stats(rows)
+        self.last_written = self.quarter
+        self.rows += len(rows)
+
+    def metrics(self):
+        return {"telegrams": self.telegrams, "rows": self.rows}
@@ -0,0 +1,111 @@
+# RUN STORE
+# 17.10.2026
+#
+# Change-only (run-length) recording for mgmt-data-reader.py and
+# gpio-switch-reader.py. A run is (start_ts, end_ts, value, samples):
+# the same value was read samples times from start_ts to end_ts.
+# The open run is extended in memory and written only when the value
+# changes, when more than max_gap seconds pass between readings, and
+# every flush_interval seconds, instead of one row per reading.
+#
+# Table 'runs' in the reader's database file, next to the 'data' rows.
+# The state at time t is the run with the greatest start_ts <= t (if
+# end_ts >= t), one primary key lookup. han-api.py expands the runs back
+# to rows for the old data endpoints.
+import sqlite3
+import time
+
+FLUSH_INTERVAL = 300
+MAX_AGE = 7 * 24 * 3600
+
+
+class RunRecorder:
+    """Run-length recorder of one value stream."""
+
+    def __init__(self, db_file, max_gap, flush_interval=FLUSH_INTERVAL, max_age=MAX_AGE):
+        """
+        Args:
+            db_file (str): Database file, created if missing.
+            max_gap (float): A longer pause between readings (e.g. a
+                restart) starts a new run even if the value is the same.
+            flush_interval (float): Seconds between writes of the open run.
+            max_age (int): Runs that ended this many seconds ago are removed.
+        """
+        self.db_file = db_file
+        self.max_gap = max_gap
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        # Used by one task at a time, but from executor threads under supervisor.py
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                start_ts INTEGER PRIMARY KEY,
+                end_ts INTEGER NOT NULL,
+                value TEXT,
+                samples INTEGER NOT NULL
+            )
+        """)
+        # The newest run is continued if the value has not changed meanwhile
+        row = self.conn.execute(
+            "SELECT start_ts, end_ts, value, samples FROM runs ORDER BY start_ts DESC LIMIT 1").fetchone()
+        self.run = list(row) if row is not None else None
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        # Metrics
+        self.readings = 0
+        self.writes = 0
+
+    def record(self, timestamp, value):
+        """
+        Records one reading.
+
+        Returns:
+            bool: True if a new run was started.
+        """
+        self.readings += 1
+        run = self.run
+        if run is not None and run[2] == value and 0 <= timestamp - run[1] <= self.max_gap:
+            run[1] = timestamp
+            run[3] += 1
+            self.dirty = True
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+            return False
+        # The closed run gets its final end_ts in the same transaction
+        self.conn.execute("BEGIN")
+        try:
+            if self.dirty:
+                self.write()
+            self.run = [timestamp, timestamp, value, 1]
+            self.write()
+            self.conn.execute("DELETE FROM runs WHERE end_ts < ?", (timestamp - self.max_age,))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.last_flush = time.monotonic()
+        return True
+
+    def write(self):
+        start_ts, end_ts, value, samples = self.run
+        self.conn.execute("""
+            INSERT INTO runs (start_ts, end_ts, value, samples) VALUES (?, ?, ?, ?)
+            ON CONFLICT(start_ts) DO UPDATE SET
+                end_ts = excluded.end_ts, value = excluded.value, samples = excluded.samples
+        """, (start_ts, end_ts, value, samples))
+        self.writes += 1
+        self.dirty = False
+
+    def flush(self):
+        """Writes the open run if it has been extended since the last write."""
+        if self.dirty:
+            self.write()
+        self.last_flush = time.monotonic()
+
+    def metrics(self):
+        return {"readings": self.readings, "writes": self.writes}
+
+    def close(self):
+        self.flush()
+        self.conn.close()
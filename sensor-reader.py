@@ -11,17 +11,51 @@
 #            koodataan graafeille oma ohjelma jos tarvis
 # 21.12.2025 3 desimaalia consumed-energyyn 
 # 16.1.2026  CUTOFF_TIME = 2*3660
+# 17.10.2026 One long-lived connection (sensor_store.SensorWriter) with history DBs
+#            attached. One transaction per telegram, optional group commit.
+#            Retention pruning on a schedule/row budget in bounded batches, no COUNT(*).
+#            Optional normalized per-OBIS value table (STORE_OBIS, off by default),
+#            existing JSON rows migrated at start when it is turned on.
+#            Telegrams parsed from raw bytes with telegram_parser.parse_frame.
+#            Serial port read in bulk into telegram_parser.FrameAssembler, CRC16 checked,
+#            no sleep between frames. Wire to commit latency measured (COMMIT_LATENCY).
+#            PIPELINE mode: serial reader thread + bounded frame queue, frames are
+#            written in batches of up to WRITE_BATCH telegrams per transaction (ingest.py).
+#            matplotlib imports removed (plots are not drawn here any more).
+#            readDataAsync for running under supervisor.py.
+#            Heartbeat to the watchdog after each stored telegram.
+#            Metrics (metrics.py): frame counters, parse/store/commit/retention time
+#            histograms, snapshot in metrics/sensor-reader.json. SIGUSR1 toggles profiling.
+#            RAW_STORE = "ram": sensor_data.db on tmpfs, DB_FILE is its periodic snapshot.
+#            15-min and history rows at the exact quarter boundaries (rollup_store.EnergyRollup),
+#            totals interpolated between telegrams, missed quarters backfilled, hourly/daily/
+#            monthly rollup tables updated per quarter. Replaces HISTORY_WRITE_MINUTES.
+#            Per-phase statistics per quarter (rollup_store.PhaseStats). Closed days of the
+#            15-min and phase rows archived to compressed partitions (archive_store.py,
+#            ARCHIVE_DB_FILE) before the 31-day retention removes them.
+#            Days archived before a break are packed again with the backfilled quarters.
+#            PIPELINE: frames that hit a locked database are retried, not dropped.
+#            Heartbeat sent after the commit with the newest committed timestamp.
+#            Rollup and phase state restored when a frame is rolled back (abort_frame).
+#            RAW_STORE is set in sensor_store.py, readers choose the file by it. In disk
+#            mode a RAM copy left from a "ram" run is removed (newer: copied to DB_FILE).
+#            PIPELINE: only locked/busy errors are retried, COMMIT_RETRIES times. Other
+#            errors drop the frame, or roll back the batch when the commit fails.
+import asyncio
+import os
 import serial
 import re
 import sqlite3
 import json
 import time
 from datetime import datetime, timezone, timedelta
-
-import matplotlib
-matplotlib.use('Agg')   # Use non-GUI backend
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from sensor_store import SensorWriter, Retention, LatencyStats, DatabaseSnapshot, RAW_STORE, ram_path, retire_ram_copy
+from telegram_parser import FrameAssembler, parse_frame
+from ingest import FrameQueue, SerialReader
+import heartbeat
+from metrics import Registry, PROFILER
+from rollup_store import EnergyRollup, PhaseStats, total_energy
+from archive_store import Archiver
 
 # CUTOFF_TIME = 3660
 CUTOFF_TIME = 2*3660
@@ -29,146 +63,242 @@ CUTOFF_TIME = 2*3660
 DB_FILE = "sensor_data.db"
 HISTORY_DB_FILE = "sensor_data_history.db"
 HISTORY_15MIN_DB_FILE = "sensor_data_15min.db"
+# Long-term archive of the 15-min and phase rows, None disables it
+ARCHIVE_DB_FILE = "sensor_data_archive.db"
 SERIAL_PORT = "/dev/ttyS0"
 SERIAL_BAUDRATE = 115200
-LAST_HISTORY_WRITE_MINUTE = -1
-LAST_TOTAL_ENERGY = None
-HISTORY_WRITE_MINUTES = [0, 15, 30, 45]
+ROLLUP = None
+PHASES = None
+ARCHIVER = None
+# Store every value also as (timestamp, obis_id, value) rows, see sensor_store.py.
+# Optional: about 26 rows per telegram and their index on the SD card. Needed by
+# han-api.py sensor_values and aggregate?obis=
+STORE_OBIS = False
+# Group commit: commit every COMMIT_FRAMES telegrams or after COMMIT_INTERVAL seconds.
+# COMMIT_FRAMES = 1 commits every telegram.
+COMMIT_FRAMES = 1
+COMMIT_INTERVAL = 0
+WRITER = None
+# Retention: pruning runs every RETENTION_INTERVAL seconds or after
+# RETENTION_ROW_BUDGET inserted telegrams, not for every telegram.
+RETENTION_INTERVAL = 60
+RETENTION_ROW_BUDGET = 10
+HISTORY_15MIN_KEEP = 31 * 24 * 3600
+HISTORY_15MIN_RETENTION_INTERVAL = 3600
+SENSOR_RETENTION = None
+OBIS_RETENTION = None
+HISTORY_15MIN_RETENTION = None
+PHASES_RETENTION = None
+# Seconds from reading the last byte of a telegram to its commit
+COMMIT_LATENCY = LatencyStats("commit_latency")
+# (receive time, timestamp) of the parsed but not yet committed telegrams
+PENDING_RECEIVED = []
+# Pipelined ingest: a reader thread queues frames, the main thread writes them.
+# QUEUE_SIZE frames are buffered while the database is slow (about 10 s per frame),
+# QUEUE_OVERFLOW is one of ingest.OVERFLOW_POLICIES.
+PIPELINE = False
+QUEUE_SIZE = 600
+QUEUE_OVERFLOW = "drop_oldest"
+WRITE_BATCH = 50
+# Seconds between retries when a batch cannot be committed (database locked),
+# and the retries before the frame or batch is dropped
+COMMIT_RETRY_DELAY = 1.0
+COMMIT_RETRIES = 30
+BATCH_WRITE_TIME = LatencyStats("batch_write_time")
+# Raw telegram store, sensor_store.RAW_STORE (set there, han-api.py, watchdog.py
+# and telegram-import.py read the same setting): "disk" writes DB_FILE directly.
+# "ram" keeps it in sensor_store.RAM_DIR (tmpfs), copies it atomically to DB_FILE
+# every SNAPSHOT_INTERVAL seconds and at exit, and restores it from DB_FILE at
+# start. History databases stay on the disk.
+SNAPSHOT_INTERVAL = 300
+SNAPSHOT = None
+METRICS = Registry("sensor-reader")
+METRICS.describe("sensor_frames_parsed_total", "Telegrams parsed")
+METRICS.describe("sensor_frame_errors_total", "Telegrams that could not be parsed or stored")
+METRICS.describe("sensor_parse_seconds", "Telegram parse time")
+METRICS.describe("sensor_store_seconds", "Telegram insert time, commit included when it is done")
+METRICS.describe("sensor_commit_seconds", "COMMIT statement time")
+METRICS.describe("sensor_commit_latency_seconds", "Time from the last byte of a telegram to its commit")
+METRICS.describe("sensor_retention_seconds", "Retention pruning run time")
 
 def convert_timestamp_to_local_time(unix_timestamp):
     local_dt_object = datetime.fromtimestamp(unix_timestamp)
     return local_dt_object.strftime('%Y-%m-%d %H:%M:%S')
 
-def create_connection(db_file):
-    conn = sqlite3.connect(db_file)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    return conn
-
 def initialize_database():
-    # History DB (total energy at 15-min marks)
-    history_conn = create_connection(HISTORY_DB_FILE)
-    history_cursor = history_conn.cursor()
-    history_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data (
-            timestamp INTEGER PRIMARY KEY,
-            total_energy REAL
-        )
-    """)
-    history_conn.commit()
-    history_conn.close()
-
-    # Sensor data DB (raw parsed payloads)
-    conn = create_connection(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data (
-            timestamp INTEGER PRIMARY KEY,
-            sensor_data TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-    # 15-min history DB (total + consumed delta)
-    history15_conn = create_connection(HISTORY_15MIN_DB_FILE)
-    history15_cursor = history15_conn.cursor()
-    history15_cursor.execute("""
-        CREATE TABLE IF NOT EXISTS data (
-            timestamp INTEGER PRIMARY KEY,
-            total_energy REAL,
-            consumed_energy REAL
-        )
-    """)
-    history15_conn.commit()
-    history15_conn.close()
+    global WRITER
+    db_file = DB_FILE
+    if RAW_STORE == "ram":
+        db_file = initialize_snapshot()
+    else:
+        # A RAM copy of an earlier "ram" run must not be read as the live file
+        retired = retire_ram_copy(DB_FILE)
+        if retired == "restored":
+            print(f"{DB_FILE}: Restored from the newer RAM copy {ram_path(DB_FILE)}, copy removed")
+        elif retired == "removed":
+            print(f"{ram_path(DB_FILE)}: Stale RAM copy removed")
+    # One long-lived connection, history DBs are attached to it
+    # In PIPELINE mode a batch is committed once by writeBatch
+    commit_frames = max(COMMIT_FRAMES, WRITE_BATCH) if PIPELINE else COMMIT_FRAMES
+    WRITER = SensorWriter(db_file, HISTORY_DB_FILE, HISTORY_15MIN_DB_FILE,
+                          commit_frames=commit_frames, commit_interval=COMMIT_INTERVAL,
+                          archive_db_file=ARCHIVE_DB_FILE)
+    WRITER.initialize_schema()
+    if STORE_OBIS:
+        WRITER.initialize_obis_schema()
+        migrated = WRITER.migrate_sensor_blobs()
+        if migrated:
+            print(f"{DB_FILE}: Migrated {migrated} JSON records to obis_value table")
+    initialize_retention()
+
+def initialize_snapshot():
+    """RAM store: restores the tmpfs database from the snapshot, returns its path."""
+    global SNAPSHOT
+    db_file = ram_path(DB_FILE)
+    SNAPSHOT = DatabaseSnapshot(db_file, DB_FILE, SNAPSHOT_INTERVAL)
+    if SNAPSHOT.restore():
+        print(f"{db_file}: Restored from snapshot {DB_FILE}")
+    os.makedirs(os.path.dirname(db_file), exist_ok=True)
+    METRICS.set_collector("sensor_snapshot_", SNAPSHOT.metrics)
+    return db_file
+
+def start_snapshots():
+    if SNAPSHOT is not None:
+        SNAPSHOT.start()
+
+def stop_snapshots():
+    """Final snapshot, after the last commit."""
+    if SNAPSHOT is not None:
+        SNAPSHOT.stop()
+        print(f"{DB_FILE}: Snapshot written")
+
+def initialize_retention():
+    global SENSOR_RETENTION, OBIS_RETENTION, HISTORY_15MIN_RETENTION, PHASES_RETENTION
+    SENSOR_RETENTION = Retention(WRITER, "main.data", CUTOFF_TIME,
+                                 interval=RETENTION_INTERVAL, row_budget=RETENTION_ROW_BUDGET)
+    if STORE_OBIS:
+        OBIS_RETENTION = Retention(WRITER, "main.obis_value", CUTOFF_TIME,
+                                   interval=RETENTION_INTERVAL, row_budget=RETENTION_ROW_BUDGET,
+                                   batch_size=5000)
+    HISTORY_15MIN_RETENTION = Retention(WRITER, "h15.data", HISTORY_15MIN_KEEP,
+                                        interval=HISTORY_15MIN_RETENTION_INTERVAL)
+    PHASES_RETENTION = Retention(WRITER, "h15.phases", HISTORY_15MIN_KEEP,
+                                 interval=HISTORY_15MIN_RETENTION_INTERVAL, batch_size=5000)
+
+def prune(retention):
+    """Retention.maybe_prune, a run's duration goes to the retention histogram."""
+    runs = retention.runs
+    removed = retention.maybe_prune()
+    if retention.runs != runs:
+        METRICS.observe("sensor_retention_seconds", retention.last_duration, table=retention.table)
+    return removed
 
 def remove_old_records():
-    cutoff_time = int(time.time()) - CUTOFF_TIME
-    cutoff_str = convert_timestamp_to_local_time(cutoff_time)
-    conn = create_connection(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM data")
-    record_count = cursor.fetchone()[0]
-    print(f"Record count {record_count}")
-    print(f"{DB_FILE}: Deleting old records. Cutoff timestamp = {cutoff_str} ({cutoff_time})")
-    cursor.execute("DELETE FROM data WHERE timestamp < ?", (cutoff_time,))
-    conn.commit()
-    conn.close()
+    """Amortized retention for sensor_data.db, see RETENTION_INTERVAL."""
+    removed = prune(SENSOR_RETENTION)
+    if removed:
+        cutoff_time = SENSOR_RETENTION.last_prune - CUTOFF_TIME
+        cutoff_str = convert_timestamp_to_local_time(cutoff_time)
+        print(f"{DB_FILE}: Deleted {removed} old records in "
+              f"{SENSOR_RETENTION.last_duration * 1000:.1f} ms. Cutoff timestamp = {cutoff_str} ({int(cutoff_time)})")
+
+    if OBIS_RETENTION is not None:
+        prune(OBIS_RETENTION)
 
 def remove_old_15min_records():
-    """Remove records older than 31 days from sensor_data_15min.db."""
-    cutoff_time = int(time.time()) - (31 * 24 * 3600)
-    conn = create_connection(HISTORY_15MIN_DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM data WHERE timestamp < ?", (cutoff_time,))
-    conn.commit()
-    conn.close()
-
-def init_last_total_energy_from_db():
-    """Initialize LAST_TOTAL_ENERGY from the most recent 15-min record if available."""
-    global LAST_TOTAL_ENERGY
-    conn = create_connection(HISTORY_15MIN_DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT total_energy FROM data ORDER BY timestamp DESC LIMIT 1")
-    row = cursor.fetchone()
-    conn.close()
-    if row is not None:
-        LAST_TOTAL_ENERGY = row[0]
+    """
+    Remove records older than 31 days from sensor_data_15min.db.
+    With ARCHIVE_DB_FILE they have been archived when their day closed.
+    """
+    removed = prune(HISTORY_15MIN_RETENTION) + prune(PHASES_RETENTION)
+    if removed:
+        print(f"{HISTORY_15MIN_DB_FILE}: Deleted {removed} old records")
+
+def initialize_rollup():
+    """
+    Continues the 15-min rows and rollups from the newest committed quarter,
+    quarters missed before a restart are backfilled from the raw store.
+    """
+    global ROLLUP, PHASES, ARCHIVER
+    if ROLLUP is None:
+        ROLLUP = EnergyRollup(WRITER, HISTORY_15MIN_KEEP)
+        ROLLUP.initialize_schema()
+        METRICS.set_collector("sensor_rollup_", ROLLUP.metrics, "counter")
+        PHASES = PhaseStats(WRITER)
+        PHASES.initialize_schema()
+        METRICS.set_collector("sensor_phases_", PHASES.metrics, "counter")
+        if ARCHIVE_DB_FILE is not None:
+            ARCHIVER = Archiver(WRITER)
+            ARCHIVER.initialize_schema()
+            METRICS.set_collector("sensor_archive_", ARCHIVER.metrics, "counter")
+    ROLLUP.load()
+    PHASES.load()
+    written = ROLLUP.replay()
+    PHASES.replay()
+    WRITER.commit()
+    if written:
+        print(f"{HISTORY_15MIN_DB_FILE}: Backfilled {written} quarters from {DB_FILE}")
+    archive_closed_days(time.time())
+
+def archive_closed_days(now):
+    """
+    Archives the 15-min data of the days closed since the last check. Days
+    archived before a break got backfilled quarters, they are packed again.
+    """
+    if ARCHIVER is None:
+        return
+    archived = ARCHIVER.archive_closed(now)
+    backfill_start = ROLLUP.pop_backfill_start()
+    if backfill_start is not None:
+        archived += ARCHIVER.archive_range(backfill_start, now)
+    if archived:
+        print(f"{ARCHIVE_DB_FILE}: Archived {archived} day partitions")
 
 def writeData(input):
-    global LAST_HISTORY_WRITE_MINUTE, LAST_TOTAL_ENERGY
+    """
+    Writes one parsed telegram. All inserts go to the same transaction.
+
+    Returns:
+        bool: True if the transaction was committed.
+    """
+    WRITER.begin_frame()
+    # In-memory rollup state goes back with the rolled back rows
+    ROLLUP.begin_frame()
+    PHASES.begin_frame()
+    try:
+        storeData(input)
+    except Exception:
+        WRITER.abort_frame()
+        ROLLUP.abort_frame()
+        PHASES.abort_frame()
+        raise
+    try:
+        return WRITER.frame_done()
+    except sqlite3.OperationalError as e:
+        # The frame stays in the open transaction, the next commit includes it
+        print(f"Commit failed, retried with the next frame: {e}")
+        return False
 
+def storeData(input):
     remove_old_records()
 
     # Insert into sensor_data.db
-    conn = create_connection(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO data (timestamp, sensor_data) VALUES (?, ?)",
-                   (input["timestamp"], json.dumps(input["values"])))
-    conn.commit()
-    conn.close()
-
-    # Extract total energy (kWh) from values
-    totalEnergy = next((item for item in input["values"] if item["key"] == "1-0:1.8.0"), None)
-    if totalEnergy:
-        ts_dt = datetime.fromtimestamp(input["timestamp"])
-        if ts_dt.minute in HISTORY_WRITE_MINUTES and ts_dt.minute != LAST_HISTORY_WRITE_MINUTE:
-            # Write to simple history DB
-            hconn = create_connection(HISTORY_DB_FILE)
-            hcur = hconn.cursor()
-            hcur.execute("INSERT INTO data (timestamp, total_energy) VALUES (?, ?)",
-                         (input["timestamp"], totalEnergy["value"]))
-            hconn.commit()
-            hconn.close()
-
-            # Prepare consumed delta for 15-min DB
-            if LAST_TOTAL_ENERGY is None:
-                # Try to initialize from DB in case of restart
-                init_last_total_energy_from_db()
-            consumed_energy = None
-            if LAST_TOTAL_ENERGY is not None:
-                consumed_energy = round(totalEnergy["value"] - LAST_TOTAL_ENERGY,3)
-                # Guard against negative due to meter resets/rollovers
-                if consumed_energy < 0:
-                    consumed_energy = None
-
-            # Write to 15-min DB
-            h15conn = create_connection(HISTORY_15MIN_DB_FILE)
-            h15cur = h15conn.cursor()
-            h15cur.execute(
-                "INSERT INTO data (timestamp, total_energy, consumed_energy) VALUES (?, ?, ?)",
-                (input["timestamp"], totalEnergy["value"], consumed_energy)
-            )
-            h15conn.commit()
-            h15conn.close()
-
-            # Cleanup retention
+    WRITER.insert_sensor_data(input["timestamp"], json.dumps(input["values"]))
+    SENSOR_RETENTION.note_insert()
+    if STORE_OBIS:
+        WRITER.insert_values(input["timestamp"], input["values"])
+        OBIS_RETENTION.note_insert()
+
+    PHASES.add(input["timestamp"], input["values"])
+
+    # Total energy (kWh): 15-min/history rows and rollups for the crossed quarter boundaries
+    totalEnergy = total_energy(input["values"])
+    if totalEnergy is not None:
+        if ROLLUP.add(input["timestamp"], totalEnergy):
+            # Closed days to the archive, then cleanup retention
+            archive_closed_days(input["timestamp"])
             remove_old_15min_records()
 
-            # Update trackers
-            LAST_TOTAL_ENERGY = totalEnergy["value"]
-            LAST_HISTORY_WRITE_MINUTE = ts_dt.minute
-
 def parseData(inputList):
     data = {"values": []}
     for line in inputList:
@@ -201,49 +331,189 @@ def parseValue(line):
     else:
         raise ValueError("Input string does not match the expected format.")
 
+def recordCommit():
+    """
+    Records the commit latency of the frames written since the previous
+    commit, the heartbeat tells the watchdog the newest committed timestamp.
+    """
+    committed = time.monotonic()
+    if not PENDING_RECEIVED:
+        return
+    METRICS.observe("sensor_commit_seconds", WRITER.last_commit_duration)
+    for pending, _ in PENDING_RECEIVED:
+        COMMIT_LATENCY.add(committed - pending)
+        METRICS.observe("sensor_commit_latency_seconds", committed - pending)
+    heartbeat.send("sensor", PENDING_RECEIVED[-1][1])
+    PENDING_RECEIVED.clear()
+
+def handleFrame(frame, received):
+    """Parses and stores one assembled frame, records the commit latency."""
+    with PROFILER.sample():
+        try:
+            with METRICS.time("sensor_parse_seconds"):
+                parsed_data = parse_frame(frame).as_dict()
+            METRICS.inc("sensor_frames_parsed_total")
+            pending = (received, parsed_data["timestamp"])
+            PENDING_RECEIVED.append(pending)
+            try:
+                with METRICS.time("sensor_store_seconds"):
+                    committed = writeData(parsed_data)
+            except Exception:
+                # Not stored, the other pending frames are still in the transaction
+                PENDING_RECEIVED.remove(pending)
+                raise
+        except Exception:
+            METRICS.inc("sensor_frame_errors_total")
+            raise
+    if committed:
+        recordCommit()
+    METRICS.maybe_write()
+    print(f"Timestamp: {parsed_data['timestamp']}, Valid data received for {DB_FILE}, "
+          f"latency {COMMIT_LATENCY.last * 1000:.1f} ms")
+
 def readData(dataConnection):
+    """
+    Reads everything waiting in the UART buffer, blocks for the next byte
+    when empty. No sleep, so back-to-back telegrams are not lost.
+    """
+    assembler = FrameAssembler()
+    METRICS.set_collector("sensor_assembler_", assembler.metrics, "counter")
     dataConnection.reset_input_buffer()
     while True:
+        data = dataConnection.read(dataConnection.in_waiting or 1)
+        received = time.monotonic()
+        corrupt, dropped = assembler.corrupt, assembler.dropped
+        for frame, frame_received in assembler.feed(data, received):
+            try:
+                handleFrame(frame, frame_received)
+            except Exception as e:
+                print(f"Error processing serial data: {e}")
+        if assembler.corrupt != corrupt or assembler.dropped != dropped:
+            print(f"Bad frames from serial port: corrupt {assembler.corrupt}, dropped {assembler.dropped}")
+
+def database_busy(error):
+    """True if the OperationalError clears by waiting (another connection holds a lock)."""
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def writeBatch(batch):
+    """Writer stage: stores the queued frames in one transaction."""
+    started = time.perf_counter()
+    for frame, received in batch:
+        # A frame that could not be inserted (database locked) is retried,
+        # the other frames keep queueing meanwhile. Its savepoint has been
+        # rolled back by writeData, a frame given up on is dropped.
+        for attempt in range(COMMIT_RETRIES + 1):
+            try:
+                handleFrame(frame, received)
+                break
+            except sqlite3.OperationalError as e:
+                if not database_busy(e) or attempt == COMMIT_RETRIES:
+                    print(f"Frame dropped: {e}")
+                    break
+                print(f"Frame not stored, retrying in {COMMIT_RETRY_DELAY} s: {e}")
+                time.sleep(COMMIT_RETRY_DELAY)
+            except Exception as e:
+                print(f"Error processing serial data: {e}")
+                break
+    # Frames keep queueing in the reader thread while the database is busy
+    for attempt in range(COMMIT_RETRIES + 1):
         try:
-            frames = []
-            s = ""
-            # Wait for header line beginning with "/ADN9"
-            while not s.startswith("/ADN9"):
-                line = dataConnection.readline()
-                s = line.decode('utf-8').strip()
-            frames.append(s)
-            # Continue until "!" line
-            while not s.startswith("!"):
-                line = dataConnection.readline()
-                s = line.decode('utf-8').strip()
-                frames.append(s)
-
-            parsed_data = parseData(frames)
-            writeData(parsed_data)
-            print(f"Timestamp: {parsed_data['timestamp']}, Valid data received for {DB_FILE}")
-
-        except Exception as e:
-            print(f"Error processing serial data: {e}")
-
-        time.sleep(0.5)
+            WRITER.commit()
+            break
+        except sqlite3.OperationalError as e:
+            if not database_busy(e) or attempt == COMMIT_RETRIES:
+                print(f"Commit failed, {len(PENDING_RECEIVED)} frames dropped: {e}")
+                WRITER.rollback()
+                PENDING_RECEIVED.clear()
+                # The rollup state continues from the committed rows again
+                ROLLUP.load()
+                PHASES.load()
+                BATCH_WRITE_TIME.add(time.perf_counter() - started)
+                return
+            print(f"Commit failed, retrying in {COMMIT_RETRY_DELAY} s: {e}")
+            time.sleep(COMMIT_RETRY_DELAY)
+    recordCommit()
+    BATCH_WRITE_TIME.add(time.perf_counter() - started)
+
+def readPipelined(dataConnection):
+    """Serial reading in a thread, parsing and writing in this one."""
+    frame_queue = FrameQueue(QUEUE_SIZE, QUEUE_OVERFLOW)
+    reader = SerialReader(dataConnection, frame_queue)
+    METRICS.set_collector("sensor_assembler_", reader.assembler.metrics, "counter")
+    METRICS.set_collector("sensor_queue_", frame_queue.metrics)
+    reader.start()
+    try:
+        while reader.is_alive() or len(frame_queue):
+            batch = frame_queue.get_batch(WRITE_BATCH, timeout=1.0)
+            if batch:
+                writeBatch(batch)
+                if len(batch) > 1:
+                    print(f"Wrote {len(batch)} queued frames in {BATCH_WRITE_TIME.last * 1000:.1f} ms, "
+                          f"queue depth {len(frame_queue)}, max {frame_queue.max_depth}")
+        if reader.error is not None:
+            raise reader.error
+    finally:
+        reader.stop()
+
+async def readDataAsync():
+    """
+    Sensor reader task for supervisor.py. The blocking serial read runs in
+    a worker thread, parsing and database writes in the event loop.
+    """
+    if WRITER is None:
+        initialize_database()
+    # Rows of a failed earlier run are not committed half way
+    WRITER.rollback()
+    PENDING_RECEIVED.clear()
+    initialize_rollup()
+
+    start_snapshots()
+
+    # timeout: a cancelled task does not leave a read blocked forever
+    serData = serial.Serial(port=SERIAL_PORT, baudrate=SERIAL_BAUDRATE, timeout=1.0)
+    print("Connected to serial port: " + serData.portstr)
+    loop = asyncio.get_running_loop()
+    assembler = FrameAssembler()
+    METRICS.set_collector("sensor_assembler_", assembler.metrics, "counter")
+    try:
+        serData.reset_input_buffer()
+        while True:
+            data = await loop.run_in_executor(None, lambda: serData.read(serData.in_waiting or 1))
+            for frame, received in assembler.feed(data):
+                try:
+                    handleFrame(frame, received)
+                except Exception as e:
+                    print(f"Error processing serial data: {e}")
+    finally:
+        serData.close()
+        WRITER.commit()
+        stop_snapshots()
 
 
 # ------------------ Main ------------------
 
 if __name__ == "__main__":
+    PROFILER.install("sensor-reader")
     # Initialize DBs
     initialize_database()
-    # Initialize delta baseline from DB (helps after restarts)
-    init_last_total_energy_from_db()
+    # 15-min rows continue from the DB, missed quarters backfilled (helps after restarts)
+    initialize_rollup()
+    start_snapshots()
 
     # Open serial and start reading
     serData = serial.Serial(port=SERIAL_PORT, baudrate=SERIAL_BAUDRATE)
     print("Connected to serial port: " + serData.portstr)
 
     try:
-        readData(serData)
+        if PIPELINE:
+            readPipelined(serData)
+        else:
+            readData(serData)
     except KeyboardInterrupt:
 
         print("Program interrupted. Exiting...")
     finally:
         serData.close()
+        WRITER.close()
+        stop_snapshots()
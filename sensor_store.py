@@ -0,0 +1,578 @@
+# SENSOR STORE
+# 17.10.2026
+#
+# Long-lived sqlite3 writer for sensor-reader.py.
+# One connection is kept open for the whole process lifetime. The history
+# databases are ATTACHed to it, so all inserts of one telegram go to the
+# disk in a single transaction instead of three separate open/commit/close
+# cycles.
+#
+# Optional group commit: the transaction is committed every COMMIT_FRAMES
+# frames or when COMMIT_INTERVAL seconds have passed, whichever comes first.
+# COMMIT_FRAMES = 1 commits every telegram (default behaviour).
+#
+# Normalized OBIS storage: besides the JSON blob table, every value can be
+# stored as one (timestamp, obis_id, value) row. The obis table maps codes
+# like "1-0:31.7.0" to small integer ids.
+#
+# RAM raw store: sensor_data.db can live on tmpfs (RAM_DIR), the file of the
+# same name on the SD card is then only its snapshot (DatabaseSnapshot).
+# The mode is RAW_STORE, read by sensor-reader.py and by the processes that
+# open its database, which find the live file with live_path(). A RAM copy
+# left from an earlier "ram" run is removed in "disk" mode (retire_ram_copy).
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# WAL + synchronous=NORMAL: commit does not fsync, only checkpoints do.
+# Database stays consistent on power loss, latest commits may be lost.
+SYNCHRONOUS = "NORMAL"
+
+
+class SensorWriter:
+    """Persistent writer for sensor_data.db and the attached history databases."""
+
+    def __init__(self, db_file, history_db_file, history_15min_db_file,
+                 commit_frames=1, commit_interval=0, archive_db_file=None):
+        """
+        Args:
+            db_file (str): Raw telegram database (main schema).
+            history_db_file (str): Hourly history database, attached as 'history'.
+            history_15min_db_file (str): 15-min history database, attached as 'h15'.
+            commit_frames (int): Commit after this many frames.
+            commit_interval (float): Commit if this many seconds have passed
+                since the last commit. 0 disables the time limit.
+            archive_db_file (str): Long-term archive database (archive_store.py),
+                attached as 'archive' if given.
+        """
+        self.db_file = db_file
+        self.commit_frames = max(1, int(commit_frames))
+        self.commit_interval = commit_interval
+        self.pending_frames = 0
+        self.last_commit = time.monotonic()
+        self.last_commit_duration = 0.0
+        self.obis_ids = {}
+
+        # isolation_level=None: transactions are controlled explicitly below
+        self.conn = sqlite3.connect(db_file, isolation_level=None)
+        self.conn.execute("ATTACH DATABASE ? AS history", (history_db_file,))
+        self.conn.execute("ATTACH DATABASE ? AS h15", (history_15min_db_file,))
+        schemas = ["main", "history", "h15"]
+        if archive_db_file is not None:
+            self.conn.execute("ATTACH DATABASE ? AS archive", (archive_db_file,))
+            schemas.append("archive")
+        for schema in schemas:
+            self.conn.execute(f"PRAGMA {schema}.journal_mode=WAL;")
+            self.conn.execute(f"PRAGMA {schema}.synchronous={SYNCHRONOUS};")
+
+    def initialize_schema(self):
+        """Creates the 'data' tables if they don't exist."""
+        # History DB (total energy at 15-min marks)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS history.data (
+                timestamp INTEGER PRIMARY KEY,
+                total_energy REAL
+            )
+        """)
+        # Sensor data DB (raw parsed payloads)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS main.data (
+                timestamp INTEGER PRIMARY KEY,
+                sensor_data TEXT
+            )
+        """)
+        # 15-min history DB (total + consumed delta)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS h15.data (
+                timestamp INTEGER PRIMARY KEY,
+                total_energy REAL,
+                consumed_energy REAL
+            )
+        """)
+
+    def initialize_obis_schema(self):
+        """Creates the normalized per-OBIS tables in sensor_data.db."""
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS main.obis (
+                id INTEGER PRIMARY KEY,
+                code TEXT UNIQUE NOT NULL,
+                unit TEXT
+            )
+        """)
+        # (obis_id, timestamp) key: one code over a time range is a range scan
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS main.obis_value (
+                timestamp INTEGER NOT NULL,
+                obis_id INTEGER NOT NULL,
+                value REAL,
+                PRIMARY KEY (obis_id, timestamp)
+            ) WITHOUT ROWID
+        """)
+        # Needed by retention
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS main.obis_value_timestamp
+            ON obis_value (timestamp)
+        """)
+        self.load_obis_ids()
+
+    def load_obis_ids(self):
+        """(Re)reads the code -> id cache, needed after a rollback."""
+        self.obis_ids = dict(self.conn.execute("SELECT code, id FROM main.obis").fetchall())
+
+    def obis_id(self, code, unit=None):
+        """Returns the id of an OBIS code, adding it to the obis table if new."""
+        obis_id = self.obis_ids.get(code)
+        if obis_id is None:
+            self.execute("INSERT OR IGNORE INTO main.obis (code, unit) VALUES (?, ?)", (code, unit))
+            obis_id = self.query_one("SELECT id FROM main.obis WHERE code = ?", (code,))[0]
+            self.obis_ids[code] = obis_id
+        return obis_id
+
+    def execute(self, query, params=()):
+        """Executes a statement inside the current write transaction."""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        return self.conn.execute(query, params)
+
+    def query_one(self, query, params=()):
+        """Runs a read query and returns the first row or None."""
+        return self.conn.execute(query, params).fetchone()
+
+    def insert_sensor_data(self, timestamp, sensor_data):
+        self.execute("INSERT INTO main.data (timestamp, sensor_data) VALUES (?, ?)",
+                     (timestamp, sensor_data))
+
+    def insert_values(self, timestamp, values, ignore_existing=False):
+        """
+        Inserts parsed values into the normalized table.
+
+        Args:
+            timestamp (int): Telegram timestamp.
+            values (list): [{"key": ..., "value": ..., "unit": ...}, ...]
+            ignore_existing (bool): Skip rows that already exist (migration).
+        """
+        rows = [(timestamp, self.obis_id(item["key"], item.get("unit")), item["value"])
+                for item in values]
+        verb = "INSERT OR IGNORE" if ignore_existing else "INSERT"
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.executemany(
+            f"{verb} INTO main.obis_value (timestamp, obis_id, value) VALUES (?, ?, ?)", rows)
+
+    def insert_sensor_rows(self, rows):
+        """
+        Bulk insert of (timestamp, sensor_data) rows, e.g. imported telegrams.
+        Rows with an existing timestamp are skipped.
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        changes = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO main.data (timestamp, sensor_data) VALUES (?, ?)", rows)
+        return self.conn.total_changes - changes
+
+    def insert_value_rows(self, rows):
+        """
+        Bulk insert into the normalized table, existing rows are skipped.
+
+        Args:
+            rows (list): (timestamp, code, unit, value) tuples.
+        """
+        obis_id = self.obis_id
+        rows = [(timestamp, obis_id(code, unit), value) for timestamp, code, unit, value in rows]
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO main.obis_value (timestamp, obis_id, value) VALUES (?, ?, ?)", rows)
+
+    def migrate_sensor_blobs(self, batch_size=1000):
+        """
+        Copies JSON blob rows that are missing from the normalized table.
+        Safe to run repeatedly, commits after each batch.
+
+        Returns:
+            int: Number of telegrams migrated.
+        """
+        migrated = 0
+        last_timestamp = -1
+        while True:
+            rows = self.conn.execute("""
+                SELECT timestamp, sensor_data FROM main.data
+                WHERE timestamp > ? AND timestamp NOT IN (SELECT timestamp FROM main.obis_value)
+                ORDER BY timestamp LIMIT ?
+            """, (last_timestamp, batch_size)).fetchall()
+            if not rows:
+                break
+            for timestamp, sensor_data in rows:
+                self.insert_values(timestamp, json.loads(sensor_data), ignore_existing=True)
+            self.commit()
+            migrated += len(rows)
+            last_timestamp = rows[-1][0]
+        return migrated
+
+    def insert_history(self, timestamp, total_energy):
+        self.execute("INSERT OR IGNORE INTO history.data (timestamp, total_energy) VALUES (?, ?)",
+                     (timestamp, total_energy))
+
+    def insert_15min(self, timestamp, total_energy, consumed_energy):
+        """
+        Returns:
+            bool: False if a row with the timestamp already exists.
+        """
+        cursor = self.execute(
+            "INSERT OR IGNORE INTO h15.data (timestamp, total_energy, consumed_energy) VALUES (?, ?, ?)",
+            (timestamp, total_energy, consumed_energy)
+        )
+        return cursor.rowcount > 0
+
+    def insert_phase_stats(self, rows):
+        """rows: (timestamp, obis, avg, min, max, samples) tuples of one quarter."""
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN")
+        self.conn.executemany("""
+            INSERT OR IGNORE INTO h15.phases (timestamp, obis, avg, min, max, samples)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def begin_frame(self):
+        """Starts one telegram. Its inserts can be undone with abort_frame()."""
+        self.execute("SAVEPOINT frame")
+
+    def abort_frame(self):
+        """Undoes the inserts of the current telegram, keeps earlier grouped frames."""
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK TO frame")
+            self.conn.execute("RELEASE frame")
+            if self.obis_ids:
+                self.load_obis_ids()
+
+    def frame_done(self):
+        """
+        Marks the end of one telegram. Commits when the group commit
+        limits are reached.
+
+        Returns:
+            bool: True if the transaction was committed.
+        """
+        self.conn.execute("RELEASE frame")
+        self.pending_frames += 1
+        if self.pending_frames >= self.commit_frames:
+            self.commit()
+            return True
+        if self.commit_interval and time.monotonic() - self.last_commit >= self.commit_interval:
+            self.commit()
+            return True
+        return False
+
+    def commit(self):
+        """Commits the open transaction, if any."""
+        if self.conn.in_transaction:
+            started = time.perf_counter()
+            self.conn.execute("COMMIT")
+            self.last_commit_duration = time.perf_counter() - started
+        self.pending_frames = 0
+        self.last_commit = time.monotonic()
+
+    def rollback(self):
+        """Discards the uncommitted frames."""
+        if self.conn.in_transaction:
+            self.conn.execute("ROLLBACK")
+        self.pending_frames = 0
+        if self.obis_ids:
+            self.load_obis_ids()
+
+    def close(self):
+        """Flushes pending frames and closes the connection."""
+        self.commit()
+        self.conn.close()
+
+
+class Retention:
+    """
+    Amortized age based pruning of one table.
+
+    Pruning is run when interval seconds have passed or row_budget rows
+    have been inserted since the previous run, not on every telegram.
+    Rows are deleted oldest first in batches of batch_size rows, at most
+    max_batches batches per run, so one run has a bounded cost. Anything
+    left over is removed on the next run.
+    """
+
+    def __init__(self, writer, table, max_age, interval=60, row_budget=0,
+                 batch_size=500, max_batches=4):
+        """
+        Args:
+            writer (SensorWriter): Writer whose transaction is used.
+            table (str): Schema qualified table name, e.g. 'main.data'.
+            max_age (int): Rows older than this many seconds are removed.
+            interval (float): Prune at most this often (seconds).
+            row_budget (int): Also prune after this many inserts. 0 disables.
+            batch_size (int): Rows deleted per DELETE statement.
+            max_batches (int): DELETE statements per run.
+        """
+        self.writer = writer
+        self.table = table
+        self.max_age = max_age
+        self.interval = interval
+        self.row_budget = row_budget
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.inserts_since_prune = 0
+        self.last_prune = None
+        # Metrics
+        self.runs = 0
+        self.rows_removed = 0
+        self.last_rows_removed = 0
+        self.last_duration = 0.0
+        self.total_duration = 0.0
+
+    def note_insert(self, rows=1):
+        self.inserts_since_prune += rows
+
+    def due(self, now):
+        if self.last_prune is None:
+            return True
+        if self.row_budget and self.inserts_since_prune >= self.row_budget:
+            return True
+        return now - self.last_prune >= self.interval
+
+    def maybe_prune(self, now=None):
+        """
+        Prunes if the schedule or row budget says so.
+
+        Returns:
+            int: Number of rows removed, 0 if pruning was not due.
+        """
+        now = time.time() if now is None else now
+        if not self.due(now):
+            return 0
+        return self.prune(now)
+
+    def prune(self, now=None):
+        """Removes expired rows in bounded batches and updates the metrics."""
+        now = time.time() if now is None else now
+        cutoff_time = int(now) - self.max_age
+        started = time.perf_counter()
+        removed = 0
+        for _ in range(self.max_batches):
+            # Upper timestamp of the next batch, found over the timestamp index
+            row = self.writer.query_one(f"""
+                SELECT timestamp FROM {self.table}
+                WHERE timestamp < ? ORDER BY timestamp LIMIT 1 OFFSET ?
+            """, (cutoff_time, self.batch_size - 1))
+            if row is None:
+                cursor = self.writer.execute(
+                    f"DELETE FROM {self.table} WHERE timestamp < ?", (cutoff_time,))
+                removed += cursor.rowcount
+                break
+            cursor = self.writer.execute(
+                f"DELETE FROM {self.table} WHERE timestamp <= ?", (row[0],))
+            removed += cursor.rowcount
+        duration = time.perf_counter() - started
+
+        self.inserts_since_prune = 0
+        self.last_prune = now
+        self.runs += 1
+        self.rows_removed += removed
+        self.last_rows_removed = removed
+        self.last_duration = duration
+        self.total_duration += duration
+        return removed
+
+    def metrics(self):
+        """Returns the pruning counters as a dict."""
+        return {
+            "table": self.table,
+            "runs": self.runs,
+            "rows_removed": self.rows_removed,
+            "last_rows_removed": self.last_rows_removed,
+            "last_duration": self.last_duration,
+            "total_duration": self.total_duration,
+        }
+
+
+class LatencyStats:
+    """Running count/last/max/average of a latency in seconds."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.last = seconds
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def metrics(self):
+        """Returns the counters as a dict."""
+        return {
+            "name": self.name,
+            "count": self.count,
+            "last": self.last,
+            "max": self.max,
+            "avg": self.total / self.count if self.count else 0.0,
+        }
+
+
+# Raw telegram store of sensor-reader.py: "disk" writes sensor_data.db directly,
+# "ram" keeps it in RAM_DIR (tmpfs) with periodic snapshots to the disk
+RAW_STORE = "disk"
+RAM_DIR = "/dev/shm/han"
+SQLITE_SUFFIXES = ("", "-wal", "-shm", "-journal")
+
+
+def ram_path(db_file, ram_dir=RAM_DIR):
+    """Path of db_file in the RAM directory."""
+    return os.path.join(ram_dir, os.path.basename(db_file))
+
+
+def live_path(db_file, raw_store=None):
+    """
+    The file sensor-reader.py writes: the RAM copy of db_file in "ram" mode,
+    else db_file. The mode is RAW_STORE unless raw_store is given. In "ram"
+    mode db_file is returned until the copy exists (e.g. after a reboot the
+    reader restores it from db_file at its start). A copy is never used in
+    "disk" mode.
+    """
+    if (raw_store or RAW_STORE) != "ram":
+        return db_file
+    path = ram_path(db_file)
+    return path if os.path.exists(path) else db_file
+
+
+def modified_time(db_file):
+    """Newest modification time of db_file and its WAL, None if missing."""
+    times = [os.path.getmtime(path) for path in (db_file, db_file + "-wal") if os.path.exists(path)]
+    return max(times) if times else None
+
+
+def retire_ram_copy(db_file):
+    """
+    Disk mode: removes the RAM copy of db_file left by an earlier "ram" run.
+    A copy newer than db_file (the run ended without its final snapshot)
+    is first copied over db_file, an older one is stale and only removed.
+
+    Returns:
+        str: "restored" or "removed", None if there was no copy.
+    """
+    path = ram_path(db_file)
+    copy_time = modified_time(path)
+    if copy_time is None:
+        return None
+    disk_time = modified_time(db_file)
+    result = "removed"
+    if disk_time is None or copy_time > disk_time:
+        DatabaseSnapshot(path, db_file).snapshot()
+        result = "restored"
+    for suffix in SQLITE_SUFFIXES:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return result
+
+
+class DatabaseSnapshot:
+    """
+    Atomic copies of a RAM (tmpfs) database to the disk. The copy is made
+    with the sqlite3 backup API from a separate read connection, so the
+    writer is not blocked, written to a temporary file and renamed over the
+    previous snapshot. A power loss loses at most one interval.
+    """
+
+    def __init__(self, source, target, interval=300):
+        """
+        Args:
+            source (str): Live database file on tmpfs.
+            target (str): Snapshot file on the disk.
+            interval (float): Seconds between snapshots in the thread.
+        """
+        self.source = source
+        self.target = target
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        # Metrics
+        self.snapshots = 0
+        self.last_duration = 0.0
+        self.last_error = None
+
+    def restore(self):
+        """
+        Copies the snapshot to the RAM path if the RAM file is missing
+        (e.g. after a reboot). Returns True if a snapshot was restored.
+        """
+        if os.path.exists(self.source) or not os.path.exists(self.target):
+            return False
+        os.makedirs(os.path.dirname(self.source) or ".", exist_ok=True)
+        self.copy(self.target, self.source)
+        return True
+
+    def copy(self, source, target):
+        temp_path = target + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(temp_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        # The renamed file must be complete on the disk
+        fd = os.open(temp_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, target)
+        fd = os.open(os.path.dirname(os.path.abspath(target)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def snapshot(self):
+        """Writes one snapshot now."""
+        with self.lock:
+            started = time.perf_counter()
+            self.copy(self.source, self.target)
+            self.last_duration = time.perf_counter() - started
+            self.snapshots += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.snapshot()
+                self.last_error = None
+            except (sqlite3.Error, OSError) as e:
+                self.last_error = str(e)
+                print(f"Snapshot of {self.source} failed: {e}")
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="db-snapshot", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stops the thread and writes the final snapshot."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.snapshot()
+
+    def metrics(self):
+        return {
+            "snapshots": self.snapshots,
+            "last_duration": self.last_duration,
+        }
@@ -13,6 +13,10 @@ sudo useradd -r -s /bin/false $SERVICE_USER
 
 # Define the Python scripts and services
 PYTHON_SCRIPTS=("sensor-reader.py" "gpio-switch-reader.py" "mgmt-data-reader.py" "han-api.py" "watchdog.py")
+# --supervisor: readers and watchdog in one process (supervisor.py) instead of four services
+if [ "$1" == "--supervisor" ]; then
+    PYTHON_SCRIPTS=("supervisor.py" "han-api.py")
+fi
 SERVICE_DIR="/opt/hservice"
 LOG_DIR="/var/log/hservice"
 
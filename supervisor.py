@@ -0,0 +1,90 @@
+# SUPERVISOR
+# 17.10.2026
+#
+# Runs sensor-reader, mgmt-data-reader, gpio-switch-reader and watchdog
+# as asyncio tasks in one process, instead of one interpreter each.
+# han-api is still run as its own service.
+#
+# A reader module is imported only when its task is enabled. A task that
+# fails is restarted after RESTART_DELAY seconds, the delay doubles on
+# each quick failure up to MAX_RESTART_DELAY. The other tasks keep running.
+#
+# Usage:
+#   python3 supervisor.py                  all TASKS
+#   python3 supervisor.py sensor watchdog  selected tasks
+import asyncio
+import importlib.util
+import os
+import signal
+import sys
+import time
+from metrics import PROFILER
+
+# task name: (script, coroutine function)
+TASKS = {
+    "sensor": ("sensor-reader.py", "readDataAsync"),
+    "mgmt": ("mgmt-data-reader.py", "run_async"),
+    "gpio": ("gpio-switch-reader.py", "run_async"),
+    "watchdog": ("watchdog.py", "run_async"),
+}
+RESTART_DELAY = 5
+MAX_RESTART_DELAY = 300
+# A task that ran this long before failing restarts with RESTART_DELAY again
+STABLE_TIME = 600
+
+# Loaded script modules by task name, shared state for the other tasks
+MODULES = {}
+
+
+def load_script(name, script):
+    """Imports a script file (names with '-' can't be imported normally)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), script)
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def supervise(name):
+    """Runs one task, restarts it with backoff when it fails."""
+    script, function = TASKS[name]
+    delay = RESTART_DELAY
+    while True:
+        started = time.monotonic()
+        try:
+            if name not in MODULES:
+                MODULES[name] = load_script(script[:-3], script)
+            await getattr(MODULES[name], function)()
+            print(f"Supervisor: task {name} finished")
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if time.monotonic() - started >= STABLE_TIME:
+                delay = RESTART_DELAY
+            print(f"Supervisor: task {name} failed: {e!r}, restarting in {delay} s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RESTART_DELAY)
+
+
+async def main(names):
+    tasks = [asyncio.create_task(supervise(name), name=name) for name in names]
+    # systemd stops the service with SIGTERM, let the tasks close their databases
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, lambda: [task.cancel() for task in tasks])
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        print("Supervisor: stopped")
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(TASKS)
+    unknown = [name for name in names if name not in TASKS]
+    if unknown:
+        sys.exit(f"Unknown task(s): {', '.join(unknown)}. Tasks: {', '.join(TASKS)}")
+    print(f"Supervisor: starting {', '.join(names)}")
+    # One SIGUSR1 profiler for all the tasks, readers write their own metrics snapshots
+    PROFILER.install("supervisor")
+    asyncio.run(main(names))
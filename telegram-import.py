@@ -0,0 +1,316 @@
+# TELEGRAM IMPORT
+# 17.10.2026
+#
+# Bulk import of telegram logs (captured serial dumps, e.g. from a box that
+# was offline) into the databases of sensor-reader.py, with its settings
+# (file names, CUTOFF_TIME, HISTORY_15MIN_KEEP, STORE_OBIS, ARCHIVE_DB_FILE).
+#
+# The files are memory mapped and cut into chunks of about CHUNK_SIZE bytes
+# at '/ADN9' headers. A process pool assembles the frames of each chunk
+# (telegram_parser.FrameAssembler, CRC16 checked like on the serial port)
+# and parses them with telegram_parser.parse_frame, the same results as
+# parseData. The chunks are written in order, one transaction per chunk:
+#   sensor_data.db       raw rows (and obis_value rows) with executemany, only
+#                        for telegrams newer than CUTOFF_TIME, older ones would
+#                        be removed by the reader's retention (--all-raw keeps all)
+#   15-min history       quarter rows, hourly/daily/monthly rollups and phase
+#                        statistics through rollup_store like the reader
+#   archive              days before today are packed again with the imported
+#                        rows merged in, then the 15-min rows over
+#                        HISTORY_15MIN_KEEP are pruned
+#
+# Running it again is safe: existing rows are skipped (INSERT OR IGNORE), and
+# a quarter is added to the rollups only if it is neither in the 15-min table
+# nor in the archive and its hour is not complete yet. Without an archive,
+# quarters older than HISTORY_15MIN_KEEP are not imported (there would be no
+# record that they were counted). Stop sensor-reader.py for the import, it
+# continues from the imported rows at its next start. The phase quarter open
+# at the end of the logs is left to the reader (replayed from the raw store)
+# unless its telegrams are older than CUTOFF_TIME or newer quarters exist.
+#
+# Usage:
+#   python3 telegram-import.py dump1.log [dump2.log ...]
+#   python3 telegram-import.py --workers 2 --all-raw capture.log
+# Files are imported in the order of their first telegram.
+import argparse
+import mmap
+import os
+import time
+from multiprocessing import Pool
+
+from archive_store import Archiver, next_day, read_rows
+from rollup_store import EnergyRollup, PhaseStats, PHASE_CODES, TOTAL_ENERGY_KEY, QUARTER, day_start, hour_start
+from sensor_store import SensorWriter, Retention, live_path
+from supervisor import load_script
+from telegram_parser import HEADER, FrameAssembler, parse_frame
+
+CHUNK_SIZE = 8 * 1024 * 1024
+# Bytes read for the first telegram of a file (sorting the files)
+HEAD_SIZE = 16 * 1024
+
+
+class ImportRollup(EnergyRollup):
+    """EnergyRollup that skips quarters already in the rollups."""
+
+    def __init__(self, writer, keep, archive):
+        """
+        Args:
+            writer (SensorWriter): Writer, the archive attached if archive is True.
+            keep (int): HISTORY_15MIN_KEEP, older 15-min rows may have been pruned.
+            archive (bool): Pruned rows are in the archive.
+        """
+        super().__init__(writer)
+        self.keep = keep
+        self.archive = archive
+        # Day start: timestamps of its archived 15-min rows
+        self.archived = {}
+        self.existing = 0
+        self.outside = 0
+
+    def start_at(self, timestamp):
+        """Continues from the newest 15-min row at or before timestamp."""
+        row = self.writer.query_one(
+            "SELECT timestamp, total_energy FROM h15.data WHERE timestamp <= ? "
+            "ORDER BY timestamp DESC LIMIT 1", (timestamp,))
+        self.boundary = tuple(row) if row is not None and row[1] is not None else None
+        self.last_point = None
+
+    def archived_quarters(self, quarter):
+        """Timestamps of the archived 15-min rows of the day of quarter."""
+        day = day_start(quarter)
+        quarters = self.archived.get(day)
+        if quarters is None:
+            rows = read_rows(self.writer.conn, "15min", day, next_day(day) - 1)
+            quarters = self.archived[day] = {row["timestamp"] for row in rows}
+        return quarters
+
+    def write_quarter(self, quarter, quarter_total, consumed, now):
+        # A quarter is counted if its row is in the 15-min table or, pruned
+        # after HISTORY_15MIN_KEEP, in the archive
+        exists = self.writer.query_one("SELECT 1 FROM h15.data WHERE timestamp = ?", (quarter,)) is not None
+        if not exists and self.archive:
+            exists = quarter in self.archived_quarters(quarter)
+        elif not exists and quarter < time.time() - self.keep:
+            self.outside += 1
+            return
+        if not exists:
+            # Quarters backfilled by the reader past HISTORY_15MIN_KEEP are only in the rollups
+            hour = self.writer.query_one(
+                "SELECT quarters FROM h15.hourly WHERE timestamp = ?", (hour_start(quarter - QUARTER),))
+            exists = hour is not None and hour[0] >= 3600 // QUARTER
+        if exists:
+            self.existing += 1
+            return
+        super().write_quarter(quarter, quarter_total, consumed, now)
+
+
+def chunk_ranges(path, chunk_size=CHUNK_SIZE):
+    """(path, start, end) byte ranges of a file, each starting at a header."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = data.find(HEADER)
+        if start < 0:
+            return []
+        ranges = []
+        while start < size:
+            end = data.find(HEADER, start + chunk_size)
+            if end < 0:
+                end = size
+            ranges.append((path, start, end))
+            start = end
+        return ranges
+
+
+def first_timestamp(path):
+    """Timestamp of the first valid telegram of a file, None if there is none."""
+    with open(path, "rb") as file:
+        head = file.read(HEAD_SIZE)
+    for frame, _ in FrameAssembler().feed(head):
+        try:
+            return parse_frame(frame).timestamp
+        except ValueError:
+            continue
+    return None
+
+
+def parse_chunk(task):
+    """
+    Pool worker: assembles and parses the telegrams of one byte range.
+
+    Args:
+        task (tuple): (path, start, end, raw_since), raw rows are returned
+            for telegrams at or after raw_since (None: for all).
+
+    Returns:
+        dict: "telegrams" as (timestamp, total, phase values, raw) tuples
+            in file order, raw is (json, value rows) or None, and counters.
+    """
+    path, start, end, raw_since = task
+    assembler = FrameAssembler()
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        frames = assembler.feed(data[start:end], 0)
+    # A telegram cut off at the end of the file
+    dropped = assembler.dropped + (HEADER in assembler.buffer)
+    telegrams = []
+    errors = 0
+    for frame, _ in frames:
+        try:
+            telegram = parse_frame(frame)
+        except ValueError:
+            errors += 1
+            continue
+        timestamp = telegram.timestamp
+        total = None
+        phase_values = []
+        for key, value in zip(telegram.keys, telegram.values):
+            if key == TOTAL_ENERGY_KEY:
+                total = value
+            elif key in PHASE_CODES:
+                phase_values.append({"key": key, "value": value})
+        raw = None
+        if raw_since is None or timestamp >= raw_since:
+            raw = (telegram.to_json(),
+                   [(timestamp, key, unit, value)
+                    for key, unit, value in zip(telegram.keys, telegram.units, telegram.values)])
+        telegrams.append((timestamp, total, phase_values, raw))
+    return {"telegrams": telegrams, "corrupt": assembler.corrupt, "dropped": dropped, "errors": errors}
+
+
+class Importer:
+    """Writes parsed chunks in order to the reader's databases."""
+
+    def __init__(self, reader, all_raw=False):
+        """
+        Args:
+            reader: sensor-reader.py module, for its settings.
+            all_raw (bool): Raw rows also for telegrams older than CUTOFF_TIME.
+        """
+        self.reader = reader
+        self.raw_since = None if all_raw else int(time.time()) - reader.CUTOFF_TIME
+        self.writer = SensorWriter(live_path(reader.DB_FILE), reader.HISTORY_DB_FILE,
+                                   reader.HISTORY_15MIN_DB_FILE, archive_db_file=reader.ARCHIVE_DB_FILE)
+        self.writer.initialize_schema()
+        if reader.STORE_OBIS:
+            self.writer.initialize_obis_schema()
+        self.rollup = ImportRollup(self.writer, reader.HISTORY_15MIN_KEEP, reader.ARCHIVE_DB_FILE is not None)
+        self.rollup.initialize_schema()
+        self.phases = PhaseStats(self.writer)
+        self.phases.initialize_schema()
+        self.archiver = None
+        if reader.ARCHIVE_DB_FILE is not None:
+            self.archiver = Archiver(self.writer)
+            self.archiver.initialize_schema()
+        # Oldest and newest imported telegram
+        self.first = None
+        self.last = None
+        # Counters
+        self.telegrams = 0
+        self.raw_rows = 0
+        self.corrupt = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def write_chunk(self, result):
+        """Stores one parse_chunk result in one transaction."""
+        telegrams = result["telegrams"]
+        self.corrupt += result["corrupt"]
+        self.dropped += result["dropped"]
+        self.errors += result["errors"]
+        if not telegrams:
+            return
+        raw = [(timestamp, raw[0]) for timestamp, _, _, raw in telegrams if raw is not None]
+        if raw:
+            self.raw_rows += self.writer.insert_sensor_rows(raw)
+            if self.reader.STORE_OBIS:
+                self.writer.insert_value_rows(
+                    [row for _, _, _, raw in telegrams if raw is not None for row in raw[1]])
+        if self.first is None:
+            self.rollup.start_at(telegrams[0][0])
+            self.first = telegrams[0][0]
+        rollup_add = self.rollup.add
+        phases_add = self.phases.add
+        for timestamp, total, phase_values, _ in telegrams:
+            phases_add(timestamp, phase_values)
+            if total is not None:
+                rollup_add(timestamp, total)
+        self.first = min(self.first, telegrams[0][0])
+        self.last = max(self.last or telegrams[-1][0], telegrams[-1][0])
+        self.telegrams += len(telegrams)
+        self.writer.commit()
+
+    def finish(self):
+        """Archives the imported days and prunes the expired 15-min rows."""
+        self.flush_phases()
+        partitions = 0
+        if self.archiver is not None and self.first is not None:
+            # From the end of the archive if the import starts later
+            row = self.writer.query_one("SELECT MIN(end_ts) FROM (SELECT MAX(end_ts) AS end_ts "
+                                        "FROM archive.partitions GROUP BY series)")
+            since = self.first if row[0] is None else min(self.first, row[0])
+            partitions = self.archiver.archive_range(since, time.time())
+        removed = 0
+        for table in ("h15.data", "h15.phases"):
+            retention = Retention(self.writer, table, self.reader.HISTORY_15MIN_KEEP, batch_size=5000)
+            while True:
+                pruned = retention.prune()
+                removed += pruned
+                if not pruned:
+                    break
+        self.writer.commit()
+        self.writer.close()
+        return partitions, removed
+
+    def flush_phases(self):
+        """
+        Writes the phase quarter open at the end of the logs if the reader
+        can't complete it: its raw rows are older than CUTOFF_TIME (not
+        stored or removed soon) or newer quarters exist (not replayed).
+        """
+        phases = self.phases
+        if not phases.stats:
+            return
+        newest = self.writer.query_one("SELECT MAX(timestamp) FROM h15.phases")[0]
+        if self.last < time.time() - self.reader.CUTOFF_TIME or (newest is not None and newest > phases.quarter):
+            phases.write()
+            phases.stats = {}
+            self.writer.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports telegram logs into the sensor-reader databases")
+    parser.add_argument("files", nargs="+", help="telegram logs (raw serial dumps)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="parser processes")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE // (1024 * 1024), help="chunk size, MB")
+    parser.add_argument("--all-raw", action="store_true",
+                        help="raw rows also for telegrams older than CUTOFF_TIME")
+    args = parser.parse_args()
+
+    reader = load_script("sensor-reader", "sensor-reader.py")
+    started = time.perf_counter()
+    files = sorted((first_timestamp(path) or 0, path) for path in args.files)
+    importer = Importer(reader, args.all_raw)
+    tasks = [(path, start, end, importer.raw_since)
+             for _, path in files for path, start, end in chunk_ranges(path, args.chunk * 1024 * 1024)]
+    with Pool(max(1, args.workers)) as pool:
+        for result in pool.imap(parse_chunk, tasks):
+            importer.write_chunk(result)
+    partitions, removed = importer.finish()
+    elapsed = time.perf_counter() - started
+
+    print(f"Imported {importer.telegrams} telegrams from {len(files)} files in {elapsed:.1f} s "
+          f"({importer.telegrams / elapsed:.0f} telegrams/s), "
+          f"corrupt {importer.corrupt}, dropped {importer.dropped}, parse errors {importer.errors}")
+    print(f"{reader.DB_FILE}: {importer.raw_rows} new rows")
+    rollup = importer.rollup
+    print(f"{reader.HISTORY_15MIN_DB_FILE}: {rollup.quarters - rollup.existing - rollup.outside} new quarters, "
+          f"{rollup.existing} already stored, {rollup.outside} outside HISTORY_15MIN_KEEP without an archive, "
+          f"{importer.phases.rows} phase rows (existing skipped), "
+          f"{removed} rows over HISTORY_15MIN_KEEP pruned")
+    if importer.archiver is not None:
+        print(f"{reader.ARCHIVE_DB_FILE}: {partitions} day partitions written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# TELEGRAM PARSER
+# 17.10.2026
+#
+# Fast parser for AIDON HAN telegrams (IEC 62056-21 mode D, "/ADN9 ... !").
+# Works on the raw bytes of one frame, no per-line decode or regex calls:
+# - all value lines are tokenized with one precompiled findall over the frame
+# - OBIS code and unit strings are decoded once and then reused from a cache
+# - the timestamp uses the cached epoch of the telegram date, only the
+#   time of day is computed per telegram
+# Results are the same as sensor-reader.py parseData/parseTimestamp/parseValue.
+#
+# FrameAssembler cuts frames out of the raw serial byte stream and checks
+# the CRC16 after the '!' before a frame is parsed. The meter always sends
+# the CRC, a frame cut off right after the '!' is dropped.
+import calendar
+import json
+import re
+import sys
+import time
+from array import array
+
+# Same fixed offset as the original parseTimestamp (local time = UTC+2)
+UTC_OFFSET = 2 * 3600
+
+HEADER = b"/ADN9"
+# Longest accepted frame, a 3-phase telegram is about 700 bytes
+MAX_FRAME = 4096
+TIMESTAMP_RE = re.compile(rb"^0-0:1\.0\.0\((\d{12})[SW]\)", re.M)
+VALUE_RE = re.compile(rb"^(1-0:[^\r\n]+?)\(([\d.]+)\*([^)\r\n]+)\)", re.M)
+
+# bytes -> str caches, OBIS codes and units repeat in every telegram
+_strings = {}
+# yymmdd -> epoch of local midnight
+_day_epochs = {}
+
+
+class Telegram:
+    """One parsed telegram, values as parallel lists."""
+
+    __slots__ = ("timestamp", "keys", "values", "units")
+
+    def __init__(self, timestamp, keys, values, units):
+        self.timestamp = timestamp
+        self.keys = keys
+        self.values = values
+        self.units = units
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, default=None):
+        """Returns the value of one OBIS code."""
+        try:
+            return self.values[self.keys.index(key)]
+        except ValueError:
+            return default
+
+    def as_values(self):
+        """Values in the original list of dicts format."""
+        return [{"key": k, "value": v, "unit": u}
+                for k, v, u in zip(self.keys, self.values, self.units)]
+
+    def as_dict(self):
+        """Telegram in the original parseData format."""
+        return {"values": self.as_values(), "timestamp": self.timestamp}
+
+    def to_json(self):
+        """Values as the JSON text stored in sensor_data.db."""
+        return json.dumps(self.as_values())
+
+
+def _string(raw):
+    s = _strings.get(raw)
+    if s is None:
+        s = _strings[raw] = raw.decode("ascii")
+    return s
+
+
+def parse_timestamp(digits):
+    """
+    Converts 'yymmddhhmmss' (bytes) to a unix timestamp.
+
+    Raises:
+        ValueError: If the date or time is invalid.
+    """
+    day = digits[:6]
+    epoch = _day_epochs.get(day)
+    if epoch is None:
+        year, month, mday = 2000 + int(day[0:2]), int(day[2:4]), int(day[4:6])
+        if not 1 <= month <= 12 or not 1 <= mday <= calendar.monthrange(year, month)[1]:
+            raise ValueError(f"Invalid telegram date {day!r}")
+        epoch = _day_epochs[day] = calendar.timegm((year, month, mday, 0, 0, 0)) - UTC_OFFSET
+    hour, minute, second = int(digits[6:8]), int(digits[8:10]), int(digits[10:12])
+    if hour > 23 or minute > 59 or second > 59:
+        raise ValueError(f"Invalid telegram time {digits!r}")
+    return epoch + hour * 3600 + minute * 60 + second
+
+
+def parse_frame(frame):
+    """
+    Parses one telegram.
+
+    Args:
+        frame (bytes): Telegram from the '/ADN9' header to the '!' line.
+
+    Returns:
+        Telegram: Parsed telegram.
+
+    Raises:
+        ValueError: If the timestamp is missing or a value line is malformed.
+    """
+    match = TIMESTAMP_RE.search(frame)
+    if match is None:
+        raise ValueError("No timestamp found in the input string.")
+    timestamp = parse_timestamp(match.group(1))
+
+    tokens = VALUE_RE.findall(frame)
+    # Every '1-0:' line must be a value, like in parseValue
+    if len(tokens) != frame.count(b"\n1-0:") + frame.startswith(b"1-0:"):
+        raise ValueError("Input string does not match the expected format.")
+    keys = [_string(t[0]) for t in tokens]
+    values = [float(t[1]) for t in tokens]
+    units = [_string(t[2]) for t in tokens]
+    return Telegram(timestamp, keys, values, units)
+
+
+def parse_lines(lines):
+    """parse_frame() for a list of already decoded lines."""
+    return parse_frame("\n".join(lines).encode("ascii"))
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+def _crc16_word_table(table):
+    """
+    Two bytes per lookup: after 16 bits the register only depends on
+    crc ^ word, the table holds the result for each of the 65536 values.
+    Indexed by native 16-bit words (memoryview.cast), 128 kB.
+    """
+    words = array("H", bytes(2 * 65536))
+    swap = sys.byteorder == "big"
+    for value in range(65536):
+        low = table[value & 0xFF]
+        crc = (low >> 8) ^ table[((value >> 8) ^ low) & 0xFF]
+        words[((value & 0xFF) << 8 | value >> 8) if swap else value] = crc
+    return words
+
+
+_CRC16_TABLE = _crc16_table()
+_CRC16_WORD_TABLE = _crc16_word_table(_CRC16_TABLE)
+
+
+def crc16(data):
+    """CRC-16/ARC of the telegram, '/' to '!' inclusive."""
+    crc = 0
+    even = len(data) & ~1
+    words = _CRC16_WORD_TABLE
+    if sys.byteorder == "big":
+        for word in memoryview(data)[:even].cast("H"):
+            crc = words[crc ^ ((word & 0xFF) << 8 | word >> 8)]
+    else:
+        for word in memoryview(data)[:even].cast("H"):
+            crc = words[crc ^ word]
+    if even != len(data):
+        crc = (crc >> 8) ^ _CRC16_TABLE[(crc ^ data[-1]) & 0xFF]
+    return crc
+
+
+class FrameAssembler:
+    """
+    Assembles telegrams from serial port reads of any size.
+
+    Bytes are collected into a bytearray and scanned for the '/ADN9'
+    header and the '!' line. A frame ending '!XXXX' must have a matching
+    CRC16, a frame ending with a bare '!' is dropped unless accept_unchecked
+    is set.
+    """
+
+    def __init__(self, max_frame=MAX_FRAME, accept_unchecked=False):
+        self.buffer = bytearray()
+        self.max_frame = max_frame
+        # Frames without a CRC (e.g. hand written test logs) are passed on unchecked
+        self.accept_unchecked = accept_unchecked
+        # Counters
+        self.frames = 0
+        self.corrupt = 0
+        self.dropped = 0
+        self.unchecked = 0
+        self.discarded_bytes = 0
+
+    def feed(self, data, received=None):
+        """
+        Adds bytes read from the serial port.
+
+        Args:
+            data (bytes): Bytes read.
+            received (float): time.monotonic() of the read, default now.
+
+        Returns:
+            list: (frame, received) tuples of the completed valid frames.
+        """
+        received = time.monotonic() if received is None else received
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        while True:
+            start = buffer.find(HEADER)
+            if start < 0:
+                # Keep a possible partial header at the end
+                keep = len(HEADER) - 1
+                if len(buffer) > keep:
+                    self.discarded_bytes += len(buffer) - keep
+                    del buffer[:-keep]
+                break
+            if start:
+                self.discarded_bytes += start
+                del buffer[:start]
+            end = buffer.find(b"!", len(HEADER))
+            # A new header before the end: the previous frame was cut off
+            restart = buffer.find(HEADER, len(HEADER), end if end >= 0 else len(buffer))
+            if restart >= 0:
+                self.drop(restart)
+                continue
+            if end < 0:
+                if len(buffer) > self.max_frame:
+                    self.drop(len(HEADER))
+                    continue
+                break
+            line_end = buffer.find(b"\n", end)
+            if line_end < 0:
+                if len(buffer) - end > 8:
+                    self.drop(end + 1)
+                    continue
+                break
+            frame = bytes(buffer[:line_end + 1])
+            del buffer[:line_end + 1]
+            if self.check(frame, end):
+                self.frames += 1
+                frames.append((frame, received))
+        return frames
+
+    def check(self, frame, end):
+        """Validates the CRC16 following the '!' at index end."""
+        crc_text = frame[end + 1:].strip()
+        if not crc_text:
+            if self.accept_unchecked:
+                self.unchecked += 1
+                return True
+            # Cut off after the '!', the CRC was lost
+            self.dropped += 1
+            return False
+        try:
+            if int(crc_text, 16) == crc16(frame[:end + 1]):
+                return True
+        except ValueError:
+            pass
+        self.corrupt += 1
+        return False
+
+    def drop(self, length):
+        """Discards an incomplete frame from the start of the buffer."""
+        self.dropped += 1
+        self.discarded_bytes += length
+        del self.buffer[:length]
+
+    def metrics(self):
+        """Returns the frame counters as a dict."""
+        return {
+            "frames": self.frames,
+            "corrupt": self.corrupt,
+            "dropped": self.dropped,
+            "unchecked": self.unchecked,
+            "discarded_bytes": self.discarded_bytes,
+        }
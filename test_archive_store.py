@@ -0,0 +1,77 @@
+# TEST ARCHIVE STORE
+# 17.10.2026
+#
+# pytest cases for archive_store.py: the partition format round trip and
+# the repacking of archived days that get rows afterwards.
+import zlib
+
+import pytest
+
+from archive_store import SERIES, TEXT, Archiver, decode_partition, encode_partition, next_day, read_rows
+from rollup_store import day_start
+from sensor_store import SensorWriter
+
+
+def test_partition_round_trip():
+    columns = (("timestamp", 0), ("obis", TEXT), ("avg", 3), ("min", 1), ("samples", 0))
+    rows = [
+        (1760000000, "1-0:21.7.0", 1.234, 0.5, 90),
+        (1760000900, "1-0:21.7.0", None, None, 0),
+        (1760001800, "1-0:31.7.0", 12345.678, -3.5, 91),
+        (1760002700, None, -0.001, 230.1, 89),
+        (1760001000, "1-0:21.7.0", 0.0, 0.0, 90),
+    ]
+    names, decoded = decode_partition(encode_partition(columns, rows))
+    assert names == [name for name, _ in columns]
+    assert decoded == rows
+
+
+def test_partition_common_step():
+    # 1 decimal values stored with 3 decimals: the step is 100, not 1
+    columns = (("timestamp", 0), ("total_energy", 3))
+    rows = [(900 * i, 100.0 + i / 10) for i in range(96)]
+    names, decoded = decode_partition(encode_partition(columns, rows))
+    assert decoded == [(t, pytest.approx(v, abs=1e-9)) for t, v in rows]
+
+
+def test_partition_all_null_and_empty():
+    columns = (("timestamp", 0), ("obis", TEXT), ("avg", 3))
+    rows = [(1, None, None), (2, None, None)]
+    assert decode_partition(encode_partition(columns, rows)) == (["timestamp", "obis", "avg"], rows)
+    assert decode_partition(encode_partition(columns, [])) == (["timestamp", "obis", "avg"], [])
+
+
+def test_partition_unknown_version():
+    with pytest.raises(ValueError):
+        decode_partition(zlib.compress(b"\x09\x00\x00"))
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = SensorWriter(str(tmp_path / "sensor_data.db"), str(tmp_path / "history.db"),
+                          str(tmp_path / "15min.db"), archive_db_file=str(tmp_path / "archive.db"))
+    writer.initialize_schema()
+    yield writer
+    writer.close()
+
+
+def test_archive_range_merges_late_rows(writer):
+    archiver = Archiver(writer, {"15min": SERIES["15min"]})
+    archiver.initialize_schema()
+    day = day_start(1760000000)
+    now = next_day(next_day(day))
+    for quarter in range(day + 900, day + 8 * 900, 900):
+        writer.insert_15min(quarter, 100.0, 0.25)
+    assert archiver.archive_closed(now) == 1
+    writer.commit()
+
+    # A backfilled quarter and a changed copy of an archived one
+    writer.insert_15min(day + 12 * 900, 101.0, 0.5)
+    writer.execute("UPDATE h15.data SET consumed_energy = 9.0 WHERE timestamp = ?", (day + 900,))
+    assert archiver.archive_range(day + 12 * 900, now) == 1
+    writer.commit()
+
+    rows = list(read_rows(writer.conn, "15min", day, next_day(day) - 1))
+    assert [row["timestamp"] for row in rows] == [day + i * 900 for i in (1, 2, 3, 4, 5, 6, 7, 12)]
+    # The archived row is kept
+    assert rows[0]["consumed_energy"] == 0.25
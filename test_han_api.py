@@ -0,0 +1,120 @@
+# TEST HAN API
+# 17.10.2026
+#
+# pytest cases for han-api.py, run through Flask's test client.
+import importlib.util
+import os
+import sqlite3
+import time
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def han_api():
+    pytest.importorskip("flask_cors")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "han-api.py")
+    spec = importlib.util.spec_from_file_location("han_api", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def helsinki():
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Europe/Helsinki"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+@pytest.fixture
+def history_15min(han_api, tmp_path, monkeypatch):
+    """An empty sensor_data_15min.db as the aggregate source '15min'."""
+    db_file = str(tmp_path / "sensor_data_15min.db")
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE data (timestamp INTEGER PRIMARY KEY, total_energy REAL, consumed_energy REAL)")
+    conn.commit()
+    _, fields, interval = han_api.AGGREGATE_SOURCES["15min"]
+    monkeypatch.setitem(han_api.AGGREGATE_SOURCES, "15min", (db_file, fields, interval))
+    yield conn
+    conn.close()
+
+
+def local(year, month, day, hour, minute=0):
+    return int(time.mktime((year, month, day, hour, minute, 0, 0, 0, -1)))
+
+
+def test_aggregate_buckets_by_interval_start(han_api, helsinki, history_15min):
+    midnight = local(2026, 10, 17, 0)
+    # Quarters ending 23:45, 00:00 (the last one of 16.10.) and 00:15
+    history_15min.executemany("INSERT INTO data VALUES (?, ?, ?)", [
+        (midnight - 900, 100.0, 0.25), (midnight, 100.5, 0.5), (midnight + 900, 101.5, 1.0)])
+    history_15min.commit()
+    client = han_api.app.test_client()
+
+    days = client.get("/api/aggregate?source=15min&bucket=day&agg=sum").get_json()
+    assert [(row["timestamp"], row["value"], row["samples"]) for row in days] == [
+        (midnight, 1.0, 1), (local(2026, 10, 16, 0), 0.75, 2)]
+
+    hours = client.get("/api/aggregate?source=15min&bucket=hour&agg=sum").get_json()
+    assert [(row["timestamp"], row["value"]) for row in hours] == [(midnight, 1.0), (midnight - 3600, 0.75)]
+
+    # since/until select the quarters by their start
+    day = client.get(f"/api/aggregate?source=15min&bucket=day&agg=sum&since={midnight}").get_json()
+    assert [(row["timestamp"], row["value"]) for row in day] == [(midnight, 1.0)]
+
+
+def test_aggregate_includes_archived_rows(han_api, helsinki, history_15min, tmp_path, monkeypatch):
+    archive_store = han_api.archive_store
+    archive_db = str(tmp_path / "sensor_data_archive.db")
+    monkeypatch.setattr(han_api, "ARCHIVE_DB", archive_db)
+    day = local(2026, 10, 16, 0)
+    today = local(2026, 10, 17, 0)
+    # 16.10. is archived, its last quarter (00:00) is also still in the hot table
+    archived = [(day + i * 900, 100.0 + i * 0.25, 0.25) for i in range(1, 97)]
+    conn = sqlite3.connect(archive_db)
+    archive_store.create_schema(conn.execute)
+    conn.execute("INSERT INTO partitions VALUES (?, ?, ?, ?, ?)", (
+        "15min", day, today, len(archived),
+        archive_store.encode_partition(archive_store.SERIES["15min"][1], archived)))
+    conn.commit()
+    conn.close()
+    history_15min.executemany("INSERT INTO data VALUES (?, ?, ?)", [
+        (today, 124.0, 0.25), (today + 900, 124.5, 0.5)])
+    history_15min.commit()
+    client = han_api.app.test_client()
+
+    days = client.get("/api/aggregate?source=15min&bucket=day&agg=sum").get_json()
+    assert [(row["timestamp"], row["value"], row["samples"]) for row in days] == [
+        (today, 0.5, 1), (day, pytest.approx(24.0), 96)]
+
+    # One month bucket from both, the hot row of 00:00 counted once
+    month = client.get("/api/aggregate?source=15min&bucket=month&agg=avg").get_json()
+    assert [(row["samples"], row["value"]) for row in month] == [(97, pytest.approx(24.5 / 97))]
+    last = client.get("/api/aggregate?source=15min&bucket=month&agg=last&field=total_energy").get_json()
+    assert last[0]["value"] == 124.5
+
+    # A range that is only in the archive
+    until = day + 12 * 3600
+    hours = client.get(f"/api/aggregate?source=15min&bucket=hour&agg=max&since={day}&until={until}").get_json()
+    assert len(hours) == 13
+    assert hours[0]["timestamp"] == until
+
+    # count cuts the buckets, the oldest one returned is still complete
+    days = client.get("/api/aggregate?source=15min&bucket=day&agg=sum&count=2").get_json()
+    assert [(row["value"], row["samples"]) for row in days] == [(0.5, 1), (pytest.approx(24.0), 96)]
+
+
+def test_obis_values_not_stored(han_api, tmp_path, monkeypatch):
+    db_file = str(tmp_path / "sensor_data.db")
+    sqlite3.connect(db_file).execute("CREATE TABLE data (timestamp INTEGER PRIMARY KEY, sensor_data TEXT)")
+    monkeypatch.setattr(han_api, "sensor_db", lambda: db_file)
+    client = han_api.app.test_client()
+    assert client.get("/api/sensor_values?obis=1-0:1.7.0").status_code == 404
+    assert client.get("/api/aggregate?obis=1-0:1.7.0").status_code == 404
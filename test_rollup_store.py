@@ -0,0 +1,112 @@
+# TEST ROLLUP STORE
+# 17.10.2026
+#
+# pytest cases for rollup_store.py: quarters backfilled after a break that
+# crosses midnight or a DST change land in the right hour/day rollups, and
+# abort_frame() restores the state of a rolled back telegram.
+import os
+import time
+
+import pytest
+
+from rollup_store import QUARTER, EnergyRollup, day_start
+from sensor_store import SensorWriter
+
+# 1 kWh per hour, 0.25 kWh per quarter
+RATE = 1 / 3600
+
+
+@pytest.fixture
+def helsinki():
+    """Local time of the meter, DST changes at 03:00/04:00 local."""
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Europe/Helsinki"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = SensorWriter(str(tmp_path / "sensor_data.db"), str(tmp_path / "history.db"),
+                          str(tmp_path / "15min.db"))
+    writer.initialize_schema()
+    yield writer
+    writer.close()
+
+
+def local(year, month, day, hour, minute=0, second=0):
+    return int(time.mktime((year, month, day, hour, minute, second, 0, 0, -1)))
+
+
+def rollup_rows(writer, table):
+    return {row[0]: (row[1], row[2]) for row in writer.conn.execute(
+        f"SELECT timestamp, consumed_energy, quarters FROM h15.{table}")}
+
+
+def feed(rollup, timestamps, start):
+    written = 0
+    for timestamp in timestamps:
+        written += rollup.add(timestamp, round(1000 + (timestamp - start) * RATE, 3))
+    return written
+
+
+@pytest.mark.parametrize("date", [(2026, 1, 14), (2026, 3, 29), (2026, 10, 25)])
+def test_backfill_across_midnight(helsinki, writer, date):
+    """A break from 22:00 to 12:00, over midnight (and the DST change on 29.3. and 25.10.)."""
+    rollup = EnergyRollup(writer)
+    rollup.initialize_schema()
+    year, month, mday = date
+    midnight = local(year, month, mday, 0)
+    before = local(*time.localtime(midnight - 7200)[:3], 22)
+    noon = local(year, month, mday, 12)
+    # Two telegrams around 22:00 write its quarter, the break ends after 12:00
+    assert feed(rollup, [before - 10, before + 10], before) == 1
+    written = feed(rollup, [noon + 10], before)
+    writer.commit()
+
+    quarters_today = (noon - midnight) // QUARTER
+    assert quarters_today == {(2026, 3, 29): 44, (2026, 10, 25): 52}.get(date, 48)
+    assert written == 8 + quarters_today
+    assert rollup.backfilled == written
+    assert rollup.pop_backfill_start() == before + QUARTER
+    assert rollup.pop_backfill_start() is None
+
+    daily = rollup_rows(writer, "daily")
+    assert sorted(daily) == [day_start(before), midnight]
+    assert daily[day_start(before)] == (pytest.approx(2.0), 8)
+    assert daily[midnight] == (pytest.approx(quarters_today / 4), quarters_today)
+    hourly = rollup_rows(writer, "hourly")
+    assert len(hourly) == 2 + quarters_today // 4
+    assert all(quarters == 4 and consumed == pytest.approx(1.0) for consumed, quarters in hourly.values())
+    # Every quarter also has its 15-min row
+    assert writer.query_one("SELECT COUNT(*) FROM h15.data")[0] == written + 1
+
+
+def test_abort_frame_restores_state(helsinki, writer):
+    rollup = EnergyRollup(writer)
+    rollup.initialize_schema()
+    start = local(2026, 10, 24, 23, 40)
+    feed(rollup, [start, start + 10], start)
+    state = (rollup.boundary, rollup.last_point, rollup.metrics())
+
+    writer.begin_frame()
+    rollup.begin_frame()
+    assert feed(rollup, [start + 3600], start) == 4
+    writer.abort_frame()
+    rollup.abort_frame()
+    assert (rollup.boundary, rollup.last_point, rollup.metrics()) == state
+    assert rollup.pop_backfill_start() is None
+
+    # The same telegram again writes the same quarters
+    writer.begin_frame()
+    rollup.begin_frame()
+    assert feed(rollup, [start + 3600], start) == 4
+    writer.frame_done()
+    writer.commit()
+    # The first quarter has no consumption, there was no quarter before it
+    assert writer.query_one("SELECT SUM(quarters) FROM h15.daily")[0] == 3
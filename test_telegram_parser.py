@@ -0,0 +1,111 @@
+# TEST TELEGRAM PARSER
+# 17.10.2026
+#
+# pytest cases for telegram_parser.py: crc16 against a bitwise reference
+# and parse_frame against the original parser of sensor-reader.py.
+import importlib.util
+import os
+import random
+
+import pytest
+
+import telegram_parser
+
+# 3-phase meter example (AIDON HAN interface description 3.4.2), shortened
+OBIS_UNITS = [
+    ("1-0:1.8.0", "kWh", "{:012.3f}"), ("1-0:2.8.0", "kWh", "{:012.3f}"),
+    ("1-0:1.7.0", "kW", "{:08.3f}"), ("1-0:21.7.0", "kW", "{:08.3f}"),
+    ("1-0:41.7.0", "kW", "{:08.3f}"), ("1-0:61.7.0", "kW", "{:08.3f}"),
+    ("1-0:3.7.0", "kVAr", "{:08.3f}"), ("1-0:32.7.0", "V", "{:05.1f}"),
+    ("1-0:52.7.0", "V", "{:05.1f}"), ("1-0:31.7.0", "A", "{:05.1f}"),
+]
+
+
+def crc16_bitwise(data):
+    """CRC-16/ARC one bit at a time (reflected polynomial 0xA001, init 0)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def make_frame(stamp, values):
+    lines = ["/ADN9 6534", "", f"0-0:1.0.0({stamp}W)"]
+    for (code, unit, fmt), value in zip(OBIS_UNITS, values):
+        lines.append(f"{code}({fmt.format(value)}*{unit})")
+    lines.append("!")
+    frame = "\r\n".join(lines).encode("ascii")
+    return frame + b"%04X\r\n" % telegram_parser.crc16(frame)
+
+
+@pytest.fixture(scope="module")
+def parse_data():
+    """sensor-reader.parseData, the original line based parser."""
+    pytest.importorskip("serial")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensor-reader.py")
+    spec = importlib.util.spec_from_file_location("sensor_reader", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    def parse(frame):
+        return module.parseData([line.decode("utf-8").strip() for line in frame.splitlines()])
+    return parse
+
+
+def test_crc16_check_value():
+    assert telegram_parser.crc16(b"123456789") == 0xBB3D
+    assert telegram_parser.crc16(b"") == 0
+
+
+@pytest.mark.parametrize("length", [1, 2, 3, 64, 255, 700, 701])
+def test_crc16_matches_bitwise(length):
+    data = random.Random(length).randbytes(length)
+    assert telegram_parser.crc16(data) == crc16_bitwise(data)
+    # Also from an offset, the word table reads two bytes at a time
+    assert telegram_parser.crc16(data[1:]) == crc16_bitwise(data[1:])
+
+
+def test_parse_frame_matches_parse_data(parse_data):
+    rng = random.Random(4)
+    for stamp in ("251201000000", "251231235959", "240229120000", "261025035900"):
+        values = [rng.uniform(0, 99999) if unit.endswith("h") else rng.uniform(0, 999)
+                  for _, unit, _ in OBIS_UNITS]
+        frame = make_frame(stamp, values)
+        assert parse_data(frame) == telegram_parser.parse_frame(frame).as_dict()
+
+
+def test_parse_frame_errors_match(parse_data):
+    frame = make_frame("251201000000", [1.0] * len(OBIS_UNITS))
+    malformed = frame.replace(b"1-0:1.7.0(0001.000*kW)", b"1-0:1.7.0(abc*kW)")
+    assert malformed != frame
+    with pytest.raises(ValueError):
+        parse_data(malformed)
+    with pytest.raises(ValueError):
+        telegram_parser.parse_frame(malformed)
+    with pytest.raises(ValueError):
+        telegram_parser.parse_frame(frame.replace(b"0-0:1.0.0(", b"0-0:9.0.0("))
+    with pytest.raises(ValueError):
+        telegram_parser.parse_frame(frame.replace(b"251201", b"251301"))
+
+
+def test_frame_assembler_checks_crc():
+    frame = make_frame("251201000000", [2.0] * len(OBIS_UNITS))
+    corrupt = frame.replace(b"0002.000*kW", b"0002.001*kW", 1)
+    assembler = telegram_parser.FrameAssembler()
+    frames = assembler.feed(b"garbage" + frame[:100], received=1.0)
+    frames += assembler.feed(frame[100:] + corrupt, received=2.0)
+    assert [data for data, _ in frames] == [frame]
+    assert assembler.corrupt == 1
+
+
+def test_frame_assembler_drops_frame_without_crc():
+    frame = make_frame("251201000000", [2.0] * len(OBIS_UNITS))
+    bare = frame[:frame.index(b"!") + 1] + b"\r\n"
+    assembler = telegram_parser.FrameAssembler()
+    assert assembler.feed(bare + frame, received=1.0) == [(frame, 1.0)]
+    assert (assembler.dropped, assembler.unchecked) == (1, 0)
+    assembler = telegram_parser.FrameAssembler(accept_unchecked=True)
+    assert assembler.feed(bare, received=1.0) == [(bare, 1.0)]
+    assert (assembler.dropped, assembler.unchecked) == (0, 1)
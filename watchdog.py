@@ -5,16 +5,33 @@
 # Notifications by mail may be added later
 # 19.4.2025 set treshold and intervals literals. Corrected local time zone error
 # 0.4 3.5.2025 added comments, text file name changed, edited exit info
+# 0.5 17.10.2026 run_async() for supervisor.py
+# 0.6 17.10.2026 WATCHDOG_MODE = "heartbeat": readers report each write (heartbeat.py),
+#                lateness detected at the per-source deadline, no database polling.
+#                Health also written as JSON to HEALTH_FILE for han-api /api/monitor
+# 0.7 17.10.2026 Optional per-database "alert" seconds, used for gpio_data which is
+#                written only every HEARTBEAT_INTERVAL in the GPIO reader's edge mode
+# 0.8 17.10.2026 sensor_data.db is read from tmpfs when sensor-reader keeps it in RAM
+import asyncio
+import json
+import os
+import select
+import socket
 import sqlite3
 import time
 from datetime import datetime
 import pytz
+from heartbeat import HEARTBEAT_ADDRESS, MIN_ALERT, HealthTracker
+from sensor_store import live_path
 
-# List of database files to check
+# List of database files to check, source is the heartbeat source name.
+# alert: seconds without data before the source is late, ALERT_TRESHOLD (poll
+# mode) or heartbeat.MIN_ALERT (heartbeat mode) when not given.
 DATABASES = [
-    {"file": "sensor_data.db", "name": "Sensor Data"},
-    {"file": "mgmt_data.db", "name": "Management Data"},
-    {"file": "gpio_data.db", "name": "GPIO Data"}
+    {"file": "sensor_data.db", "name": "Sensor Data", "source": "sensor"},
+    {"file": "mgmt_data.db", "name": "Management Data", "source": "mgmt"},
+    # gpio-switch-reader.py edge mode: a row every HEARTBEAT_INTERVAL (300 s)
+    {"file": "gpio_data.db", "name": "GPIO Data", "source": "gpio", "alert": 660}
 ]
 
 REPORT_FILE = "watchdog.txt"
@@ -22,6 +39,11 @@ WRITE_MODE="w"
 APPEND_MODE="a"
 ALERT_TRESHOLD = 60
 READ_INTERVAL = 30
+# "heartbeat": event driven, "poll": MAX(timestamp) every READ_INTERVAL seconds
+WATCHDOG_MODE = "heartbeat"
+HEALTH_FILE = "watchdog.json"
+# Heartbeat mode: reports are written on status changes and at least this often
+REPORT_INTERVAL = 30
 
 
 def get_local_time():
@@ -45,7 +67,8 @@ def get_latest_timestamp(db_file):
     Returns:
         int: The latest timestamp from the database, or None if no records exist.
     """
-    conn = sqlite3.connect(db_file)
+    # The RAM copy is newer than its snapshot on the disk
+    conn = sqlite3.connect(live_path(db_file))
     conn.row_factory = sqlite3.Row  # Enable row access by column name
     cursor = conn.cursor()
 
@@ -80,7 +103,6 @@ def check_databases():
     Checks each database and reports if the latest timestamp is more than one minute old.
     """
     current_time = int(time.time())
-    alert_timestamp = current_time - ALERT_TRESHOLD  # look backwards
 
     # Get local time string for the report header
     loctime = get_local_time()
@@ -94,18 +116,129 @@ def check_databases():
             report_lines.append(f"{db['name']}: No data found.")
         else:
             # Check if the timestamp is more than ALERT_TRESHOLD old
-            if latest_timestamp < alert_timestamp:
-                report_lines.append(f"{db['name']}: Latest timestamp is more than {ALERT_TRESHOLD} seconds old!")
+            alert = db.get("alert", ALERT_TRESHOLD)
+            if latest_timestamp < current_time - alert:  # look backwards
+                report_lines.append(f"{db['name']}: Latest timestamp is more than {alert} seconds old!")
             else:
-                report_lines.append(f"{db['name']}: Latest timestamp is recent (within {ALERT_TRESHOLD} seconds).")
+                report_lines.append(f"{db['name']}: Latest timestamp is recent (within {alert} seconds).")
 
     # Combine all report lines into one string
     full_report = "\n".join(report_lines)
     write_report(message = full_report, mode = WRITE_MODE)
 
+class HeartbeatWatchdog:
+    """
+    Heartbeat mode. Sources are updated from the readers' heartbeats and
+    marked late when their deadline passes. The databases are read only
+    once at start to seed the latest timestamps.
+    """
+
+    def __init__(self):
+        self.tracker = HealthTracker([(db["source"], db["name"], db.get("alert", MIN_ALERT))
+                                      for db in DATABASES])
+        for db in DATABASES:
+            latest_timestamp = get_latest_timestamp(db["file"])
+            if latest_timestamp is not None:
+                self.tracker.sources[db["source"]].seed(latest_timestamp)
+        self.next_report = 0
+
+    def handle(self, message):
+        """Handles one heartbeat, reports at once if a late source recovered."""
+        health = self.tracker.receive(message)
+        if health is not None and health.recovered:
+            self.next_report = 0
+
+    def timeout(self):
+        """Seconds until the next deadline or report."""
+        deadline = self.tracker.next_deadline()
+        wake = self.next_report if deadline is None else min(deadline, self.next_report)
+        return max(0.0, wake - time.time())
+
+    def tick(self):
+        """Checks the deadlines, writes the report when something changed or it is due."""
+        now = time.time()
+        if self.tracker.evaluate(now) or now >= self.next_report:
+            write_health(self.tracker, now)
+            self.next_report = now + REPORT_INTERVAL
+
+def write_health(tracker, now):
+    """Writes the text report and the JSON health file."""
+    health = tracker.as_dict(now)
+    local_time = get_local_time().strftime("%Y-%m-%d %H:%M:%S")
+    report_lines = [f"--- Report Timestamp: {local_time} ---"]
+    for source in health["sources"]:
+        if source["status"] == "no data":
+            report_lines.append(f"{source['name']}: No data found.")
+        elif source["status"] == "late":
+            report_lines.append(f"{source['name']}: No data for {source['age']:.0f} seconds! "
+                                f"(gaps {source['gaps']})")
+        else:
+            report_lines.append(f"{source['name']}: Latest data {source['age']:.1f} seconds ago "
+                                f"(interval {source['interval']} s, gaps {source['gaps']}).")
+    write_report(message = "\n".join(report_lines), mode = WRITE_MODE)
+
+    # Replace atomically, han-api may be reading it
+    temp_file = HEALTH_FILE + ".tmp"
+    with open(temp_file, "w") as file:
+        json.dump(health, file)
+    os.replace(temp_file, HEALTH_FILE)
+
+def open_heartbeat_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(HEARTBEAT_ADDRESS)
+    sock.setblocking(False)
+    return sock
+
+def watch_heartbeats():
+    """Heartbeat mode main loop, sleeps until a heartbeat or the next deadline."""
+    watchdog = HeartbeatWatchdog()
+    sock = open_heartbeat_socket()
+    try:
+        while True:
+            readable, _, _ = select.select([sock], [], [], watchdog.timeout())
+            if readable:
+                while True:
+                    try:
+                        watchdog.handle(sock.recv(1024))
+                    except BlockingIOError:
+                        break
+            watchdog.tick()
+    finally:
+        sock.close()
+
+async def run_async():
+    """Watchdog task for supervisor.py."""
+    if WATCHDOG_MODE != "heartbeat":
+        while True:
+            check_databases()
+            await asyncio.sleep(READ_INTERVAL)
+
+    watchdog = HeartbeatWatchdog()
+    received = asyncio.Event()
+
+    class Protocol(asyncio.DatagramProtocol):
+        def datagram_received(self, data, addr):
+            watchdog.handle(data)
+            received.set()
+
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(Protocol, local_addr=HEARTBEAT_ADDRESS)
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(received.wait(), watchdog.timeout())
+            except asyncio.TimeoutError:
+                pass
+            received.clear()
+            watchdog.tick()
+    finally:
+        transport.close()
+
 if __name__ == "__main__":
-    print("Starting database monitoring...")
+    print(f"Starting database monitoring, mode {WATCHDOG_MODE}...")
     try:
+        if WATCHDOG_MODE == "heartbeat":
+            watch_heartbeats()
         while True:
             check_databases()
             time.sleep(READ_INTERVAL)  # Checking interval